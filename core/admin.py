@@ -1,8 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.html import format_html
+from . import images
 from .models import GuestProfile
 from .models import StaffSalary, StaffAttendance
+from .models import Job
 from .models import (
     CustomUser,
     Room,
@@ -19,7 +21,7 @@ class CustomUserAdmin(UserAdmin):
     model = CustomUser
     list_display = ('username', 'email', 'role', 'is_staff')
     fieldsets = UserAdmin.fieldsets + (
-        (None, {'fields': ('role',)}),
+        (None, {'fields': ('role', 'profile_requests')}),
     )
 
 admin.site.register(CustomUser, CustomUserAdmin)
@@ -66,7 +68,10 @@ class BookingAdmin(admin.ModelAdmin):
 
     def id_proof_thumbnail(self, obj):
         if obj.id_proof:
-            return format_html('<a href="{}" target="_blank"><img src="{}" width="60" height="60" style="object-fit:cover;" /></a>', obj.id_proof.url, obj.id_proof.url)
+            return format_html(
+                '<a href="{}" target="_blank">{}</a>', obj.id_proof.url,
+                images.picture(obj.id_proof, sizes='60px', width=60, height=60, style='object-fit:cover;')
+            )
         return "-"
     id_proof_thumbnail.short_description = "ID Proof"
 
@@ -103,18 +108,23 @@ class GuestProfileAdmin(admin.ModelAdmin):
 
     def id_proof_thumbnail(self, obj):
         if obj.id_proof:
-            return f'<img src="{obj.id_proof.url}" width="60" height="60" style="object-fit:cover;" />'
+            return images.picture(obj.id_proof, sizes='60px', width=60, height=60, style='object-fit:cover;')
         return "-"
     id_proof_thumbnail.short_description = "ID Proof"
-    id_proof_thumbnail.allow_tags = True
 
     def id_proof_preview(self, obj):
         if obj.id_proof:
-            return f'<img src="{obj.id_proof.url}" width="300" />'
+            return images.picture(obj.id_proof, sizes='300px', width=300)
         return "No ID Proof Uploaded"
     id_proof_preview.short_description = "ID Proof Preview"
-    id_proof_preview.allow_tags = True
     
 admin.site.register(StaffSalary)
 admin.site.register(StaffAttendance)
-    
\ No newline at end of file
+
+
+# --- Background Jobs ---
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_after', 'created_at', 'finished_at')
+    list_filter = ('status', 'name')
+    readonly_fields = ('last_error',)
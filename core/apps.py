@@ -7,4 +7,5 @@ class CoreConfig(AppConfig):
 
 
     def ready(self):
-        import core.signals  
\ No newline at end of file
+        import core.signals
+        import core.tasks  
\ No newline at end of file
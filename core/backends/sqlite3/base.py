@@ -0,0 +1,38 @@
+"""
+Django's SQLite backend plus the two OPTIONS that Django 5.1 adds to it:
+
+- init_command: SQL run on every new connection; settings uses it for
+  the SQLite profile's PRAGMAs.
+- transaction_mode: e.g. "IMMEDIATE" to open atomic blocks with BEGIN
+  IMMEDIATE. A plain (deferred) transaction that reads and then writes
+  can't wait for the write lock: SQLite fails it with "database is
+  locked" at once, ignoring busy_timeout. Taking the lock up front makes
+  concurrent writers queue on busy_timeout instead.
+
+On Django 5.1 or later, switch ENGINE back to django.db.backends.sqlite3;
+the options mean the same there.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop('init_command', None)
+        self.transaction_mode = params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            for statement in self.init_command.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
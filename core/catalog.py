@@ -0,0 +1,136 @@
+"""
+The room catalog: every room with its images, amenities and spa services,
+and the amenity and spa service lists, for the guest-facing pages and the
+booking forms.
+
+The catalog changes a few times a week but is read by nearly every guest
+page, so it is built in one prefetching pass and kept in two places: in the
+shared cache under a version number, and in each process. A read costs one
+cache get (the version); the catalog itself is only unpickled, or rebuilt,
+when the version has moved on. Saves and deletes of rooms, amenities, spa
+services and room images bump the version (see core.signals), except saves
+of a room's day-to-day state only (OPERATIONAL_FIELDS, e.g. at check-out),
+which the catalog leaves out.
+
+The version key lives ROOM_CATALOG_VERSION_TTL. With a shared cache (Redis)
+every process sees a bump at once; with the per-process LocMemCache other
+processes only notice when their version expires, so it is kept short.
+
+Catalog objects are shared between requests and threads: never save or
+change them. Copy a room before annotating it.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+from .models import Amenity, Room, SpaService
+
+VERSION_KEY = 'room-catalog-version'
+# Room fields that follow the bookings, not the catalog: saving only these keeps the version
+OPERATIONAL_FIELDS = frozenset({'is_available', 'needs_cleaning'})
+RESULTS = ('local', 'shared', 'rebuilt')
+
+_local = (None, None)  # (version, Catalog) last used by this process
+_local_lock = threading.Lock()
+
+
+class Catalog:
+    def __init__(self, rooms, amenities, spa_services):
+        self.rooms = rooms
+        self.rooms_by_id = {room.id: room for room in rooms}
+        self.amenities = amenities
+        self.spa_services = spa_services
+
+    def rooms_in(self, ids):
+        """Catalog rooms whose id is in `ids`, in catalog order."""
+        ids = set(ids)
+        return [room for room in self.rooms if room.id in ids]
+
+    def annotated(self, room_id, **attrs):
+        """A copy of a catalog room with extra attributes, or None if it isn't in the catalog."""
+        room = self.rooms_by_id.get(room_id)
+        if room is None:
+            return None
+        room = copy.copy(room)
+        for name, value in attrs.items():
+            setattr(room, name, value)
+        return room
+
+    def room_choices(self, ids=None):
+        rooms = self.rooms if ids is None else self.rooms_in(ids)
+        # Not str(room): that shows is_available, which the catalog doesn't track
+        return [('', '---------')] + [(room.id, f"{room.room_number} - {room.room_type}") for room in rooms]
+
+    def amenity_choices(self):
+        return [(amenity.id, str(amenity)) for amenity in self.amenities]
+
+    def spa_service_choices(self):
+        return [(service.id, str(service)) for service in self.spa_services]
+
+
+def build():
+    rooms = list(Room.objects.prefetch_related('images', 'amenities', 'spa_services').order_by('id'))
+    return Catalog(rooms, list(Amenity.objects.order_by('id')), list(SpaService.objects.order_by('id')))
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock, so a version lost to eviction or a restart is never reused
+        cache.add(VERSION_KEY, time.time_ns(), settings.ROOM_CATALOG_VERSION_TTL)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get():
+    """The current catalog."""
+    global _local
+    version = _version()
+    local_version, catalog = _local
+    if local_version == version:
+        metrics.ROOM_CATALOG_LOOKUPS.inc(result='local')
+        return catalog
+
+    with _local_lock:
+        # Another thread may have loaded this version meanwhile
+        local_version, catalog = _local
+        if local_version == version:
+            result = 'local'
+        else:
+            key = f'room-catalog:{version}'
+            catalog = cache.get(key)
+            if catalog is not None:
+                result = 'shared'
+            else:
+                catalog = build()
+                cache.set(key, catalog, settings.ROOM_CATALOG_TTL)
+                result = 'rebuilt'
+            _local = (version, catalog)
+    metrics.ROOM_CATALOG_LOOKUPS.inc(result=result)
+    return catalog
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        pass  # No version yet; the next read starts one
+
+
+def stats():
+    """Lookups by result, summed over every process, and the share served without a rebuild."""
+    totals = metrics.collect()
+    lookups = {
+        result: int(totals.get(('hotel_room_catalog_lookups_total', (('result', result),)), 0))
+        for result in RESULTS
+    }
+    total = sum(lookups.values())
+    return {
+        'lookups': lookups,
+        'total': total,
+        'hit_rate': (total - lookups['rebuilt']) / total if total else None,
+    }
@@ -1,20 +1,20 @@
-from .models import Notification
+from functools import cache
+
+from . import counters
+
+# Both badges are passed as callables: the template engine only calls them
+# (and so only touches the cache) on pages that actually render the badge.
 
 def unread_notification_count(request):
     if request.user.is_authenticated:
+        user_id = request.user.pk
         return {
-            'unread_notification_count': Notification.objects.filter(
-                user=request.user,
-                is_read=False
-            ).count()
+            'unread_notification_count': cache(lambda: counters.unread_notifications(user_id))
         }
     return {}
 
 
-from .models import ContactMessage
-
 def unread_contact_messages(request):
     if request.user.is_authenticated and request.user.role in ['receptionist', 'manager']:
-        count = ContactMessage.objects.filter(is_read=False).count()
-        return {'unread_contact_count': count}
-    return {'unread_contact_count': 0}
\ No newline at end of file
+        return {'unread_contact_count': cache(counters.unread_contact_messages)}
+    return {'unread_contact_count': 0}
@@ -0,0 +1,62 @@
+"""
+Unread counters for the navbar badges, kept in the cache.
+
+Counts are computed once from the database, then adjusted in place as
+notifications and contact messages arrive (see core.signals and
+utils.notify_roles) and dropped, to be recounted, when they are marked
+read. UNREAD_COUNT_TTL bounds how stale a count can get if a write path is missed, e.g. with a
+per-process cache on several workers.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import ContactMessage, Notification
+
+CONTACT_KEY = 'unread-contact-messages'
+
+
+def notification_key(user_id):
+    return f'unread-notifications:{user_id}'
+
+
+def unread_notifications(user_id):
+    key = notification_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.set(key, count, settings.UNREAD_COUNT_TTL)
+    return count
+
+
+def unread_contact_messages():
+    count = cache.get(CONTACT_KEY)
+    if count is None:
+        count = ContactMessage.objects.filter(is_read=False).count()
+        cache.set(CONTACT_KEY, count, settings.UNREAD_COUNT_TTL)
+    return count
+
+
+def _incr(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass  # Not cached yet; the next read counts from the database
+
+
+def notifications_added(user_ids):
+    for user_id in user_ids:
+        _incr(notification_key(user_id), 1)
+
+
+def notifications_read(user_id):
+    # Dropped rather than set to 0: a notification committed meanwhile would be lost
+    # or overwritten. The next read recounts.
+    cache.delete(notification_key(user_id))
+
+
+def contact_message_added():
+    _incr(CONTACT_KEY, 1)
+
+
+def contact_messages_read():
+    cache.delete(CONTACT_KEY)
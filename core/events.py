@@ -0,0 +1,90 @@
+"""
+In-process pub/sub for live notifications.
+
+Server-Sent Event streams (views.notification_stream) subscribe per user
+and sleep on an asyncio queue. Creating a Notification publishes a
+wake-up for its recipient from whatever thread the ORM write ran in.
+The stream then reads the new rows from the database, so the bus carries
+no data and a missed wake-up only delays delivery until the stream's next
+poll. The poll also covers notifications written by other processes.
+"""
+import asyncio
+import threading
+from collections import defaultdict
+
+from asgiref.sync import SyncToAsync, ThreadSensitiveContext
+
+_subscribers = defaultdict(set)
+_lock = threading.Lock()
+
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=1)  # One pending wake-up is as good as many
+
+    def wake(self):
+        if self.queue.empty():
+            self.queue.put_nowait(True)
+
+    async def wait(self, timeout):
+        """True if woken by a publish, False if `timeout` seconds passed first."""
+        try:
+            await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+def subscribe(user_id):
+    subscription = Subscription(user_id)
+    with _lock:
+        _subscribers[user_id].add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription):
+    with _lock:
+        subscribers = _subscribers.get(subscription.user_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del _subscribers[subscription.user_id]
+
+
+def publish(user_ids):
+    """Wake every open stream of the given users. Safe to call from any thread."""
+    with _lock:
+        targets = [s for user_id in user_ids for s in _subscribers.get(user_id, ())]
+    for subscription in targets:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.wake)
+        except RuntimeError:
+            pass  # Event loop already closed; the stream is gone
+
+
+def subscriber_count():
+    with _lock:
+        return sum(len(s) for s in _subscribers.values())
+
+
+def share_stream_thread(application, path):
+    """
+    Wrap the ASGI `application` so that long-lived requests to `path` share one thread.
+
+    Django gives every ASGI request its own ThreadSensitiveContext, i.e. a
+    private thread for the sync middleware and ORM calls, held until the
+    response ends. For an idle stream that is a parked thread and a database
+    connection per browser tab. Pre-setting one shared context makes Django
+    reuse it, so all streams queue their short sync work on a single thread.
+    """
+    shared = ThreadSensitiveContext()
+
+    async def wrapped(scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == path:
+            # A context variable, so this only affects the task serving this request
+            SyncToAsync.thread_sensitive_context.set(shared)
+        await application(scope, receive, send)
+
+    return wrapped
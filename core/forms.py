@@ -9,6 +9,17 @@ from .models import Feedback
 from django.contrib.auth import get_user_model
 from .models import StaffSalary, StaffAttendance 
 from .models import ContactMessage
+from .utils import rooms_available_between
+from . import catalog
+
+
+def use_catalog_choices(form, room_ids=None):
+    """Render the room select and amenity/spa checkboxes from the room catalog, not a query each."""
+    rooms_catalog = catalog.get()
+    form.fields['room'].choices = rooms_catalog.room_choices(room_ids)
+    form.fields['amenities'].choices = rooms_catalog.amenity_choices()
+    form.fields['spa_services'].choices = rooms_catalog.spa_service_choices()
+
 
 class CustomUserCreationForm(UserCreationForm):
     class Meta:
@@ -50,6 +61,7 @@ class BookingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         request = kwargs.pop('request', None)
         super().__init__(*args, **kwargs)
+        room_ids = None  # Every room
 
         
         for field_name, field in self.fields.items():
@@ -69,6 +81,19 @@ class BookingForm(forms.ModelForm):
             if check_out:
                 self.fields['check_out'].initial = check_out
 
+            #  Only offer rooms that are free for the requested stay
+            if request.method == 'GET' and check_in and check_out:
+                try:
+                    check_in_date = date.fromisoformat(check_in)
+                    check_out_date = date.fromisoformat(check_out)
+                except ValueError:
+                    check_in_date = check_out_date = None
+                if check_in_date and check_out_date and check_in_date < check_out_date:
+                    self.fields['room'].queryset = rooms_available_between(check_in_date, check_out_date)
+                    room_ids = self.fields['room'].queryset.values_list('id', flat=True)
+
+        use_catalog_choices(self, room_ids)
+
     def clean(self):
         cleaned_data = super().clean()
         check_in = cleaned_data.get('check_in')
@@ -107,6 +132,10 @@ class ReceptionistBookingForm(forms.ModelForm):
             'check_out': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        use_catalog_choices(self)
+
     def clean(self):
         cleaned_data = super().clean()
         check_in = cleaned_data.get('check_in')
@@ -0,0 +1,195 @@
+"""
+Thumbnail and medium renditions of uploaded photos: room images and guest
+ID proofs.
+
+Each rendition is stored in WebP and in JPEG (for browsers without WebP),
+scaled to a fixed width and never upscaled, under
+MEDIA_ROOT/renditions/<original name>/. Pages reference them through
+`srcset` (the `picture` tag in core.templatetags.renditions) and fall back
+to the original file until they exist.
+
+Saving a new upload queues a `make_image_renditions` job (see core.signals
+and core.tasks); `manage.py backfill_renditions` renders existing media on
+every core. Decoding untrusted uploads runs in a process pool
+(IMAGE_RENDER_WORKERS) with a timeout, so a decompression bomb or a codec
+crash costs a pool worker rather than the job runner.
+
+This module is imported by the pool workers: keep model imports out of it.
+"""
+import atexit
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.forms.utils import flatatt
+from django.utils.html import format_html
+from PIL import Image, ImageOps
+
+ROOT = 'renditions'
+RENDITIONS = {'thumb': 320, 'medium': 800}  # name -> width in pixels
+FORMATS = {
+    'webp': ('WEBP', {'quality': 75, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 80, 'optimize': True, 'progressive': True}),
+}
+# Image fields that get renditions, by model label
+IMAGE_FIELDS = {
+    'core.Room': ['image'],
+    'core.RoomImage': ['image'],
+    'core.Booking': ['id_proof'],
+    'core.GuestProfile': ['id_proof'],
+}
+
+_ORIENTATION = 0x0112
+_ready = set()  # Source names whose renditions are known to exist
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class RenditionError(Exception):
+    """An image could not be decoded or rendered."""
+
+
+def rendition_name(name, rendition, extension):
+    return f'{ROOT}/{name}/{rendition}.{extension}'
+
+
+def render(data):
+    """Every rendition of an image: {(rendition, extension): bytes}. Runs in a pool worker."""
+    widest = max(RENDITIONS.values())
+    try:
+        with Image.open(BytesIO(data)) as image:
+            # JPEGs decode straight at 1/2, 1/4 or 1/8 scale when that is still wide enough
+            width, height = image.size
+            if image.getexif().get(_ORIENTATION, 1) >= 5:  # Rotated a quarter turn on display
+                width, height = height, width
+            if width > widest:
+                image.draft('RGB', (widest * image.width // width, widest * image.height // width))
+            image = ImageOps.exif_transpose(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        raise RenditionError(str(exc)) from exc
+
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    results = {}
+    for rendition, width in RENDITIONS.items():
+        scaled = image
+        if image.width > width:
+            scaled = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        for extension, (fmt, options) in FORMATS.items():
+            frame = scaled
+            if fmt == 'JPEG' and frame.mode == 'RGBA':
+                frame = Image.new('RGB', frame.size, 'white')
+                frame.paste(scaled, mask=scaled.getchannel('A'))
+            output = BytesIO()
+            frame.save(output, fmt, **options)
+            results[(rendition, extension)] = output.getvalue()
+    return results
+
+
+def render_pool(workers=None):
+    """A process pool for renditions. Spawned, not forked, so threads in the parent are safe."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = render_pool(settings.IMAGE_RENDER_WORKERS)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop a pool whose worker hung or died; the next render starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def render_pooled(data):
+    """render() in the shared pool, honouring IMAGE_RENDER_TIMEOUT. With IMAGE_RENDER_WORKERS = 0 it renders inline."""
+    if not settings.IMAGE_RENDER_WORKERS:
+        return render(data)
+
+    pool = _get_pool()
+    try:
+        return pool.submit(render, data).result(timeout=settings.IMAGE_RENDER_TIMEOUT)
+    except concurrent.futures.TimeoutError as exc:
+        _discard_pool(pool)
+        raise RenditionError(f"Rendering timed out after {settings.IMAGE_RENDER_TIMEOUT}s") from exc
+    except concurrent.futures.process.BrokenProcessPool as exc:
+        _discard_pool(pool)
+        raise RenditionError("Rendition worker died") from exc
+
+
+def read(name, storage=default_storage):
+    with storage.open(name, 'rb') as source:
+        return source.read()
+
+
+def store(name, renditions):
+    """Save render() output for the source file `name`. Returns the bytes written."""
+    written = 0
+    # medium.jpg goes last: has_renditions() takes it as the sign the set is complete
+    for (rendition, extension), content in sorted(renditions.items(), key=lambda item: item[0] == ('medium', 'jpg')):
+        target = rendition_name(name, rendition, extension)
+        if default_storage.exists(target):
+            default_storage.delete(target)
+        default_storage.save(target, ContentFile(content))
+        written += len(content)
+    _ready.add(name)
+    return written
+
+
+def make_renditions(name, storage=default_storage):
+    """Render and save every rendition of a stored image."""
+    return store(name, render_pooled(read(name, storage)))
+
+
+def has_renditions(name):
+    if name in _ready:
+        return True
+    if default_storage.exists(rendition_name(name, 'medium', 'jpg')):
+        _ready.add(name)
+        return True
+    return False
+
+
+def srcset(name, extension):
+    return ', '.join(
+        f'{default_storage.url(rendition_name(name, rendition, extension))} {width}w'
+        for rendition, width in RENDITIONS.items()
+    )
+
+
+def picture(image, sizes='100vw', alt='', **attrs):
+    """
+    HTML for an ImageField value: a <picture> offering the WebP and JPEG
+    renditions for the browser to pick from by `sizes`, or a plain <img> of
+    the original until they exist. `attrs` go on the <img>.
+    """
+    if not image:
+        return ''
+    if not has_renditions(image.name):
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"{}></picture>',
+        srcset(image.name, 'webp'), sizes,
+        default_storage.url(rendition_name(image.name, 'medium', 'jpg')), srcset(image.name, 'jpg'), sizes,
+        alt, flatatt(attrs),
+    )
@@ -0,0 +1,228 @@
+"""
+Invoice PDFs, rendered once and cached on disk.
+
+Each PDF is stored under MEDIA_ROOT/invoice_cache/ named after a hash of
+everything the invoice template shows plus INVOICE_TEMPLATE_VERSION, so a
+changed bill or template simply produces a new file. Downloads are served
+with FileResponse plus ETag/Last-Modified, and conditional GETs get a 304.
+A file's mtime is when it was rendered, and is its Last-Modified; its atime,
+set on every hit, is when it was last used, for LRU eviction.
+
+xhtml2pdf is pure-Python and holds the GIL, so renders run in a small
+process pool (PDF_RENDER_WORKERS) with a per-render timeout and a cap on
+renders in flight; callers get InvoiceRenderBusy instead of queueing
+without bound.
+"""
+import atexit
+import concurrent.futures
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from xhtml2pdf import pisa
+
+from . import metrics
+from .profiling import timed
+
+INVOICE_TEMPLATE = 'core/invoice_pdf.html'
+# Bump whenever core/invoice_pdf.html changes so cached PDFs are re-rendered
+INVOICE_TEMPLATE_VERSION = 1
+
+
+class InvoiceRenderError(Exception):
+    """xhtml2pdf could not render the invoice."""
+
+
+class InvoiceRenderBusy(InvoiceRenderError):
+    """Too many renders already in flight; try again shortly."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_flight = None
+
+
+def cache_dir():
+    return Path(settings.MEDIA_ROOT) / 'invoice_cache'
+
+
+def invoice_cache_key(booking, breakdown):
+    payload = {
+        'template': INVOICE_TEMPLATE_VERSION,
+        'booking': booking.id,
+        'payment_id': booking.razorpay_payment_id,
+        'username': booking.user.username,
+        'payment_time': booking.payment_time.isoformat() if booking.payment_time else None,
+        'bill': {key: str(value) for key, value in breakdown.items()},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def render_invoice_html(booking, breakdown):
+    return render_to_string(INVOICE_TEMPLATE, {'booking': booking, 'breakdown': breakdown})
+
+
+@timed('pdf_render')
+@metrics.PDF_RENDER_SECONDS.time()
+def render_pdf(html):
+    """Render HTML to PDF bytes in the current process."""
+    pdf_file = BytesIO()
+    status = pisa.CreatePDF(html, dest=pdf_file)
+    if status.err:
+        raise InvoiceRenderError(f"xhtml2pdf reported {status.err} error(s)")
+    return pdf_file.getvalue()
+
+
+def render_pool(workers=None):
+    """A process pool for PDF renders. Spawned, not forked, so threads in the parent are safe."""
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context('spawn')
+    )
+
+
+def _get_pool():
+    global _pool, _in_flight
+    with _pool_lock:
+        if _pool is None:
+            _pool = render_pool(settings.PDF_RENDER_WORKERS)
+            _in_flight = threading.BoundedSemaphore(settings.PDF_RENDER_QUEUE_DEPTH)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool, _in_flight
+
+
+def _discard_pool(pool):
+    """Drop a pool whose worker hung or died; the next render starts a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    # A hung pisa render can't be cancelled, so its worker has to be terminated
+    for process in list(getattr(pool, '_processes', {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+@timed('pdf_render')
+def render_pdf_pooled(html):
+    """
+    Render in the shared process pool, honouring PDF_RENDER_TIMEOUT and
+    PDF_RENDER_QUEUE_DEPTH. With PDF_RENDER_WORKERS = 0 it renders inline.
+    """
+    if not settings.PDF_RENDER_WORKERS:
+        return render_pdf(html)
+
+    pool, in_flight = _get_pool()
+    if not in_flight.acquire(blocking=False):
+        raise InvoiceRenderBusy("PDF render queue is full")
+
+    try:
+        future = pool.submit(render_pdf, html)
+        return future.result(timeout=settings.PDF_RENDER_TIMEOUT)
+    except concurrent.futures.TimeoutError as exc:
+        _discard_pool(pool)
+        raise InvoiceRenderError(f"PDF render timed out after {settings.PDF_RENDER_TIMEOUT}s") from exc
+    except concurrent.futures.process.BrokenProcessPool as exc:
+        _discard_pool(pool)
+        raise InvoiceRenderError("PDF render worker died") from exc
+    finally:
+        in_flight.release()
+
+
+def invoice_pdf_path(booking, breakdown):
+    """Path of the cached PDF for this bill, rendering it on a miss."""
+    key = invoice_cache_key(booking, breakdown)
+    path = cache_dir() / f"{key}.pdf"
+
+    try:
+        # Recently used files survive eviction. Only the atime moves: the mtime is the Last-Modified validator
+        os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+        return path
+    except FileNotFoundError:
+        pass
+
+    pdf = render_pdf_pooled(render_invoice_html(booking, breakdown))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write-then-rename so concurrent requests never serve a half-written file
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as out:
+        out.write(pdf)
+    os.replace(tmp, path)
+    return path
+
+
+def invoice_pdf_bytes(booking, breakdown):
+    return invoice_pdf_path(booking, breakdown).read_bytes()
+
+
+def invoice_pdf_response(request, booking, breakdown):
+    """Download response for the invoice, or 304 if the client's copy is current."""
+    path = invoice_pdf_path(booking, breakdown)
+    etag = f'"{path.stem}"'
+    last_modified = int(path.stat().st_mtime)
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = FileResponse(
+        path.open('rb'),
+        as_attachment=True,
+        filename=f"Invoice_{booking.id}.pdf",
+        content_type='application/pdf'
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def prune_invoice_cache(max_bytes=None, max_age=None):
+    """
+    Delete cached PDFs unused for `max_age` seconds, then the least recently
+    used ones until the cache fits in `max_bytes`. Returns (files, bytes) removed.
+    """
+    if max_bytes is None:
+        max_bytes = settings.INVOICE_CACHE_MAX_BYTES
+    if max_age is None:
+        max_age = settings.INVOICE_CACHE_MAX_AGE
+
+    directory = cache_dir()
+    if not directory.exists():
+        return 0, 0
+
+    entries = []
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((max(stat.st_atime, stat.st_mtime), stat.st_size, entry.path))
+    entries.sort()  # Least recently used first
+
+    cutoff = time.time() - max_age
+    total = sum(size for _, size, _ in entries)
+    removed_files = removed_bytes = 0
+
+    for used, size, path in entries:
+        if used >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        total -= size
+        removed_files += 1
+        removed_bytes += size
+
+    return removed_files, removed_bytes
@@ -0,0 +1,141 @@
+"""
+Database-backed job queue.
+
+Work that must not hold up a request (PDF rendering, email, notification
+fan-out) is recorded as a Job row with `enqueue()` and executed by the
+`manage.py run_jobs` worker. Failed jobs are retried with exponential
+backoff up to max_attempts. A worker refreshes the lock of the jobs it is
+running (heartbeat()) and, periodically, puts back jobs whose lock is older
+than JOB_LOCK_TIMEOUT, i.e. whose worker crashed (requeue_stale()).
+
+A job can still run twice (a worker stalled past JOB_LOCK_TIMEOUT, or one
+that died after its handler finished), so handlers must be idempotent.
+
+Handlers are plain functions registered with the @job decorator and
+receive the enqueued payload as keyword arguments.
+"""
+import logging
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+_running = set()  # Ids of the jobs this process is running
+_running_lock = threading.Lock()
+
+
+def job(name):
+    """Register a function as the handler for jobs called `name`."""
+    def register(func):
+        _handlers[name] = func
+        return func
+    return register
+
+
+def enqueue(name, delay=0, **payload):
+    """Queue a job. The payload must be JSON-serialisable (pass ids, not model instances)."""
+    if name not in _handlers:
+        raise KeyError(f"No job handler registered for '{name}'")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+        run_after=timezone.now() + timedelta(seconds=delay)
+    )
+
+
+def requeue_stale():
+    """Put jobs whose worker died mid-run back in the queue."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(status='queued', locked_at=None)
+
+
+def heartbeat():
+    """Refresh the locks of the jobs this process is running, so requeue_stale() leaves them alone."""
+    with _running_lock:
+        ids = list(_running)
+    if not ids:
+        return 0
+    return Job.objects.filter(id__in=ids, status='running').update(locked_at=timezone.now())
+
+
+def claim_next():
+    """
+    Atomically take the next due job, or return None.
+
+    The conditional UPDATE only succeeds for one worker per job, which works
+    the same on SQLite and PostgreSQL without row locks.
+    """
+    while True:
+        candidate = Job.objects.filter(
+            status='queued',
+            run_after__lte=timezone.now()
+        ).order_by('run_after', 'id').values_list('id', flat=True).first()
+        if candidate is None:
+            return None
+
+        claimed = Job.objects.filter(id=candidate, status='queued').update(
+            status='running',
+            locked_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return Job.objects.get(id=candidate)
+
+
+def backoff(attempts):
+    return min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1), settings.JOB_RETRY_BACKOFF_MAX)
+
+
+def run(job_obj):
+    """Execute a claimed job and record the outcome."""
+    handler = _handlers.get(job_obj.name)
+    with _running_lock:
+        _running.add(job_obj.id)
+    try:
+        if handler is None:
+            raise KeyError(f"No job handler registered for '{job_obj.name}'")
+        handler(**job_obj.payload)
+    except Exception:
+        error = traceback.format_exc()
+        if job_obj.attempts >= job_obj.max_attempts:
+            logger.error("Job %s failed permanently:\n%s", job_obj, error)
+            Job.objects.filter(id=job_obj.id).update(
+                status='failed', locked_at=None, last_error=error, finished_at=timezone.now()
+            )
+        else:
+            delay = backoff(job_obj.attempts)
+            logger.warning("Job %s failed, retrying in %ss:\n%s", job_obj, delay, error)
+            Job.objects.filter(id=job_obj.id).update(
+                status='queued',
+                locked_at=None,
+                last_error=error,
+                run_after=timezone.now() + timedelta(seconds=delay)
+            )
+        return False
+    finally:
+        with _running_lock:
+            _running.discard(job_obj.id)
+
+    Job.objects.filter(id=job_obj.id).update(status='done', locked_at=None, finished_at=timezone.now())
+    return True
+
+
+def run_pending(limit=None):
+    """Run due jobs until the queue is empty (or `limit` jobs ran). Returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job_obj = claim_next()
+        if job_obj is None:
+            break
+        run(job_obj)
+        count += 1
+    return count
@@ -0,0 +1,84 @@
+import concurrent.futures
+import os
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from core import images
+
+
+class Command(BaseCommand):
+    help = "Render thumbnails and medium renditions of every stored room photo and ID proof, using all CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Render processes (default: all cores).")
+        parser.add_argument('--force', action='store_true', help="Render images that already have renditions again.")
+
+    def handle(self, *args, **options):
+        sources = {}  # name -> storage
+        for label, fields in images.IMAGE_FIELDS.items():
+            model = apps.get_model(label)
+            for field in fields:
+                storage = model._meta.get_field(field).storage
+                names = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                for name in names.values_list(field, flat=True).distinct().iterator():
+                    sources.setdefault(name, storage)
+
+        pending = [
+            (name, storage) for name, storage in sorted(sources.items())
+            if options['force'] or not images.has_renditions(name)
+        ]
+        self.stdout.write(f"{len(sources)} image(s), {len(pending)} to render on {options['workers']} worker(s)")
+        if not pending:
+            return
+
+        started = time.perf_counter()
+        original_bytes = 0
+        rendition_bytes = Counter()
+        rendered = failed = missing = 0
+        # Read files only as workers free up, so memory holds a few images rather than all of them
+        queue = iter(pending)
+        with images.render_pool(options['workers']) as pool:
+            in_flight = {}
+            while True:
+                while len(in_flight) < options['workers'] * 2:
+                    name, storage = next(queue, (None, None))
+                    if name is None:
+                        break
+                    try:
+                        data = images.read(name, storage)
+                    except FileNotFoundError:
+                        missing += 1
+                        self.stderr.write(f"{name}: file is missing")
+                        continue
+                    in_flight[pool.submit(images.render, data)] = (name, len(data))
+                if not in_flight:
+                    break
+
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    name, size = in_flight.pop(future)
+                    try:
+                        renditions = future.result()
+                    except images.RenditionError as exc:
+                        failed += 1
+                        self.stderr.write(f"{name}: {exc}")
+                        continue
+                    images.store(name, renditions)
+                    rendered += 1
+                    original_bytes += size
+                    for key, content in renditions.items():
+                        rendition_bytes[key] += len(content)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} image(s) in {elapsed:.1f}s; {failed} failed, {missing} missing."
+        ))
+        if rendered:
+            self.stdout.write(f"{'originals':>12} {original_bytes / 1024:10.1f} KiB")
+            for (rendition, extension), size in sorted(rendition_bytes.items()):
+                self.stdout.write(
+                    f"{rendition + '.' + extension:>12} {size / 1024:10.1f} KiB  ({original_bytes / size:.1f}x smaller)"
+                )
@@ -0,0 +1,70 @@
+import random
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from core.models import Booking, Maintenance, Room
+from core.utils import find_flexible_stays, rooms_available_between
+
+
+def legacy_available_rooms(check_in, check_out):
+    """The overlap scan available_rooms used before the RoomNight index."""
+    booked = Booking.objects.filter(
+        check_in__lt=check_out,
+        check_out__gt=check_in,
+        status__in=Booking.ACTIVE_STATUSES
+    ).values_list('room_id', flat=True)
+
+    maintenance = Maintenance.objects.filter(
+        scheduled_date__gte=date.today(),
+        is_completed=False
+    ).values_list('room_id', flat=True)
+
+    return Room.objects.exclude(id__in=booked).exclude(id__in=maintenance)
+
+
+class Command(BaseCommand):
+    help = "Time availability searches: legacy overlap scan vs RoomNight lookup vs flexible-date bitmaps."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=200, help="Random searches per strategy.")
+        parser.add_argument('--horizon', type=int, default=365, help="Days ahead to pick check-in dates from.")
+        parser.add_argument('--max-nights', type=int, default=7)
+        parser.add_argument('--window', type=int, default=30, help="Flexible search window in days.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        today = date.today()
+
+        searches = []
+        for _ in range(options['searches']):
+            check_in = today + timedelta(days=rng.randrange(options['horizon']))
+            nights = rng.randint(1, options['max_nights'])
+            searches.append((check_in, check_in + timedelta(days=nights), nights))
+
+        self.stdout.write(
+            f"{Room.objects.count()} rooms, {Booking.objects.count()} bookings, "
+            f"{len(searches)} searches per strategy"
+        )
+
+        self._time("legacy overlap scan", lambda s: list(legacy_available_rooms(s[0], s[1])), searches)
+        self._time("RoomNight lookup", lambda s: list(rooms_available_between(s[0], s[1])), searches)
+        self._time(
+            f"flexible {options['window']}-day window",
+            lambda s: find_flexible_stays(s[2], s[0], s[0] + timedelta(days=options['window'])),
+            searches
+        )
+
+    def _time(self, label, search, searches):
+        timings = []
+        for s in searches:
+            started = time.perf_counter()
+            search(s)
+            timings.append((time.perf_counter() - started) * 1000)
+
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(f"{label:<28} p50 {p50:8.2f} ms   p99 {p99:8.2f} ms")
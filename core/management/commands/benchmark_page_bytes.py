@@ -0,0 +1,181 @@
+import gzip
+import re
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core.staticfiles import brotli
+
+CSS_URL = re.compile(r'''url\(\s*['"]?([^'")]+?)['"]?\s*\)''')
+ACCEPT_ENCODING = 'br, gzip' if brotli is not None else 'gzip'
+
+
+def widest(srcset):
+    candidates = []
+    for candidate in srcset.split(','):
+        url, _, width = candidate.strip().partition(' ')
+        candidates.append((int(width.strip().rstrip('w') or 0), url))
+    return max(candidates)[1]
+
+
+class AssetParser(HTMLParser):
+    """
+    Subresources of a page: stylesheets, scripts, images and url()s in inline
+    CSS. For srcset the widest candidate is taken, and inside <picture> the
+    WebP source, so image bytes are an upper bound.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+        self._picture = None  # None outside <picture>; then the chosen URL, if any
+        self._style = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if attrs.get('style'):
+            self.urls += CSS_URL.findall(attrs['style'])
+        if tag == 'link' and {'stylesheet', 'icon'} & set((attrs.get('rel') or '').lower().split()):
+            self.urls.append(attrs['href'])
+        elif tag == 'script' and attrs.get('src'):
+            self.urls.append(attrs['src'])
+        elif tag == 'picture':
+            self._picture = ''
+        elif tag == 'source' and self._picture == '' and attrs.get('type') == 'image/webp':
+            self._picture = widest(attrs['srcset'])
+            self.urls.append(self._picture)
+        elif tag == 'img' and not self._picture:
+            self.urls.append(widest(attrs['srcset']) if attrs.get('srcset') else attrs['src'])
+        elif tag == 'style':
+            self._style = True
+
+    def handle_endtag(self, tag):
+        if tag == 'picture':
+            self._picture = None
+        elif tag == 'style':
+            self._style = False
+
+    def handle_data(self, data):
+        if self._style:
+            self.urls += CSS_URL.findall(data)
+
+
+def fresh(response):
+    """Whether a browser reuses the response on a repeat visit without asking the server."""
+    directives = [directive.strip() for directive in response.get('Cache-Control', '').split(',')]
+    if 'no-cache' in directives or 'no-store' in directives:
+        return False
+    return any(directive.startswith('max-age=') and int(directive[8:]) > 0 for directive in directives)
+
+
+def decoded(response, body):
+    encoding = response.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        return brotli.decompress(body)
+    return body
+
+
+class Command(BaseCommand):
+    help = (
+        "Response bytes (headers and bodies) of the guest dashboard and its same-origin assets on a first "
+        "visit and on a repeat visit with a warm browser cache. Run collectstatic first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Guest to log in as (default: the guest with the most bookings).")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(role='guest').annotate(bookings=Count('booking')).order_by('-bookings').first()
+        if user is None:
+            raise CommandError("No such guest")
+        if not staticfiles_storage.hashed_files:
+            self.stderr.write("No staticfiles manifest: static assets are linked unhashed. Run collectstatic first.")
+
+        # As in production: {% static %} links hashed names only with DEBUG off
+        with override_settings(DEBUG=False):
+            client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+            client.force_login(user)
+            page = reverse('guest_dashboard')
+            page_bytes, assets, external = self.first_visit(client, page)
+            uncompressed = sum(self.fetch(client, url, accept_encoding='identity')[2] for url in assets)
+            rows = [
+                ('first visit', 1 + len(assets), page_bytes + sum(size for _, size in assets.values())),
+                ('  without compression', 1 + len(assets), page_bytes + uncompressed),
+                ('repeat visit', *self.repeat_visit(client, page, assets, revalidate_all=False)),
+                ('  revalidating every asset', *self.repeat_visit(client, page, assets, revalidate_all=True)),
+            ]
+
+        self.stdout.write(
+            f"{page} as {user.username}: {len(assets)} same-origin asset(s); "
+            f"{len(external)} external host(s) not measured: {', '.join(sorted(external)) or 'none'}"
+        )
+        self.stdout.write(f"{'':30}{'requests':>9}{'KiB':>10}")
+        for label, requests, size in rows:
+            self.stdout.write(f"{label:30}{requests:>9}{size / 1024:>10.1f}")
+        if options['verbosity'] > 1:
+            for url, (response, size) in sorted(assets.items()):
+                self.stdout.write(
+                    f"  {size:>8} B  {response.get('Content-Encoding', 'identity'):<8}  "
+                    f"{response.get('Cache-Control', '-'):<40}  {url}"
+                )
+
+    def fetch(self, client, url, accept_encoding=ACCEPT_ENCODING, **headers):
+        """(response, body, bytes on the wire less the status line)."""
+        response = client.get(url, headers={'accept-encoding': accept_encoding, **headers})
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        response.close()
+        return response, body, len(body) + sum(len(name) + len(value) + 4 for name, value in response.items())
+
+    def first_visit(self, client, page):
+        """(page bytes, {asset URL: (response, bytes)}, external hosts)."""
+        response, body, page_bytes = self.fetch(client, page)
+        if response.status_code != 200:
+            raise CommandError(f"{page} answered {response.status_code}")
+        parser = AssetParser()
+        parser.feed(body.decode())
+
+        assets, external = {}, set()
+        pending = [urljoin(page, url) for url in parser.urls]
+        while pending:
+            parts = urlsplit(pending.pop(0))
+            if parts.netloc and parts.netloc != settings.ALLOWED_HOSTS[0]:
+                external.add(parts.netloc)
+                continue
+            url = parts.path + (f'?{parts.query}' if parts.query else '')
+            if url in assets:
+                continue
+            response, body, size = self.fetch(client, url)
+            if response.status_code != 200:
+                raise CommandError(f"{url} answered {response.status_code}")
+            assets[url] = (response, size)
+            if response['Content-Type'].startswith('text/css'):
+                pending += [urljoin(url, ref) for ref in CSS_URL.findall(decoded(response, body).decode())]
+        return page_bytes, assets, external
+
+    def repeat_visit(self, client, page, assets, revalidate_all):
+        """(requests, bytes) of a second visit; fresh assets come from the browser cache unless `revalidate_all`."""
+        requests, total = 1, self.fetch(client, page)[2]
+        for url, (first, _) in assets.items():
+            if fresh(first) and not revalidate_all:
+                continue
+            validators = {}
+            if first.has_header('ETag'):
+                validators['if_none_match'] = first['ETag']
+            if first.has_header('Last-Modified'):
+                validators['if_modified_since'] = first['Last-Modified']
+            requests += 1
+            total += self.fetch(client, url, **validators)[2]
+        return requests, total
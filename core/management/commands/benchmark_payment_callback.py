@@ -0,0 +1,133 @@
+import contextlib
+import hashlib
+import hmac
+import shutil
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from core import jobs
+from core.models import Booking, Room
+
+User = get_user_model()
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Accepts any message and discards it, after `latency` seconds per command, like a slow relay."""
+    latency = 0.0
+
+    def reply(self, line):
+        time.sleep(self.latency)
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        self.reply('220 smtp-stub ready')
+        for raw in self.rfile:
+            command = raw.decode('ascii', 'replace').strip().upper()
+            if command.startswith('EHLO'):
+                self.wfile.write(b'250-smtp-stub\r\n')
+                self.reply('250 8BITMIME')
+            elif command == 'DATA':
+                self.reply('354 end with <CRLF>.<CRLF>')
+                for line in self.rfile:
+                    if line in (b'.\r\n', b'.\n'):
+                        break
+                self.reply('250 queued')
+            elif command == 'QUIT':
+                self.reply('221 bye')
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.reply('250 ok')
+
+
+def percentile(timings, fraction):
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "p50/p99 of the Razorpay payment_success callback with the confirmation work run inline in the "
+        "request (as before the job queue) and enqueued for run_jobs, against a local SMTP stub. "
+        "Everything it creates is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=30, help="Callbacks per mode.")
+        parser.add_argument('--smtp-latency', type=float, default=0.05, help="Seconds the stub waits per SMTP reply.")
+
+    def handle(self, *args, **options):
+        guest = User.objects.filter(role='guest').exclude(email='').first()
+        room = Room.objects.order_by('id').first()
+        if guest is None or room is None:
+            raise CommandError("Needs a guest with an email address and a room; run seed_hotel first.")
+
+        SMTPStubHandler.latency = options['smtp_latency']
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStubHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        media_root = tempfile.mkdtemp()  # Rendered invoices go here, not into MEDIA_ROOT
+        smtp = override_settings(
+            EMAIL_BACKEND='django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST='127.0.0.1', EMAIL_PORT=server.server_address[1],
+            EMAIL_USE_TLS=False, EMAIL_HOST_USER='', EMAIL_HOST_PASSWORD='',
+            MEDIA_ROOT=media_root,
+        )
+
+        def inline(name, delay=0, **payload):
+            jobs._handlers[name](**payload)
+
+        try:
+            with smtp:
+                rows = [
+                    ('inline (before)', self.measure(guest, room, options['requests'], inline)),
+                    ('enqueued (after)', self.measure(guest, room, options['requests'], None)),
+                ]
+        finally:
+            server.shutdown()
+            server.server_close()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.stdout.write(f"{options['requests']} callbacks per mode, SMTP stub latency {options['smtp_latency']}s per reply")
+        for label, timings in rows:
+            self.stdout.write(f"{label:<18} p50 {percentile(timings, 0.50):8.1f} ms   p99 {percentile(timings, 0.99):8.1f} ms")
+
+    def measure(self, guest, room, count, enqueue):
+        """Sorted callback latencies in ms. The bookings, jobs and notifications are rolled back."""
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        timings = []
+        with transaction.atomic():
+            # Far in the future, so the stays can't clash with real bookings
+            start = date.today() + timedelta(days=3650)
+            for i in range(count + 1):  # The first warms up the PDF render pool and is discarded
+                check_in = start + timedelta(days=2 * i)
+                order_id = f'order_{uuid.uuid4().hex[:14]}'
+                payment_id = f'pay_{uuid.uuid4().hex[:14]}'
+                Booking.objects.create(
+                    user=guest, room=room, check_in=check_in, check_out=check_in + timedelta(days=1), payment_id=order_id
+                )
+                signature = hmac.new(
+                    settings.RAZORPAY_KEY_SECRET.encode(), f'{order_id}|{payment_id}'.encode(), hashlib.sha256
+                ).hexdigest()
+                with mock.patch.object(jobs, 'enqueue', enqueue) if enqueue else contextlib.nullcontext():
+                    started = time.perf_counter()
+                    response = client.post(reverse('payment_success'), {
+                        'razorpay_order_id': order_id, 'razorpay_payment_id': payment_id, 'razorpay_signature': signature,
+                    })
+                    elapsed = (time.perf_counter() - started) * 1000
+                if response.status_code != 302:
+                    raise CommandError(f"payment_success answered {response.status_code}")
+                if i:
+                    timings.append(elapsed)
+            transaction.set_rollback(True)
+        return sorted(timings)
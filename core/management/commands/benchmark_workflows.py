@@ -0,0 +1,518 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import hashlib
+import hmac
+import io
+import json
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import override_settings
+from django.test.client import AsyncRequestFactory, RequestFactory
+from django.urls import resolve, reverse
+from PIL import Image
+
+from core import payments
+from core.management.commands.fake_razorpay import FakeRazorpayHandler
+from core.models import Booking, Job
+
+User = get_user_model()
+
+PASSWORD = 'bench-password'
+HOST = 'localhost'
+
+# Mutable [count] for the request being served; asgiref carries it into sync_to_async threads
+_request_queries = contextvars.ContextVar('benchmark_request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _instrument(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class WorkflowError(Exception):
+    pass
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers  # list of (name, value) str pairs
+        self.body = body
+
+    def header(self, name):
+        return next((v for k, v in self.headers if k.lower() == name), None)
+
+
+class Browser:
+    """Cookie jar of one simulated user, building requests with Django's request factories."""
+
+    def __init__(self, factory_class):
+        self.factory = factory_class(HTTP_HOST=HOST)
+
+    def build(self, method, path, data):
+        headers = {}
+        token = self.factory.cookies.get('csrftoken')
+        if method == 'POST' and token:
+            headers['X-CSRFToken'] = token.value
+        if method == 'GET':
+            return self.factory.get(path, headers=headers)
+        return self.factory.post(path, data or {}, headers=headers)
+
+    def absorb(self, response):
+        for name, value in response.headers:
+            if name.lower() == 'set-cookie':
+                self.factory.cookies.load(value)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.completed = 0
+        self.failed = defaultdict(int)
+
+    def record(self, endpoint, seconds, queries, ok):
+        with self.lock:
+            self.latency[endpoint].append(seconds)
+            self.queries[endpoint].append(queries)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def summary(self, wall):
+        def pct(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+        endpoints = {}
+        for endpoint, values in sorted(self.latency.items()):
+            values = sorted(values)
+            queries = self.queries[endpoint]
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'rps': round(len(values) / wall, 2),
+                'p50_ms': round(pct(values, 0.50), 2),
+                'p90_ms': round(pct(values, 0.90), 2),
+                'p99_ms': round(pct(values, 0.99), 2),
+                'max_ms': round(values[-1] * 1000, 2),
+                'queries_mean': round(sum(queries) / len(queries), 1),
+                'queries_max': max(queries),
+            }
+        total = sum(e['requests'] for e in endpoints.values())
+        return {
+            'wall_seconds': round(wall, 2),
+            'requests': total,
+            'throughput_rps': round(total / wall, 2),
+            'workflows_completed': self.completed,
+            'workflows_failed': dict(self.failed),
+            'endpoints': endpoints,
+        }
+
+
+@functools.cache
+def _id_proof_png():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 40), (200, 180, 150)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def id_proof_upload():
+    return SimpleUploadedFile('id-proof.png', _id_proof_png(), content_type='image/png')
+
+
+def login_steps(browser, username):
+    yield browser, 'GET', reverse('login'), None, 200
+    yield browser, 'POST', reverse('login'), {'username': username, 'password': PASSWORD}, 302
+
+
+def guest_stay(guest, receptionist, housekeeper, rng):
+    """Search, book, pay and fetch the invoice as a guest; then check-in, check-out and cleaning by staff."""
+    today, tomorrow = date.today(), date.today() + timedelta(days=1)
+    stay = f"check_in={today}&check_out={tomorrow}"
+
+    response = yield guest, 'GET', f"{reverse('available_rooms')}?{stay}", None, 200
+    room_ids = re.findall(rb'/bookings/add/(\d+)/\?', response.body)
+    if not room_ids:
+        raise WorkflowError('no free room')
+    room_id = int(rng.choice(room_ids))
+
+    yield guest, 'GET', f"{reverse('book_room', args=[room_id])}?{stay}", None, 200
+    response = yield guest, 'POST', reverse('booking_create'), {
+        'room': room_id, 'check_in': today, 'check_out': tomorrow, 'id_proof': id_proof_upload(),
+    }, 302
+    match = re.search(r'/booking/(\d+)/razorpay/', response.header('location') or '')
+    if not match:
+        raise WorkflowError('room taken')  # Lost the race for this room to another worker
+    booking_id = int(match.group(1))
+
+    response = yield guest, 'GET', reverse('razorpay_payment', args=[booking_id]), None, 200
+    match = re.search(rb'"order_id": "([^"]+)"', response.body)
+    if not match:
+        raise WorkflowError('no order id')
+    order_id = match.group(1).decode()
+    payment_id = f"pay_bench{uuid.uuid4().hex[:12]}"
+    signature = hmac.new(
+        settings.RAZORPAY_KEY_SECRET.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256
+    ).hexdigest()
+    yield guest, 'POST', reverse('payment_success'), {
+        'razorpay_payment_id': payment_id, 'razorpay_order_id': order_id, 'razorpay_signature': signature,
+    }, 302
+    yield guest, 'GET', reverse('invoice_view', args=[booking_id]), None, 200
+
+    yield receptionist, 'POST', reverse('booking_check_in', args=[booking_id]), {}, 302
+    yield receptionist, 'POST', reverse('booking_check_out', args=[booking_id]), {}, 302
+    yield housekeeper, 'POST', reverse('mark_cleaned', args=[booking_id]), {}, 302
+
+
+class Server:
+    """Runs workflows against one application, timing each request and counting its queries."""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def record(self, browser, method, path, started, counter, response, expect):
+        elapsed = time.perf_counter() - started
+        endpoint = resolve(path.split('?')[0]).url_name
+        self.stats.record(endpoint, elapsed, counter[0], response.status == expect)
+        browser.absorb(response)
+        if response.status != expect:
+            raise WorkflowError(f"{endpoint} returned {response.status}")
+        return response
+
+    def tally(self, error=None, workflow=True):
+        if workflow:
+            with self.stats.lock:
+                if error is None:
+                    self.stats.completed += 1
+                else:
+                    self.stats.failed[str(error)] += 1
+
+
+class WsgiServer(Server):
+    """Calls hotel_mgmt.wsgi.application directly, one OS thread per user."""
+    factory_class = RequestFactory
+
+    def __init__(self, stats):
+        super().__init__(stats)
+        from hotel_mgmt.wsgi import application
+        self.application = application
+
+    def call(self, browser, method, path, data):
+        environ = browser.build(method, path, data).environ
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = int(status.split()[0]), headers
+
+        result = self.application(environ, start_response)
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return Response(started['status'], started['headers'], body)
+
+    def request(self, browser, method, path, data, expect):
+        counter = [0]
+        token = _request_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = self.call(browser, method, path, data)
+        finally:
+            _request_queries.reset(token)
+        return self.record(browser, method, path, started, counter, response, expect)
+
+    def drive(self, steps):
+        response = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration:
+                return
+            response = self.request(*step)
+
+    def run(self, users):
+        def user(workflows):
+            try:
+                for steps, counted in workflows:
+                    try:
+                        self.drive(steps)
+                        self.tally(workflow=counted)
+                    except WorkflowError as exc:
+                        self.tally(exc, workflow=counted)
+                        if not counted:
+                            return  # Could not log in
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=user, args=(workflows,)) for workflows in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+class AsgiServer(Server):
+    """Calls hotel_mgmt.asgi.application directly, one asyncio task per user."""
+    factory_class = AsyncRequestFactory
+
+    def __init__(self, stats):
+        super().__init__(stats)
+        from hotel_mgmt.asgi import application
+        self.application = application
+
+    async def call(self, browser, method, path, data):
+        request = browser.build(method, path, data)
+        scope, body = request.scope, request.body
+        # The factory always sends "host: testserver", which ALLOWED_HOSTS rejects
+        scope['headers'] = [(k, HOST.encode() if k == b'host' else v) for k, v in scope['headers']]
+        received = False
+        start, chunks = {}, []
+
+        async def receive():
+            nonlocal received
+            if not received:
+                received = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            await asyncio.Future()  # Never disconnects; Django cancels this once the response is sent
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                start['status'] = message['status']
+                start['headers'] = [(k.decode('latin1'), v.decode('latin1')) for k, v in message['headers']]
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+
+        await self.application(scope, receive, send)
+        return Response(start['status'], start['headers'], b''.join(chunks))
+
+    async def request(self, browser, method, path, data, expect):
+        counter = [0]
+        token = _request_queries.set(counter)
+        started = time.perf_counter()
+        try:
+            response = await self.call(browser, method, path, data)
+        finally:
+            _request_queries.reset(token)
+        return self.record(browser, method, path, started, counter, response, expect)
+
+    async def drive(self, steps):
+        response = None
+        while True:
+            try:
+                step = steps.send(response)
+            except StopIteration:
+                return
+            response = await self.request(*step)
+
+    def run(self, users):
+        async def user(workflows):
+            for steps, counted in workflows:
+                try:
+                    await self.drive(steps)
+                    self.tally(workflow=counted)
+                except WorkflowError as exc:
+                    self.tally(exc, workflow=counted)
+                    if not counted:
+                        return
+
+        async def main():
+            await asyncio.gather(*(user(workflows) for workflows in users))
+
+        asyncio.run(main())
+
+
+SERVERS = {'wsgi': WsgiServer, 'asgi': AsgiServer}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the guest (search, book, pay, invoice) and staff (check-in, check-out, "
+        "mark cleaned) workflows through the real WSGI and ASGI applications against the "
+        "current database, with a local Razorpay stub. Reports throughput, latency "
+        "percentiles and queries per request for each endpoint and writes them as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--concurrency', type=int, default=4, help="Simultaneous users per server.")
+        parser.add_argument('--iterations', type=int, default=10, help="Workflows run by each user.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--gateway', help="Base URL of a running fake_razorpay (default: start one in-process).")
+        parser.add_argument('--gateway-latency', type=float, default=0.0, help="Seconds the in-process stub waits per call.")
+        parser.add_argument('--output', help="JSON file to write (default: benchmark-results/workflows-<time>-<commit>.json).")
+        parser.add_argument('--compare', help="Earlier JSON result to print deltas against.")
+        parser.add_argument(
+            '--keep', action='store_true',
+            help="Keep the bookings the benchmark created, and their ID proofs in MEDIA_ROOT.",
+        )
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write(self.style.WARNING(
+                "DEBUG is on: Django keeps a log of every query, which inflates latency."
+            ))
+        for conn in connections.all():
+            _instrument(connection=conn)
+        connection_created.connect(_instrument)
+        self._start_gateway(options)
+
+        workers = options['concurrency']
+        accounts = self._accounts(workers)
+        created_before = Booking.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+        results = {
+            'meta': {
+                'commit': self._commit(),
+                'started_at': datetime.now().isoformat(timespec='seconds'),
+                'concurrency': workers,
+                'iterations': options['iterations'],
+                'database': connection.vendor,
+                'bookings_in_db': Booking.objects.count(),
+                'debug': settings.DEBUG,
+            },
+            'runs': {},
+        }
+
+        # Uploaded ID proofs (and any renditions) go to a scratch MEDIA_ROOT unless the bookings are kept
+        media_root = None if options['keep'] else tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            with override_settings(MEDIA_ROOT=media_root) if media_root else contextlib.nullcontext():
+                for name in (['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]):
+                    results['runs'][name] = self._run(name, accounts, options)
+                    connection.close()
+        finally:
+            if not options['keep']:
+                self._cleanup(created_before)
+                shutil.rmtree(media_root, ignore_errors=True)
+
+        output = Path(options['output'] or settings.BASE_DIR / 'benchmark-results' / (
+            f"workflows-{datetime.now():%Y%m%d-%H%M%S}-{results['meta']['commit'][:7]}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(results, indent=2))
+        self.stdout.write(f"Results written to {output}")
+
+        if options['compare']:
+            self._compare(json.loads(Path(options['compare']).read_text()), results)
+
+    # --- setup ---
+
+    def _start_gateway(self, options):
+        if options['gateway']:
+            settings.RAZORPAY_BASE_URL = options['gateway']
+        else:
+            FakeRazorpayHandler.latency = options['gateway_latency']
+            server = ThreadingHTTPServer(('127.0.0.1', 0), FakeRazorpayHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            settings.RAZORPAY_BASE_URL = f"http://127.0.0.1:{server.server_address[1]}"
+        payments._client = None  # Rebuild the client against the stub
+
+    def _accounts(self, workers):
+        accounts = []
+        for i in range(workers):
+            names = []
+            for role in ['guest', 'receptionist', 'housekeeping']:
+                user, created = User.objects.get_or_create(username=f"bench-{role}-{i}", defaults={'role': role})
+                if created:
+                    user.set_password(PASSWORD)
+                    user.save()
+                names.append(user.username)
+            accounts.append(names)
+        return accounts
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return 'unknown'
+
+    # --- run ---
+
+    def _run(self, name, accounts, options):
+        stats = Stats()
+        server = SERVERS[name](stats)
+
+        def workflows(index):
+            """(steps, counted) pairs for one user: log in the three roles, then repeat the stay."""
+            rng = random.Random(f"{options['seed']}-{name}-{index}")
+            browsers = [Browser(server.factory_class) for _ in accounts[index]]
+            for browser, username in zip(browsers, accounts[index]):
+                yield login_steps(browser, username), False
+            for _ in range(options['iterations']):
+                yield guest_stay(*browsers, rng), True
+
+        started = time.perf_counter()
+        server.run([workflows(i) for i in range(len(accounts))])
+        summary = stats.summary(time.perf_counter() - started)
+        self._print(name, summary)
+        return summary
+
+    # --- output ---
+
+    def _print(self, name, summary):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{name.upper()}: {summary['requests']} requests in {summary['wall_seconds']}s "
+            f"= {summary['throughput_rps']} req/s; workflows completed {summary['workflows_completed']}, "
+            f"failed {summary['workflows_failed'] or 0}"
+        ))
+        self.stdout.write(f"  {'endpoint':<22}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for endpoint, row in summary['endpoints'].items():
+            self.stdout.write(
+                f"  {endpoint:<22}{row['requests']:>6}{row['errors']:>5}{row['p50_ms']:>9.1f}"
+                f"{row['p90_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['queries_mean']:>9.1f}"
+            )
+
+    def _compare(self, before, after):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Against {before['meta']['commit'][:7]}:"))
+        for name, run in after['runs'].items():
+            old = before['runs'].get(name)
+            if not old:
+                continue
+            self.stdout.write(f"  {name}: {old['throughput_rps']} -> {run['throughput_rps']} req/s")
+            for endpoint, row in run['endpoints'].items():
+                prev = old['endpoints'].get(endpoint)
+                if prev:
+                    self.stdout.write(
+                        f"    {endpoint:<22} p50 {prev['p50_ms']:>8.1f} -> {row['p50_ms']:<8.1f}"
+                        f" p99 {prev['p99_ms']:>8.1f} -> {row['p99_ms']:<8.1f}"
+                        f" queries {prev['queries_mean']:>5.1f} -> {row['queries_mean']:.1f}"
+                    )
+
+    def _cleanup(self, created_before):
+        bookings = Booking.objects.filter(pk__gt=created_before, user__username__startswith='bench-guest-')
+        ids = list(bookings.values_list('pk', flat=True))
+        uploads = set(bookings.exclude(id_proof='').values_list('id_proof', flat=True))
+        Job.objects.filter(payload__booking_id__in=ids).delete()
+        Job.objects.filter(name='make_image_renditions', payload__path__in=uploads).delete()
+        bookings.delete()
+        self.stdout.write(f"Removed {len(ids)} benchmark bookings")
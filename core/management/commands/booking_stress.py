@@ -0,0 +1,114 @@
+import random
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from core import reservations
+from core.models import Booking, Notification, Room, RoomNight
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a scratch room with parallel bookings through the booking engine, "
+        "verify nothing is double-sold and report bookings per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--attempts', type=int, default=50, help="Bookings attempted per thread and phase.")
+        parser.add_argument('--no-wal', action='store_true', help="Leave SQLite in its current journal mode.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and not options['no_wal']:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                mode = cursor.fetchone()[0]
+            self.stdout.write(f"SQLite journal_mode={mode}")
+
+        tag = uuid.uuid4().hex[:6]
+        room = Room.objects.create(room_number=f"ST-{tag}", room_type='Single', price_per_night=1000)
+        guest = User.objects.create(username=f"stress-{tag}", role='guest')
+        start = date.today() + timedelta(days=3650)
+
+        try:
+            self._contention(room, guest, start, options)
+            self._throughput(room, guest, start + timedelta(days=400), options)
+        finally:
+            Notification.objects.filter(message__contains=room.room_number).delete()
+            room.delete()
+            guest.delete()
+
+    def _run(self, threads, work):
+        results = {'booked': 0, 'rejected': 0, 'locked': 0}
+        lock = threading.Lock()
+
+        def worker(index):
+            try:
+                for outcome in work(index):
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        return results, time.perf_counter() - started
+
+    def _attempt(self, room, guest, check_in, nights):
+        booking = Booking(user=guest, room=room, check_in=check_in, check_out=check_in + timedelta(days=nights))
+        try:
+            reservations.reserve(booking)
+        except reservations.RoomUnavailable:
+            return 'rejected'
+        except OperationalError:
+            return 'locked'
+        return 'booked'
+
+    def _contention(self, room, guest, start, options):
+        """Every thread fights over the same 30 nights with random overlapping stays."""
+
+        def work(index):
+            rng = random.Random(options['seed'] * 1000 + index)
+            for _ in range(options['attempts']):
+                yield self._attempt(room, guest, start + timedelta(days=rng.randrange(30)), rng.randint(1, 4))
+
+        results, elapsed = self._run(options['threads'], work)
+
+        active = list(Booking.objects.filter(room=room, status__in=Booking.ACTIVE_STATUSES).values_list('check_in', 'check_out'))
+        taken = [start + timedelta(days=i) for ci, co in active for i in range((ci - start).days, (co - start).days)]
+        double_sold = len(taken) - len(set(taken))
+        indexed = RoomNight.objects.filter(room=room).count()
+
+        self.stdout.write(
+            f"contention: {results['booked']} booked, {results['rejected']} rejected, "
+            f"{results['locked']} lock timeouts in {elapsed:.2f}s"
+        )
+        if double_sold or indexed != len(taken):
+            raise CommandError(f"Double-sold nights: {double_sold}; RoomNight rows {indexed} vs booked nights {len(taken)}")
+        self.stdout.write(self.style.SUCCESS("contention: no double-sold nights"))
+
+    def _throughput(self, room, guest, start, options):
+        """Non-overlapping one-night stays, so every attempt should succeed."""
+        attempts = options['attempts']
+
+        def work(index):
+            for i in range(attempts):
+                yield self._attempt(room, guest, start + timedelta(days=index * attempts + i), 1)
+
+        results, elapsed = self._run(options['threads'], work)
+        self.stdout.write(
+            f"throughput: {results['booked']} bookings in {elapsed:.2f}s = "
+            f"{results['booked'] / elapsed:.1f} bookings/s ({results['locked']} lock timeouts)"
+        )
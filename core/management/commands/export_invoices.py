@@ -0,0 +1,90 @@
+import concurrent.futures
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.invoices import InvoiceRenderError, render_invoice_html, render_pdf, render_pool
+from core.models import Booking
+from core.utils import calculate_bill
+
+
+class Command(BaseCommand):
+    help = "Render the invoices of every booking paid in a month, using all CPU cores."
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help="Month to export, as YYYY-MM.")
+        parser.add_argument('--output', default='invoice_export', help="Directory to write the PDFs to.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Render processes (default: all cores).")
+        parser.add_argument(
+            '--benchmark', action='store_true',
+            help="Measure PDFs/second for 1, 2, 4, ... workers up to --workers instead of writing files."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.strptime(options['month'], '%Y-%m')
+        except ValueError:
+            raise CommandError("Month must look like 2025-07.")
+
+        bookings = Booking.objects.filter(
+            is_paid=True,
+            paid_at__year=month.year,
+            paid_at__month=month.month
+        ).select_related('user', 'room').order_by('id')
+
+        # Templates render in this process; only the pisa step is farmed out
+        documents = [(booking.id, render_invoice_html(booking, calculate_bill(booking))) for booking in bookings]
+        if not documents:
+            self.stdout.write(f"No paid bookings in {options['month']}.")
+            return
+
+        if options['benchmark']:
+            self._benchmark(documents, options['workers'])
+            return
+
+        output = Path(options['output'])
+        output.mkdir(parents=True, exist_ok=True)
+
+        started = time.perf_counter()
+        written, failed = self._render(documents, options['workers'], output)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written} invoice(s) to {output} in {elapsed:.1f}s "
+            f"({written / elapsed:.1f} PDFs/s on {options['workers']} worker(s)); {failed} failed."
+        ))
+
+    def _render(self, documents, workers, output=None):
+        written = failed = 0
+        with render_pool(workers) as pool:
+            futures = {pool.submit(render_pdf, html): booking_id for booking_id, html in documents}
+            for future in concurrent.futures.as_completed(futures):
+                booking_id = futures[future]
+                try:
+                    pdf = future.result()
+                except InvoiceRenderError as exc:
+                    failed += 1
+                    self.stderr.write(f"Booking #{booking_id}: {exc}")
+                    continue
+                if output is not None:
+                    (output / f"Invoice_{booking_id}.pdf").write_bytes(pdf)
+                written += 1
+        return written, failed
+
+    def _benchmark(self, documents, max_workers):
+        counts = []
+        workers = 1
+        while workers < max_workers:
+            counts.append(workers)
+            workers *= 2
+        counts.append(max_workers)
+
+        self.stdout.write(f"Rendering {len(documents)} invoice(s) per run")
+        for workers in counts:
+            started = time.perf_counter()
+            rendered, _ = self._render(documents, workers)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{workers:>3} worker(s): {rendered / elapsed:7.2f} PDFs/s ({elapsed:.1f}s)")
@@ -0,0 +1,94 @@
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+class FakeRazorpayHandler(BaseHTTPRequestHandler):
+    """Just enough of the Razorpay orders API for local testing and benchmarks."""
+    orders = {}
+    lock = threading.Lock()
+    latency = 0.0
+    error_rate = 0.0
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up waiting, which is the point of injected latency
+
+    def _simulate_gateway(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            self._reply(500, {'error': {'code': 'SERVER_ERROR', 'description': 'Injected failure'}})
+            return False
+        return True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if not self._simulate_gateway():
+            return
+        if self.path.rstrip('/') != '/v1/orders':
+            self._reply(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+            return
+
+        order = {
+            'id': f"order_{uuid.uuid4().hex[:14]}",
+            'entity': 'order',
+            'amount': payload.get('amount'),
+            'currency': payload.get('currency', 'INR'),
+            'receipt': payload.get('receipt'),
+            'status': 'created',
+            'created_at': int(time.time()),
+        }
+        with self.lock:
+            self.orders[order['id']] = order
+        self._reply(200, order)
+
+    def do_GET(self):
+        if not self._simulate_gateway():
+            return
+        order_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+        with self.lock:
+            order = self.orders.get(order_id)
+        if order is None:
+            self._reply(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'The id provided does not exist'}})
+        else:
+            self._reply(200, order)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local fake of the Razorpay orders API with injectable latency and errors. "
+        "Point RAZORPAY_BASE_URL at http://<host>:<port> to use it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9100)
+        parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response.")
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with HTTP 500.")
+
+    def handle(self, *args, **options):
+        FakeRazorpayHandler.latency = options['latency']
+        FakeRazorpayHandler.error_rate = options['error_rate']
+        server = ThreadingHTTPServer((options['host'], options['port']), FakeRazorpayHandler)
+        self.stdout.write(f"Fake Razorpay listening on http://{options['host']}:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
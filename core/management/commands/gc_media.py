@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from core import catalog
+from core.storage import adopt_legacy, collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Remove uploaded images that no row references any more, with their renditions. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace', type=int, help="Seconds; defaults to settings.MEDIA_GC_GRACE.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be removed without removing it.")
+        parser.add_argument(
+            '--adopt', action='store_true',
+            help="First move images uploaded before content addressing into blobs and point their rows at them (not with --dry-run)."
+        )
+
+    def handle(self, *args, **options):
+        if options['adopt'] and not options['dry_run']:
+            files, blobs = adopt_legacy()
+            catalog.invalidate()  # Room image names changed under queryset updates, which send no signals
+            self.stdout.write(f"Adopted {files} file(s) as {blobs} blob(s).")
+        files, size = collect_garbage(options['grace'], options['dry_run'])
+        verb = "Would remove" if options['dry_run'] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {files} file(s), {size} bytes."))
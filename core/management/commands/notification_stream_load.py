@@ -0,0 +1,129 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from core.models import Notification
+
+User = get_user_model()
+
+
+def rss_kib(pid):
+    """Resident set size of a local process, from /proc (Linux only)."""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    raise CommandError(f"No VmRSS for pid {pid}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many idle notification streams against a running ASGI server, "
+        "report how many it holds and its memory per connection, then check "
+        "that a new notification reaches every stream."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the ASGI server.")
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--username', help="Account to stream as (default: first receptionist).")
+        parser.add_argument('--pid', type=int, help="Server process id, to measure its resident memory.")
+        parser.add_argument('--hold', type=float, default=5, help="Seconds to keep all streams open before delivering.")
+        parser.add_argument('--timeout', type=float, default=60, help="Seconds to wait for the notification to arrive.")
+        parser.add_argument('--batch', type=int, default=200, help="Connections opened concurrently per step.")
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(role='receptionist').order_by('pk').first()
+        if user is None:
+            raise CommandError("No user to stream as.")
+
+        client = Client()
+        client.force_login(user)
+        session = client.cookies['sessionid'].value
+
+        asyncio.run(self._run(user, session, options))
+
+    async def _run(self, user, session, options):
+        target = urlsplit(options['url'])
+        host, port = target.hostname, target.port or 80
+        path = reverse('notification_stream')
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: {target.netloc}\r\n"
+            f"Cookie: sessionid={session}\r\nAccept: text/event-stream\r\n\r\n"
+        ).encode()
+        pid = options['pid']
+        baseline = rss_kib(pid) if pid else None
+
+        streams, failures = [], 0
+        started = time.perf_counter()
+
+        async def connect():
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            await writer.drain()
+            status = await reader.readline()
+            if b' 200 ' not in status:
+                writer.close()
+                raise ConnectionError(status.decode(errors='replace').strip())
+            # Headers, then the retry hint and the initial unread count
+            while await reader.readline() not in (b'\r\n', b''):
+                pass
+            await reader.readuntil(b'event: unread')
+            return reader, writer
+
+        for offset in range(0, options['connections'], options['batch']):
+            count = min(options['batch'], options['connections'] - offset)
+            for result in await asyncio.gather(*(connect() for _ in range(count)), return_exceptions=True):
+                if isinstance(result, Exception):
+                    failures += 1
+                else:
+                    streams.append(result)
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f"Open streams: {len(streams)} ({failures} failed) in {elapsed:.1f}s")
+        await asyncio.sleep(options['hold'])
+
+        if baseline is not None:
+            held = rss_kib(pid)
+            per_connection = (held - baseline) / max(len(streams), 1)
+            self.stdout.write(
+                f"Server RSS: {baseline / 1024:.1f} MiB idle -> {held / 1024:.1f} MiB "
+                f"({per_connection:.1f} KiB per connection)"
+            )
+
+        # Written from this process, so the server finds it through its database poll
+        marker = f"Stream load test {time.time():.0f}"
+        received = []
+
+        async def wait_for_marker(reader):
+            await reader.readuntil(marker.encode())
+            received.append(time.perf_counter())
+
+        sent = time.perf_counter()
+        notification = await Notification.objects.acreate(user=user, message=marker)
+        waiters = [asyncio.ensure_future(wait_for_marker(reader)) for reader, _ in streams]
+        if waiters:
+            _, pending = await asyncio.wait(waiters, timeout=options['timeout'])
+            for waiter in pending:
+                waiter.cancel()
+
+        if received:
+            latencies = sorted(at - sent for at in received)
+            self.stdout.write(
+                f"Delivered to {len(received)}/{len(streams)} streams: "
+                f"median {latencies[len(latencies) // 2]:.2f}s, max {latencies[-1]:.2f}s"
+            )
+        else:
+            self.stdout.write(self.style.WARNING("Notification reached no stream."))
+
+        for _, writer in streams:
+            writer.close()
+        await notification.adelete()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from core.invoices import prune_invoice_cache
+
+
+class Command(BaseCommand):
+    help = "Evict cached invoice PDFs by age and total size. Run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-bytes', type=int, help="Defaults to settings.INVOICE_CACHE_MAX_BYTES.")
+        parser.add_argument('--max-age', type=int, help="Seconds; defaults to settings.INVOICE_CACHE_MAX_AGE.")
+
+    def handle(self, *args, **options):
+        files, size = prune_invoice_cache(options['max_bytes'], options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f"Removed {files} cached invoice(s), {size} bytes."))
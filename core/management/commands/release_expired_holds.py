@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.reservations import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = (
+        "Cancel unpaid online bookings whose hold has lapsed and free their rooms. "
+        "run_jobs does this periodically; run it from cron where no worker runs."
+    )
+
+    def handle(self, *args, **options):
+        released = release_expired_holds()
+        self.stdout.write(self.style.SUCCESS(f"Released {released} expired hold(s)."))
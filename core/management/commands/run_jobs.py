@@ -0,0 +1,73 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core import jobs, reservations
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (invoice emails, notifications) with retries and backoff, and "
+        "release lapsed booking holds every BOOKING_HOLD_SWEEP_INTERVAL."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Worker threads.")
+        parser.add_argument('--poll', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--once', action='store_true', help="Drain the queue and exit instead of polling forever.")
+
+    def sweep_jobs(self):
+        # Keep our own jobs' locks fresh, and take over jobs of workers that died since
+        jobs.heartbeat()
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Re-queued {requeued} stale job(s).")
+
+    def release_holds(self):
+        # Otherwise lapsed holds keep their rooms out of searches until someone books that very room
+        released = reservations.release_expired_holds()
+        if released:
+            self.stdout.write(f"Released {released} expired hold(s).")
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+        periodic = [
+            (settings.JOB_HEARTBEAT_INTERVAL, self.sweep_jobs),
+            (settings.BOOKING_HOLD_SWEEP_INTERVAL, self.release_holds),
+        ]
+        for _, task in periodic:
+            task()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    ran = jobs.run_pending(limit=100)
+                    if not ran:
+                        if options['once']:
+                            return
+                        stop.wait(options['poll'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(options['concurrency'])]
+        for t in threads:
+            t.start()
+
+        try:
+            last_run = [time.monotonic()] * len(periodic)
+            while any(t.is_alive() for t in threads):
+                time.sleep(0.5)
+                for i, (interval, task) in enumerate(periodic):
+                    if time.monotonic() - last_run[i] >= interval:
+                        last_run[i] = time.monotonic()
+                        task()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping workers...")
+            stop.set()
+            for t in threads:
+                t.join()
+        finally:
+            connection.close()
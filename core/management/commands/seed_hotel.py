@@ -0,0 +1,350 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from core.models import (
+    Amenity,
+    Booking,
+    Feedback,
+    GuestProfile,
+    InventoryItem,
+    InventoryUsageLog,
+    Notification,
+    Room,
+    RoomNight,
+    SpaService,
+    StaffAttendance,
+    StaffSalary,
+)
+from core.utils import BILL_FIELDS, BILL_VERSION, round2, stay_dates
+
+User = get_user_model()
+
+PREFIX = 'seed-'  # Usernames of generated accounts; rooms are numbered S-00001, ...
+ROOM_PREFIX = 'S-'
+
+ROOM_TYPES = [('Single', 2500, 0.5), ('Double', 4000, 0.35), ('Suite', 9000, 0.15)]
+AMENITIES = [('Breakfast', 300), ('Airport Pickup', 1200), ('Late Checkout', 500), ('Minibar', 800)]
+SPA_SERVICES = [('Massage', 2500), ('Facial', 1800), ('Sauna', 900)]
+INVENTORY = ['Towels', 'Bed Sheets', 'Soap', 'Shampoo', 'Toilet Paper', 'Coffee Pods', 'Water Bottles', 'Slippers']
+NOTIFICATION_MESSAGES = [
+    "🛎️ New booking: Room {room} booked by {user}.",
+    "🧹 Room {room} needs cleaning after checkout.",
+    "📅 New booking for Room {room} by {user}.",
+    "💰 Payment received for Room {room} by {user}.",
+]
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """Let bulk_create store the generated created_at/submitted_at/... instead of now()."""
+    fields = [f for model in models for f in model._meta.concrete_fields if getattr(f, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large, deterministic hotel dataset for load testing: rooms, guests with "
+        "profiles, staff, years of bookings with extras, feedback, notifications, attendance "
+        "and inventory usage. Bookings never overlap per room, so history grows with "
+        "--bookings / --rooms (e.g. --rooms 5000 --bookings 1000000 is about 2.5 years)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--rooms', type=int, default=500)
+        parser.add_argument('--guests', type=int, default=20000)
+        parser.add_argument('--staff', type=int, default=40, help="Receptionists and housekeepers, half each.")
+        parser.add_argument('--bookings', type=int, default=100000)
+        parser.add_argument('--notifications', type=int, help="Default: one per five bookings.")
+        parser.add_argument('--usage-logs', type=int, help="Inventory usage log rows. Default: one per ten bookings.")
+        parser.add_argument('--attendance-days', type=int, default=365)
+        parser.add_argument('--feedback-rate', type=float, default=0.3, help="Share of finished stays with feedback.")
+        parser.add_argument('--batch', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Delete previously generated rows first.")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch = options['batch']
+        self.today = date.today()
+        self.now = datetime.now(dt_timezone.utc)
+
+        if options['clear']:
+            self._clear()
+        elif User.objects.filter(username__startswith=PREFIX).exists():
+            raise CommandError("Generated data already exists; pass --clear to replace it.")
+
+        started = time.perf_counter()
+        with keep_timestamps(Booking, Feedback, Notification, InventoryUsageLog, StaffAttendance):
+            self._catalog(options)
+            self._people(options)
+            self._bookings(options)
+            self._notifications(options['notifications'] if options['notifications'] is not None else options['bookings'] // 5)
+            self._attendance(options['attendance_days'])
+            self._usage_logs(options['usage_logs'] if options['usage_logs'] is not None else options['bookings'] // 10)
+
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
+
+    # --- helpers ---
+
+    def _at(self, day, hour=None):
+        """Aware datetime on `day` at a random (or given) hour."""
+        hour = self.rng.randint(7, 22) if hour is None else hour
+        return datetime.combine(day, dt_time(hour, self.rng.randint(0, 59)), tzinfo=dt_timezone.utc)
+
+    def _insert(self, model, objs, **kwargs):
+        for start in range(0, len(objs), self.batch):
+            model.objects.bulk_create(objs[start:start + self.batch], **kwargs)
+
+    def _report(self, label, count, since):
+        elapsed = time.perf_counter() - since
+        self.stdout.write(f"  {label}: {count:,} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f}/s)")
+
+    def _clear(self):
+        since = time.perf_counter()
+        rooms = Room.objects.filter(room_number__startswith=ROOM_PREFIX)
+        users = User.objects.filter(username__startswith=PREFIX)
+        with transaction.atomic():
+            # Raw deletes, children first: the ORM collector would load every row
+            for model, lookup in [
+                (RoomNight, 'room__in'), (Booking.amenities.through, 'booking__room__in'),
+                (Booking.spa_services.through, 'booking__room__in'), (Feedback, 'booking__room__in'),
+                (InventoryUsageLog, 'room__in'), (Booking, 'room__in'),
+            ]:
+                model.objects.filter(**{lookup: rooms})._raw_delete(connection.alias)
+            for model in [Notification, StaffAttendance, StaffSalary, GuestProfile, InventoryUsageLog]:
+                field = 'used_by' if model is InventoryUsageLog else 'user'
+                model.objects.filter(**{f'{field}__in': users})._raw_delete(connection.alias)
+            Room.amenities.through.objects.filter(room__in=rooms)._raw_delete(connection.alias)
+            Room.spa_services.through.objects.filter(room__in=rooms)._raw_delete(connection.alias)
+            rooms._raw_delete(connection.alias)
+            users.delete()
+        self.stdout.write(f"Cleared generated data in {time.perf_counter() - since:.1f}s")
+
+    # --- generators ---
+
+    def _catalog(self, options):
+        since = time.perf_counter()
+        self.amenities = [Amenity.objects.get_or_create(name=n, defaults={'price': p})[0] for n, p in AMENITIES]
+        self.spa_services = [SpaService.objects.get_or_create(name=n, defaults={'price': p})[0] for n, p in SPA_SERVICES]
+        self.items = [
+            InventoryItem.objects.get_or_create(name=n, defaults={'quantity': 500, 'threshold': 20})[0]
+            for n in INVENTORY
+        ]
+
+        rooms = []
+        for i in range(1, options['rooms'] + 1):
+            room_type, base, _ = self.rng.choices(ROOM_TYPES, weights=[w for *_, w in ROOM_TYPES])[0]
+            rooms.append(Room(
+                room_number=f"{ROOM_PREFIX}{i:05d}",
+                room_type=room_type,
+                price_per_night=Decimal(base + self.rng.randrange(0, 1000, 100)),
+            ))
+        with transaction.atomic():
+            self._insert(Room, rooms)
+            self.rooms = list(Room.objects.filter(room_number__startswith=ROOM_PREFIX).order_by('room_number'))
+            links = []
+            for room in self.rooms:
+                for amenity in self.rng.sample(self.amenities, self.rng.randint(1, len(self.amenities))):
+                    links.append(Room.amenities.through(room_id=room.id, amenity_id=amenity.id))
+            self._insert(Room.amenities.through, links)
+        self._report("rooms", len(self.rooms), since)
+
+    def _people(self, options):
+        since = time.perf_counter()
+        password = make_password('seed-password')  # Hashing is slow; every account shares one hash
+
+        staff_roles = ['receptionist', 'housekeeping'] * (options['staff'] // 2 + 1)
+        users = [
+            User(username=f"{PREFIX}{role}-{i:04d}", role=role, password=password, email=f"{role}{i}@example.com")
+            for i, role in enumerate(staff_roles[:options['staff']], 1)
+        ]
+        users += [
+            User(
+                username=f"{PREFIX}guest-{i:06d}", role='guest', password=password,
+                first_name=f"Guest{i}", email=f"guest{i}@example.com",
+            )
+            for i in range(1, options['guests'] + 1)
+        ]
+        with transaction.atomic():
+            self._insert(User, users)
+            generated = User.objects.filter(username__startswith=PREFIX).order_by('username')
+            self.guests = list(generated.filter(role='guest').values_list('id', flat=True))
+            self.receptionists = list(generated.filter(role='receptionist').values_list('id', flat=True))
+            self.housekeepers = list(generated.filter(role='housekeeping').values_list('id', flat=True))
+            if not self.guests or not self.housekeepers:
+                raise CommandError("Need at least one guest and two staff members.")
+
+            self._insert(GuestProfile, [
+                GuestProfile(
+                    user_id=user_id, phone=f"9{self.rng.randrange(10 ** 9):09d}",
+                    id_proof='id_proofs/sample.jpg', address=f"{self.rng.randint(1, 999)} Main Road, Thrissur",
+                )
+                for user_id in self.guests
+            ])
+            self._insert(StaffSalary, [
+                StaffSalary(user_id=user_id, daily_rate=Decimal(self.rng.randrange(600, 1500, 50)))
+                for user_id in self.receptionists + self.housekeepers
+            ])
+        self._report("users", len(users), since)
+
+    def _stays(self, count):
+        """Non-overlapping (room, check_in, check_out) triples, laid backwards from 60 days ahead."""
+        horizon = self.today + timedelta(days=60)
+        per_room, extra = divmod(count, len(self.rooms))
+        for index, room in enumerate(self.rooms):
+            cursor = horizon - timedelta(days=self.rng.randint(0, 10))
+            for _ in range(per_room + (index < extra)):
+                check_out = cursor - timedelta(days=self.rng.choice([0, 0, 1, 2, 3]))
+                check_in = check_out - timedelta(days=self.rng.choice([1, 1, 2, 2, 3, 4, 5, 7]))
+                cursor = check_in
+                yield room, check_in, check_out
+
+    def _booking(self, room, check_in, check_out):
+        rng = self.rng
+        if check_out <= self.today:
+            status = rng.choices(['Checked Out', 'Canceled', 'No-Show'], weights=[85, 10, 5])[0]
+        elif check_in <= self.today:
+            status = 'Checked In'
+        else:
+            status = rng.choices(['Pending', 'Canceled'], weights=[95, 5])[0]
+
+        amenities = rng.sample(self.amenities, rng.choice([0, 0, 1, 1, 2]))
+        spa_services = rng.sample(self.spa_services, rng.choice([0, 0, 0, 1]))
+        nights = (check_out - check_in).days
+        room_total = room.price_per_night * nights
+        amenity_total = sum((a.price for a in amenities), Decimal('0.00'))
+        spa_total = sum((s.price for s in spa_services), Decimal('0.00'))
+        subtotal = room_total + amenity_total + spa_total
+        tax = subtotal * Decimal('0.18')
+        bill = {
+            'room_price': round2(room_total), 'amenity_price': round2(amenity_total),
+            'spa_price': round2(spa_total), 'subtotal': round2(subtotal), 'tax': round2(tax),
+            'discount': Decimal('0.00'), 'total': round2(subtotal + tax),
+        }
+
+        created_at = self._at(check_in - timedelta(days=rng.randint(0, 60)))
+        if created_at > self.now:
+            created_at = self.now - timedelta(minutes=rng.randint(1, 60 * 24 * 30))
+        paid = status in ('Checked Out', 'Checked In') or (status in ('Pending', 'No-Show') and rng.random() < 0.5)
+        paid_at = min(created_at + timedelta(minutes=rng.randint(1, 30)), self.now) if paid else None
+        method = rng.choice(['Cash', 'UPI', 'Card', 'Wallet']) if paid else None
+        cleaned = status == 'Checked Out' and check_out < self.today
+        booking = Booking(
+            room=room, user_id=rng.choice(self.guests), check_in=check_in, check_out=check_out,
+            guests=rng.randint(1, 3), status=status, created_at=created_at,
+            needs_cleaning=status == 'Checked Out' and not cleaned,
+            cleaned_by_id=rng.choice(self.housekeepers) if cleaned else None,
+            cleaned_at=self._at(check_out, 14) if cleaned else None,
+            subtotal=bill['subtotal'], tax=bill['tax'], discount=bill['discount'], total=bill['total'],
+            bill_snapshot={'version': BILL_VERSION, **{key: str(bill[key]) for key in BILL_FIELDS}},
+            is_paid=paid, paid_at=paid_at, payment_method=method,
+            razorpay_payment_id=f"pay_seed{rng.randrange(16 ** 12):012x}" if method and method != 'Cash' else None,
+            payment_time=paid_at if method and method != 'Cash' else None,
+        )
+        return booking, amenities, spa_services
+
+    def _bookings(self, options):
+        since = time.perf_counter()
+        total = options['bookings']
+        done = 0
+        pending = []
+
+        def flush():
+            nonlocal done
+            with transaction.atomic():
+                Booking.objects.bulk_create([b for b, _, _ in pending])
+                amenity_links, spa_links, nights, feedback = [], [], [], []
+                for booking, amenities, spa_services in pending:
+                    amenity_links += [Booking.amenities.through(booking_id=booking.id, amenity_id=a.id) for a in amenities]
+                    spa_links += [Booking.spa_services.through(booking_id=booking.id, spaservice_id=s.id) for s in spa_services]
+                    if booking.status in Booking.ACTIVE_STATUSES:
+                        nights += [
+                            RoomNight(room_id=booking.room_id, booking_id=booking.id, date=day)
+                            for day in stay_dates(booking.check_in, booking.check_out)
+                        ]
+                    if booking.status == 'Checked Out' and self.rng.random() < options['feedback_rate']:
+                        scores = [self.rng.choices([1, 2, 3, 4, 5], weights=[3, 5, 15, 40, 37])[0] for _ in range(4)]
+                        feedback.append(Feedback(
+                            user_id=booking.user_id, booking_id=booking.id, rating=scores[0],
+                            cleanliness_rating=scores[1], service_rating=scores[2], facilities_rating=scores[3],
+                            comment=self.rng.choice(['', '', 'Lovely stay.', 'Room was a bit noisy.', 'Great staff!']),
+                            submitted_at=self._at(booking.check_out + timedelta(days=self.rng.randint(0, 3))),
+                            is_read=booking.check_out < self.today - timedelta(days=7),
+                        ))
+                Booking.amenities.through.objects.bulk_create(amenity_links)
+                Booking.spa_services.through.objects.bulk_create(spa_links)
+                RoomNight.objects.bulk_create(nights)
+                Feedback.objects.bulk_create(feedback)
+            done += len(pending)
+            pending.clear()
+            if done % 100000 < self.batch:
+                self._report("bookings", done, since)
+
+        for stay in self._stays(total):
+            pending.append(self._booking(*stay))
+            if len(pending) >= self.batch:
+                flush()
+        if pending:
+            flush()
+        if done % 100000 >= self.batch:
+            self._report("bookings", done, since)
+
+    def _notifications(self, count):
+        since = time.perf_counter()
+        staff = self.receptionists + self.housekeepers
+        rows = []
+        for _ in range(count):
+            room = self.rng.choice(self.rooms)
+            user_id = self.rng.choice(staff) if self.rng.random() < 0.7 else self.rng.choice(self.guests)
+            created_at = min(self._at(self.today - timedelta(days=self.rng.randint(0, 365))), self.now)
+            rows.append(Notification(
+                user_id=user_id,
+                message=self.rng.choice(NOTIFICATION_MESSAGES).format(room=room.room_number, user=f"guest{user_id}"),
+                is_read=self.rng.random() < 0.9,
+                created_at=created_at,
+            ))
+        with transaction.atomic():
+            self._insert(Notification, rows)
+        self._report("notifications", len(rows), since)
+
+    def _attendance(self, days):
+        since = time.perf_counter()
+        rows = [
+            StaffAttendance(
+                user_id=user_id, date=day, present=self.rng.random() < 0.9,
+                timestamp=self._at(day, 9),
+            )
+            for day in (self.today - timedelta(days=n) for n in range(1, days + 1))
+            for user_id in self.receptionists + self.housekeepers
+        ]
+        with transaction.atomic():
+            self._insert(StaffAttendance, rows)
+        self._report("attendance", len(rows), since)
+
+    def _usage_logs(self, count):
+        since = time.perf_counter()
+        rows = [
+            InventoryUsageLog(
+                item=self.rng.choice(self.items), room=self.rng.choice(self.rooms),
+                used_by_id=self.rng.choice(self.housekeepers), quantity_used=self.rng.randint(1, 5),
+                used_at=min(self._at(self.today - timedelta(days=self.rng.randint(0, 365))), self.now),
+            )
+            for _ in range(count)
+        ]
+        with transaction.atomic():
+            self._insert(InventoryUsageLog, rows)
+        self._report("inventory usage", len(rows), since)
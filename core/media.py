@@ -0,0 +1,192 @@
+"""
+Serving uploaded media: room photos, ID proofs and their renditions.
+
+Every file under MEDIA_URL goes through `serve`, which
+- answers 404 outside the upload directories of the image fields and their
+  renditions (so e.g. the invoice PDF cache is never served);
+- shows an ID proof, or a rendition of one, only to the guest who uploaded
+  it and to front-desk staff, and a 404 to anyone else, so proofs can't be
+  found by guessing names;
+- sends a strong ETag and Last-Modified and answers conditional requests
+  with 304;
+- marks content-addressed files (see core.storage), whose bytes can never
+  change under their URL, as cacheable for a year and immutable, and
+  everything else for MEDIA_CACHE_MAX_AGE;
+- serves single byte ranges (206), honouring If-Range.
+
+With MEDIA_OFFLOAD = 'nginx' the file itself is left to the proxy through
+X-Accel-Redirect; with 'sendfile', through X-Sendfile (Apache, lighttpd).
+Django still decides access and cache headers. For nginx:
+
+    location /media/ { proxy_pass http://app; }
+    location /protected-media/ { internal; alias /path/to/MEDIA_ROOT/; }
+
+Without offload, whole files are passed to the server as file objects, so a
+WSGI server with wsgi.file_wrapper (gunicorn) sends them with sendfile(2).
+"""
+import functools
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from . import images
+from .storage import blob_storage, image_fields, is_blob
+
+# Image fields only their owner (the row's `user`) and ID_PROOF_ROLES may see, by model label
+PRIVATE_FIELDS = {'core.Booking': 'id_proof', 'core.GuestProfile': 'id_proof'}
+ID_PROOF_ROLES = ('admin', 'manager', 'receptionist')
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+@functools.cache
+def _directories():
+    """{upload directory: model whose rows own its files, or None when they are public}."""
+    return {
+        model._meta.get_field(field).upload_to.strip('/'): (
+            model if PRIVATE_FIELDS.get(model._meta.label) == field else None
+        )
+        for model, field in image_fields()
+    }
+
+
+def source_name(path):
+    """The uploaded file a media path is, or is a rendition of."""
+    if path.startswith(f'{images.ROOT}/'):
+        return posixpath.dirname(path[len(images.ROOT) + 1:])
+    return path
+
+
+def can_view(user, path):
+    directory = source_name(path).split('/', 1)[0]
+    if directory not in _directories():
+        return False
+    owner_model = _directories()[directory]
+    if owner_model is None:
+        return True
+    if not user.is_authenticated:
+        return False
+    if user.is_superuser or user.is_staff or user.role in ID_PROOF_ROLES:
+        return True
+    # A blob may be shared by several rows: any of their owners uploaded these bytes
+    return owner_model.objects.filter(user=user, id_proof=source_name(path)).exists()
+
+
+def _byte_range(header, size):
+    """
+    (first, last) byte of a single satisfiable `Range`, None to send the
+    whole file (no header, a malformed one, or several ranges), or False
+    when the range lies past the end of the file.
+    """
+    match = _RANGE.match(header or '')
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        if int(last) == 0:
+            return False
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    if first >= size:
+        return False
+    last = int(last) if last else size - 1
+    if last < first:
+        return None
+    return first, min(last, size - 1)
+
+
+class _Slice:
+    """`length` bytes of an open file from `start`, read like a file by FileResponse."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def serve(request, path):
+    # Decide access on the path that will be opened: "room_images/../id_proofs/..." is an ID proof
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        full_path = blob_storage.path(path)
+    except SuspiciousFileOperation:
+        raise Http404
+    # Access before existence, so a 404 tells nobody whether an ID proof exists
+    if not can_view(request.user, path):
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    visibility = 'public' if _directories()[source_name(path).split('/', 1)[0]] is None else 'private'
+    if is_blob(path):
+        etag = '"{}"'.format(posixpath.splitext(posixpath.basename(path))[0])  # The SHA-256 of the content
+        cache_control = f'{visibility}, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        cache_control = f'{visibility}, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, path, full_path, stat.st_size, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _file_response(request, path, full_path, size, etag, last_modified):
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    if settings.MEDIA_OFFLOAD == 'nginx':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if settings.MEDIA_OFFLOAD == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    byte_range = _byte_range(request.headers.get('Range'), size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        byte_range = None  # The client's partial copy is stale: send it all
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        first, last = byte_range
+        length = last - first + 1
+        response = FileResponse(_Slice(open(full_path, 'rb'), first, length), status=206, content_type=content_type)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    return response
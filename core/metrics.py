@@ -0,0 +1,347 @@
+"""
+Prometheus metrics for the booking pipeline, served at /metrics.
+
+Every process (web workers, `run_jobs`, PDF render workers) adds its
+samples to its own memory-mapped file under METRICS_DIR: an append-only
+table of sample key -> float64. Recording a sample is a dict lookup and an
+in-place add in shared memory, with no lock or I/O shared between
+processes and nothing to flush. /metrics reads every file and sums them,
+so whichever worker is scraped answers for all of them. Files of exited
+processes are kept so counters never go backwards; clear METRICS_DIR when
+the whole server restarts (Prometheus treats that as a counter reset).
+
+A local Prometheus only needs a scrape job for this host:
+
+    scrape_configs:
+      - job_name: hotel_mgmt
+        static_configs:
+          - targets: ['127.0.0.1:8000']
+        authorization:
+          credentials_file: /etc/prometheus/hotel_mgmt.token
+
+/metrics answers only to METRICS_ALLOWED_IPS and, when METRICS_TOKEN is
+set, only to requests bearing it. The allowlist checks REMOTE_ADDR, which
+behind a reverse proxy on the same host is the proxy's address for every
+client: deploy behind one only with METRICS_TOKEN set, or with the proxy
+refusing /metrics.
+"""
+import bisect
+import functools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_HEADER = struct.Struct('<I4x')  # bytes of the file in use
+_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+_INITIAL_SIZE = 64 * 1024
+
+
+def _entries(buffer, used):
+    """(key, value, value offset) for each sample in a process file."""
+    position = _HEADER.size
+    while position < used:
+        (length,) = _LENGTH.unpack_from(buffer, position)
+        key = bytes(buffer[position + 4:position + 4 + length]).decode('utf-8')
+        position += 4 + length
+        position += -position % 8  # Values are 8-byte aligned
+        (value,) = _VALUE.unpack_from(buffer, position)
+        yield key, value, position
+        position += _VALUE.size
+
+
+class _ProcessFile:
+    """This process's samples, in METRICS_DIR/<pid>.db."""
+
+    def __init__(self, directory):
+        self.pid = os.getpid()
+        directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(directory / f'{self.pid}.db', 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            size = _INITIAL_SIZE
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map)[0] or _HEADER.size
+        # A reused pid continues from the file an earlier process left
+        self._offsets = {key: offset for key, _, offset in _entries(self._map, self._used)}
+        # Only guards this process's threads against each other's read-modify-write
+        self._lock = threading.Lock()
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        start = self._used + 4 + len(encoded)
+        offset = start + -start % 8
+        end = offset + _VALUE.size
+        if end > len(self._map):
+            size = len(self._map)
+            while size < end:
+                size *= 2
+            self._file.truncate(size)
+            old, self._map = self._map, mmap.mmap(self._file.fileno(), size)
+            old.close()
+        _LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + 4:self._used + 4 + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, offset, 0.0)
+        # Publish the entry to readers last
+        self._used = end
+        _HEADER.pack_into(self._map, 0, end)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, increments):
+        with self._lock:
+            for key, amount in increments:
+                offset = self._offsets.get(key)
+                if offset is None:
+                    offset = self._append(key)
+                (value,) = _VALUE.unpack_from(self._map, offset)
+                _VALUE.pack_into(self._map, offset, value + amount)
+
+
+_process = None
+_process_lock = threading.Lock()
+
+
+def _add(*increments):
+    """Add each (key, amount) to this process's samples."""
+    global _process
+    process = _process
+    if process is None or process.pid != os.getpid():  # First sample, or a forked child
+        with _process_lock:
+            if _process is None or _process.pid != os.getpid():
+                _process = _ProcessFile(Path(settings.METRICS_DIR))
+            process = _process
+    process.add(increments)
+
+
+def _key(sample, labels):
+    return json.dumps([sample, sorted(labels.items())])
+
+
+_registry = []
+
+
+class Metric:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._keys = {}
+        _registry.append(self)
+
+    def keys(self, labels):
+        """Sample keys for a label set, built once per label set."""
+        items = tuple(labels.items())
+        keys = self._keys.get(items)
+        if keys is None:
+            if set(labels) != set(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+            keys = self._keys[items] = self.make_keys(labels)
+        return keys
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def make_keys(self, labels):
+        return _key(f'{self.name}_total', labels)
+
+    def inc(self, amount=1, **labels):
+        _add((self.keys(labels), amount))
+
+    def samples(self, totals):
+        for (sample, labels), value in sorted(totals.items()):
+            if sample == f'{self.name}_total':
+                yield sample, labels, value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+    SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(float(b) for b in buckets)
+
+    def make_keys(self, labels):
+        bounds = [repr(b) for b in self.buckets] + ['+Inf']
+        return (
+            [_key(f'{self.name}_bucket', {**labels, 'le': le}) for le in bounds],
+            _key(f'{self.name}_sum', labels),
+            _key(f'{self.name}_count', labels),
+        )
+
+    def observe(self, value, **labels):
+        # Buckets are stored non-cumulative (one write per observation) and summed up on scrape
+        buckets, total, count = self.keys(labels)
+        _add((buckets[bisect.bisect_left(self.buckets, value)], 1), (total, value), (count, 1))
+
+    def time(self, **labels):
+        """Decorator observing the duration of every call, in seconds."""
+        def decorate(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, **labels)
+            return wrapper
+        return decorate
+
+    def samples(self, totals):
+        series = sorted(labels for sample, labels in totals if sample == f'{self.name}_count')
+        for labels in series:
+            cumulative = 0
+            for le in [repr(b) for b in self.buckets] + ['+Inf']:
+                cumulative += totals.get((f'{self.name}_bucket', tuple(sorted(labels + (('le', le),)))), 0)
+                yield f'{self.name}_bucket', labels + (('le', le),), cumulative
+            yield f'{self.name}_sum', labels, totals[(f'{self.name}_sum', labels)]
+            yield f'{self.name}_count', labels, totals[(f'{self.name}_count', labels)]
+
+
+def collect():
+    """Samples summed over every process file: {(sample, ((label, value), ...)): value}."""
+    totals = defaultdict(float)
+    directory = Path(settings.METRICS_DIR)
+    if not directory.is_dir():
+        return totals
+    for path in directory.glob('*.db'):
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        used = min(_HEADER.unpack_from(data)[0], len(data))
+        for key, value, _ in _entries(data, used):
+            sample, labels = json.loads(key)
+            totals[(sample, tuple(tuple(pair) for pair in labels))] += value
+    return totals
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def exposition():
+    """Every metric in the Prometheus text format (version 0.0.4)."""
+    totals = collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for sample, labels, value in metric.samples(totals):
+            label_text = ','.join(f'{name}="{_escape(v)}"' for name, v in labels)
+            lines.append(f'{sample}{{{label_text}}} {_number(value)}' if labels else f'{sample} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# --- The booking pipeline ---
+
+BOOKINGS_CREATED = Counter(
+    'hotel_bookings_created', "Bookings created, by channel (guest, receptionist, walkin).", ['channel']
+)
+PAYMENT_VERIFICATIONS = Counter(
+    'hotel_payment_verifications',
+    "Razorpay payment callbacks, by outcome (success, bad_signature, invalid_request, unknown_order, hold_expired, booking_canceled).",
+    ['outcome'],
+)
+PAYMENT_VERIFICATION_SECONDS = Histogram(
+    'hotel_payment_verification_seconds', "Time to verify a Razorpay payment callback and confirm its booking."
+)
+PDF_RENDER_SECONDS = Histogram('hotel_pdf_render_seconds', "Time xhtml2pdf spends rendering an invoice.")
+EMAIL_SEND_SECONDS = Histogram('hotel_email_send_seconds', "Time to send a booking confirmation email.")
+NOTIFICATIONS_SENT = Counter('hotel_notifications_sent', "In-app notifications created.")
+NOTIFICATION_FANOUT = Histogram(
+    'hotel_notification_fanout_recipients', "Recipients of each role-wide notification.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250, 500, 1000),
+)
+AVAILABILITY_SEARCH_SECONDS = Histogram(
+    'hotel_availability_search_seconds', "Time to answer an availability search page, rendering included."
+)
+VIEW_QUERIES = Histogram(
+    'hotel_view_db_queries', "Database queries per request, by view.", ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+ROOM_CATALOG_LOOKUPS = Counter(
+    'hotel_room_catalog_lookups',
+    "Room catalog reads, by where they were answered from (local, shared, rebuilt).",
+    ['result'],
+)
+
+
+# --- Queries per view ---
+
+_request_queries = ContextVar('metrics_request_queries', default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _instrument(sender=None, connection=None, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+class MetricsMiddleware:
+    """Observes VIEW_QUERIES for every routed request. Sync and async capable, like ProfilingMiddleware."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        # Connections are per thread; new ones are instrumented as they connect
+        connection_created.connect(_instrument)
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection=connection)
+
+    def _observe(self, request, counter):
+        match = request.resolver_match
+        if match is not None:
+            VIEW_QUERIES.observe(counter[0], view=match.view_name)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counter = [0]
+        token = _request_queries.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._observe(request, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = [0]
+        token = _request_queries.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._observe(request, counter)
+        return response
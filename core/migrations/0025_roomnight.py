@@ -0,0 +1,48 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:19
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_room_nights(apps, schema_editor):
+    Booking = apps.get_model('core', 'Booking')
+    RoomNight = apps.get_model('core', 'RoomNight')
+
+    nights = []
+    for booking in Booking.objects.filter(status__in=['Pending', 'Checked In']).iterator():
+        for i in range((booking.check_out - booking.check_in).days):
+            nights.append(RoomNight(
+                room_id=booking.room_id,
+                booking_id=booking.id,
+                date=booking.check_in + timedelta(days=i),
+            ))
+    RoomNight.objects.bulk_create(nights, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_room_needs_cleaning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='core.booking')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='core.room')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'room'], name='roomnight_date_room_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='roomnight',
+            constraint=models.UniqueConstraint(fields=('room', 'date'), name='unique_room_night'),
+        ),
+        migrations.RunPython(backfill_room_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_booking_hold_expires_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='bill_snapshot',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='payment_amount',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
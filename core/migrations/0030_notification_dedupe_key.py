@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_booking_payment_amount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='dedupe_key',
+            field=models.CharField(blank=True, db_index=True, max_length=40),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.14 on 2026-10-18 02:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_notification_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['created_at', 'id'], name='booking_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'check_out', 'id'], name='booking_status_checkout_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['cleaned_at', 'id'], name='booking_cleaned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['submitted_at', 'id'], name='contactmessage_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['submitted_at', 'id'], name='feedback_submitted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(fields=['scheduled_date', 'id'], name='maintenance_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffattendance',
+            index=models.Index(fields=['date', 'id'], name='attendance_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='profile_requests',
+            field=models.BooleanField(default=False, help_text='Profile every request this user makes (see core.profiling).'),
+        ),
+    ]
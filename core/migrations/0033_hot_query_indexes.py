@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_customuser_profile_requests'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['room', 'status', 'check_in', 'check_out'], name='booking_room_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('cleaned_by__isnull', True)), fields=['status', '-check_out'], name='booking_cleaning_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('payment_id__isnull', False)), fields=['payment_id'], name='booking_payment_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['submitted_at'], name='contactmessage_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['submitted_at'], name='feedback_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='maintenance',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['scheduled_date', 'room'], name='maintenance_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['user', '-created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffattendance',
+            index=models.Index(fields=['user', 'present'], name='attendance_user_present_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 03:28
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='id_proof',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='booking_id_proofs/'),
+        ),
+        migrations.AlterField(
+            model_name='guestprofile',
+            name='id_proof',
+            field=models.ImageField(storage=core.storage.ContentAddressedStorage(), upload_to='id_proofs/'),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='image',
+            field=models.ImageField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to='room_images/'),
+        ),
+        migrations.AlterField(
+            model_name='roomimage',
+            name='image',
+            field=models.ImageField(storage=core.storage.ContentAddressedStorage(), upload_to='room_images/'),
+        ),
+    ]
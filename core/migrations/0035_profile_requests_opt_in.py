@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 04:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_content_addressed_media'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customuser',
+            name='profile_requests',
+            field=models.BooleanField(default=False, help_text='Let this user profile their own requests with ?profile=1 (see core.profiling).'),
+        ),
+    ]
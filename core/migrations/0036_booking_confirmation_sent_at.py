@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 04:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_profile_requests_opt_in'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='confirmation_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
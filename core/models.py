@@ -1,9 +1,13 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.conf import settings
 from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from .storage import blob_storage
+
 
 # ---------------------
 # Custom User Model
@@ -17,6 +21,7 @@ class CustomUser(AbstractUser):
         ('guest', 'Guest'),
     ]
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='guest')
+    profile_requests = models.BooleanField(default=False, help_text="Let this user profile their own requests with ?profile=1 (see core.profiling).")
 
     def __str__(self):
         return f"{self.username} ({self.role})"
@@ -53,7 +58,7 @@ class Room(models.Model):
     is_available = models.BooleanField(default=True)
     amenities = models.ManyToManyField(Amenity, blank=True)
     spa_services = models.ManyToManyField(SpaService, blank=True)  # ✅ NEW
-    image = models.ImageField(upload_to='room_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='room_images/', storage=blob_storage, blank=True, null=True)
     needs_cleaning = models.BooleanField(default=False)
 
     def __str__(self):
@@ -72,6 +77,9 @@ class Booking(models.Model):
         ('No-Show', 'No-Show'),
     ]
 
+    # Statuses that keep a room occupied for the booked nights
+    ACTIVE_STATUSES = ['Pending', 'Checked In']
+
     PAYMENT_METHOD_CHOICES = [
         ('Cash', 'Cash'),
         ('UPI', 'UPI'),
@@ -92,7 +100,7 @@ class Booking(models.Model):
     amenities = models.ManyToManyField(Amenity, blank=True)
     spa_services = models.ManyToManyField(SpaService, blank=True)
     needs_cleaning = models.BooleanField(default=False)
-    id_proof = models.ImageField(upload_to='booking_id_proofs/', blank=True, null=True)
+    id_proof = models.ImageField(upload_to='booking_id_proofs/', storage=blob_storage, blank=True, null=True)
     cleaned_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
@@ -103,6 +111,7 @@ class Booking(models.Model):
     )
     cleaned_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    hold_expires_at = models.DateTimeField(null=True, blank=True)  # Unpaid online bookings lapse after this
 
     # ✅ Billing & Payment Fields
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -118,17 +127,76 @@ class Booking(models.Model):
         null=True
     )
     payment_id = models.CharField(max_length=100, blank=True, null=True)
+    payment_amount = models.PositiveIntegerField(blank=True, null=True)  # Paisa the open Razorpay order was created for
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     payment_time = models.DateTimeField(blank=True, null=True)# For gateway like Razorpay
+    bill_snapshot = models.JSONField(blank=True, null=True)  # Frozen breakdown from utils.calculate_bill
+    confirmation_sent_at = models.DateTimeField(blank=True, null=True)  # Set by tasks.send_booking_confirmation, so it mails once
+
+    class Meta:
+        indexes = [
+            # Keyset pagination (core.pagination) seeks on these, newest first
+            models.Index(fields=['created_at', 'id'], name='booking_created_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_created_idx'),
+            models.Index(fields=['status', 'check_out', 'id'], name='booking_status_checkout_idx'),
+            models.Index(fields=['cleaned_at', 'id'], name='booking_cleaned_idx'),
+            # Hot filters (see tests.HOT_QUERIES). Partial indexes hold only the rows those
+            # queries look for; status stays a column rather than a condition because SQLite
+            # can't match `status IN (%s, %s)` against a literal IN list in the index.
+            models.Index(fields=['room', 'status', 'check_in', 'check_out'], name='booking_room_stay_idx'),
+            models.Index(
+                fields=['status', '-check_out'], name='booking_cleaning_queue_idx',
+                condition=Q(cleaned_by__isnull=True),
+            ),
+            models.Index(fields=['payment_id'], name='booking_payment_id_idx', condition=Q(payment_id__isnull=False)),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - Room {self.room.room_number} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the bill was priced on, so edits can invalidate the snapshot.
+        # Skipped when those fields are deferred (.only(), the delete collector):
+        # reading them here would reload the row through from_db again.
+        if not {'room_id', 'check_in', 'check_out'} & instance.get_deferred_fields():
+            instance._bill_inputs = instance.bill_inputs()
+        return instance
+
+    def bill_inputs(self):
+        return (self.room_id, self.check_in, self.check_out)
+
     @property
     def total_nights(self):
         return (self.check_out - self.check_in).days
 
 
+# ---------------------
+# Room-Night Occupancy
+# ---------------------
+class RoomNight(models.Model):
+    """One row per night a room is held by an active booking.
+
+    Kept in sync with ``Booking`` by ``core.signals`` so availability
+    searches become an indexed lookup instead of a date-overlap scan.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nights')
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights')
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_night'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'room'], name='roomnight_date_room_idx'),
+        ]
+
+    def __str__(self):
+        return f"Room {self.room_id} on {self.date} (Booking #{self.booking_id})"
+
+
 # ---------------------
 # Maintenance Model
 # ---------------------
@@ -138,6 +206,12 @@ class Maintenance(models.Model):
     scheduled_date = models.DateField()
     is_completed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['scheduled_date', 'id'], name='maintenance_scheduled_idx'),
+            models.Index(fields=['scheduled_date', 'room'], name='maintenance_pending_idx', condition=Q(is_completed=False)),
+        ]
+
     def __str__(self):
         return f"Room {self.room.room_number} - Issue on {self.scheduled_date} ({'Done' if self.is_completed else 'Pending'})"
 
@@ -186,6 +260,12 @@ class Feedback(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['submitted_at', 'id'], name='feedback_submitted_idx'),
+            models.Index(fields=['submitted_at'], name='feedback_unread_idx', condition=Q(is_read=False)),
+        ]
+
     def __str__(self):
         return f"Feedback from {self.user.username} ({self.rating}★)"
 
@@ -193,7 +273,7 @@ class Feedback(models.Model):
 
 class RoomImage(models.Model):
     room = models.ForeignKey('Room', on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='room_images/')
+    image = models.ImageField(upload_to='room_images/', storage=blob_storage)
 
     def __str__(self):
         return f"Image for Room {self.room.room_number}"
@@ -201,7 +281,7 @@ class RoomImage(models.Model):
 class GuestProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     phone = models.CharField(max_length=15)
-    id_proof = models.ImageField(upload_to='id_proofs/')
+    id_proof = models.ImageField(upload_to='id_proofs/', storage=blob_storage)
     address = models.TextField()
 
     def __str__(self):
@@ -243,6 +323,10 @@ class StaffAttendance(models.Model):
 
     class Meta:
         unique_together = ('user', 'date')
+        indexes = [
+            models.Index(fields=['date', 'id'], name='attendance_date_idx'),
+            models.Index(fields=['user', 'present'], name='attendance_user_present_idx'),
+        ]
 
     def __str__(self):
        return f"{self.user.username} - {'Present' if self.present else 'Absent'} on {self.date}"
@@ -257,6 +341,13 @@ class Notification(models.Model):
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    dedupe_key = models.CharField(max_length=40, blank=True, db_index=True)  # See utils.notify_roles
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='notification_unread_idx', condition=Q(is_read=False)),
+        ]
 
     def __str__(self):
         return f"To {self.user.username}: {self.message[:50]}"
@@ -270,5 +361,44 @@ class ContactMessage(models.Model):
     submitted_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['submitted_at', 'id'], name='contactmessage_submitted_idx'),
+            models.Index(fields=['submitted_at'], name='contactmessage_unread_idx', condition=Q(is_read=False)),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} from {self.name}"
+
+
+# ---------------------
+# Background Jobs
+# ---------------------
+class Job(models.Model):
+    """A unit of deferred work for the `run_jobs` worker (see core.jobs)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.subject} from {self.name}"
\ No newline at end of file
+        return f"{self.name} #{self.id} ({self.status})"
+
@@ -0,0 +1,146 @@
+"""
+Keyset (cursor) pagination for the long staff and guest lists.
+
+Instead of OFFSET, each page asks for the rows that sort after (or before)
+the last row already shown, e.g. `created_at < x OR (created_at = x AND
+id < y)`. With a composite index on the ordering columns that is one index
+seek however deep the page is, and rows inserted meanwhile never shift or
+repeat entries. Ordering fields must end with a unique column (the
+primary key) to make the order total; a nullable field sorts its nulls
+last, whichever the direction.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+PER_PAGE = 25
+
+
+class KeysetPage:
+    def __init__(self, object_list, request, next_values, previous_values):
+        self.object_list = object_list
+        self.has_next = next_values is not None
+        self.has_previous = previous_values is not None
+        self.next_query = _query(request, 'after', next_values)
+        self.previous_query = _query(request, 'before', previous_values)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _encode(values):
+    raw = json.dumps([None if value is None else str(value) for value in values]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(cursor, fields):
+    """Cursor -> Python values for `fields`, or None if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (TypeError, ValueError, ValidationError):
+        return None
+
+
+def _query(request, param, values):
+    if values is None:
+        return ''
+    params = request.GET.copy()
+    params.pop('after', None)
+    params.pop('before', None)
+    params[param] = _encode(values)
+    return '?' + params.urlencode()
+
+
+def _equal(name, value):
+    return Q(**{f'{name}__isnull': True}) if value is None else Q(**{name: value})
+
+
+def _beyond(name, descending, value, nullable, forward):
+    """Q for the rows whose `name` sorts strictly after `value` (before it when not `forward`), or None."""
+    if value is None:
+        # Nulls sort last: nothing follows them, every non-null precedes them
+        return None if forward else Q(**{f'{name}__isnull': False})
+    step = Q(**{f"{name}__{'lt' if descending == forward else 'gt'}": value})
+    if nullable and forward:
+        step |= Q(**{f'{name}__isnull': True})
+    return step
+
+
+def _seek(ordering, fields, values, forward):
+    """Q for the rows that sort after `values` (before them when not `forward`)."""
+    condition = Q(pk__in=[])
+    for i in reversed(range(len(ordering))):
+        step = _beyond(ordering[i].lstrip('-'), ordering[i].startswith('-'), values[i], fields[i].null, forward)
+        if step is None:
+            continue
+        for j in range(i):
+            step &= _equal(ordering[j].lstrip('-'), values[j])
+        condition |= step
+    return condition
+
+
+def _order_by(ordering, fields, forward=True):
+    """order_by() arguments for `ordering`, reversed when not `forward`; nulls stay at the end of the display order."""
+    expressions = []
+    for name, field in zip(ordering, fields):
+        descending = name.startswith('-') == forward
+        name = name.lstrip('-')
+        if not field.null:
+            expressions.append(f'-{name}' if descending else name)
+            continue
+        nulls = {'nulls_last': True} if forward else {'nulls_first': True}
+        expressions.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+    return expressions
+
+
+def paginate(request, queryset, ordering=('-created_at', '-id'), per_page=PER_PAGE):
+    """
+    Slice `queryset` into the page named by the request's `after`/`before` cursor.
+
+    Other GET parameters (filters) are carried over into the next and previous
+    links. A malformed cursor falls back to the first page.
+    """
+    ordering = list(ordering)
+    fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+
+    def key(obj):
+        return [getattr(obj, field.attname) for field in fields]
+
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    cursor = _decode(after or before, fields) if (after or before) else None
+    forward = bool(after)
+
+    if cursor is None:
+        rows = list(queryset.order_by(*_order_by(ordering, fields))[:per_page + 1])
+        more, rows = len(rows) > per_page, rows[:per_page]
+        return KeysetPage(rows, request, key(rows[-1]) if more else None, None)
+
+    if forward:
+        rows = list(queryset.filter(_seek(ordering, fields, cursor, True)).order_by(*_order_by(ordering, fields))[:per_page + 1])
+        more, rows = len(rows) > per_page, rows[:per_page]
+        next_values = key(rows[-1]) if more else None
+        previous_values = key(rows[0]) if rows else cursor
+        return KeysetPage(rows, request, next_values, previous_values)
+
+    # Walk backwards from the cursor, then restore display order
+    rows = list(
+        queryset.filter(_seek(ordering, fields, cursor, False)).order_by(*_order_by(ordering, fields, forward=False))[:per_page + 1]
+    )
+    more, rows = len(rows) > per_page, rows[:per_page]
+    rows.reverse()
+    previous_values = key(rows[0]) if more else None
+    next_values = key(rows[-1]) if rows else cursor
+    return KeysetPage(rows, request, next_values, previous_values)
@@ -0,0 +1,139 @@
+"""
+Razorpay gateway access.
+
+One process-wide client over a pooled keep-alive requests.Session with
+explicit timeouts, so a slow gateway can't hold a worker indefinitely.
+Order creation goes through a circuit breaker: after
+RAZORPAY_BREAKER_THRESHOLD consecutive transport/5xx failures further
+calls fail fast with GatewayUnavailable for RAZORPAY_BREAKER_RESET
+seconds, then a single trial call decides whether the circuit closes.
+
+Orders are idempotent per booking: an unpaid booking keeps its open
+order as long as the amount is unchanged.
+"""
+import logging
+import threading
+import time
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .models import Booking
+from .profiling import timed
+
+logger = logging.getLogger(__name__)
+
+
+class GatewayUnavailable(Exception):
+    """Razorpay is failing or slow; the circuit is open or the call just failed."""
+
+
+class TimeoutSession(requests.Session):
+    """requests.Session with a default timeout and a bounded keep-alive pool."""
+
+    def __init__(self, timeout, pool_size):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class CircuitBreaker:
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def _allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # Half-open: let this one call through as a trial
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def _record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        if not self._allow():
+            raise GatewayUnavailable("Payment gateway circuit is open")
+        try:
+            result = func(*args, **kwargs)
+        except (requests.exceptions.RequestException, razorpay.errors.ServerError, razorpay.errors.GatewayError) as exc:
+            self._record(False)
+            raise GatewayUnavailable(str(exc)) from exc
+        self._record(True)
+        return result
+
+
+_client = None
+_client_lock = threading.Lock()
+breaker = CircuitBreaker(settings.RAZORPAY_BREAKER_THRESHOLD, settings.RAZORPAY_BREAKER_RESET)
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            options = {}
+            if settings.RAZORPAY_BASE_URL:
+                options['base_url'] = settings.RAZORPAY_BASE_URL
+            _client = razorpay.Client(
+                session=TimeoutSession(settings.RAZORPAY_TIMEOUT, settings.RAZORPAY_POOL_SIZE),
+                auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET),
+                **options
+            )
+        return _client
+
+
+def get_or_create_order(booking, amount_in_paisa):
+    """
+    Razorpay order id for an unpaid booking. Reuses the booking's open order
+    when the amount hasn't changed, so reloading the payment page doesn't
+    create a new order each time.
+    """
+    if booking.payment_id and booking.payment_amount == amount_in_paisa and not booking.is_paid:
+        return booking.payment_id
+
+    with timed('razorpay'):
+        order = breaker.call(get_client().order.create, {
+            "amount": amount_in_paisa,  # paisa (₹ x 100)
+            "currency": "INR",
+            "receipt": f"booking_rcpt_{booking.id}",
+            "payment_capture": 1
+        })
+    logger.info("Created Razorpay order %s for booking #%s", order['id'], booking.id)
+
+    booking.payment_id = order['id']
+    booking.payment_amount = amount_in_paisa
+    Booking.objects.filter(pk=booking.pk).update(payment_id=booking.payment_id, payment_amount=amount_in_paisa)
+    return booking.payment_id
+
+
+@timed('razorpay')
+def verify_payment_signature(order_id, payment_id, signature):
+    """Local HMAC check; raises razorpay.errors.SignatureVerificationError."""
+    get_client().utility.verify_payment_signature({
+        'razorpay_order_id': order_id,
+        'razorpay_payment_id': payment_id,
+        'razorpay_signature': signature
+    })
@@ -0,0 +1,266 @@
+"""
+Opt-in per-request profiling.
+
+With REQUEST_PROFILING on, ProfilingMiddleware profiles a request that
+opts in, made by an admin or by a user with `profile_requests` set. A
+request opts in with an `X-Profile` header, or a `?profile=` flag, which
+also sets a `profile` cookie so the rest of the session is profiled until
+`?profile=0`. `cprofile` as the value also runs the request under cProfile
+(WSGI only; under ASGI the view runs on another thread than the profiler).
+The user is only looked up for requests that opt in: others cost nothing.
+
+A profile records every SQL query with its duration, flags statements run
+more than once (usually an N+1, or a lookup that should be cached), and
+totals the time spent in the hot paths wrapped with `timed()`: bill
+calculation, PDF rendering, Razorpay calls, email sending and template
+rendering. The last REQUEST_PROFILING_BUFFER profiles are kept in memory
+per process and listed for admins on the request_profiles page.
+
+Requests that aren't profiled pay one context variable lookup per query
+and per timed call.
+"""
+import cProfile
+import functools
+import io
+import itertools
+import pstats
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.mail import EmailMessage
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.utils import timezone
+
+_current = ContextVar('request_profile', default=None)
+_buffer = deque(maxlen=settings.REQUEST_PROFILING_BUFFER)
+_buffer_lock = threading.Lock()
+_ids = itertools.count(1)
+COOKIE = 'profile'  # Also the query flag
+_installed = False
+_install_lock = threading.Lock()
+
+
+def is_admin(user):
+    return user.is_authenticated and (user.role == 'admin' or user.is_superuser)
+
+
+class Profile:
+    def __init__(self, request, user):
+        self.id = next(_ids)
+        self.method = request.method
+        self.path = request.get_full_path()
+        self.username = user.get_username()
+        self.at = timezone.now()
+        self.queries = []  # (sql, ms, params key)
+        self.timers = {}  # name -> [calls, ms]
+        self.status = None
+        self.duration_ms = None
+        self.cprofile = ''
+        self._open = set()
+        self._started = time.perf_counter()
+
+    def finish(self, response, profiler=None):
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+        self.status = response.status_code
+        if profiler is not None:
+            stream = io.StringIO()
+            stats = pstats.Stats(profiler, stream=stream).sort_stats('cumulative')
+            stats.print_stats(settings.REQUEST_PROFILING_CPROFILE_LINES)
+            self.cprofile = stream.getvalue()
+        with _buffer_lock:
+            _buffer.append(self)
+        response['X-Profile-Id'] = str(self.id)
+
+    @property
+    def sql_ms(self):
+        return sum(ms for _, ms, _ in self.queries)
+
+    @property
+    def repeated(self):
+        """[(sql, times run, times with identical parameters)] for statements run more than once."""
+        shapes = Counter(sql for sql, _, _ in self.queries)
+        exact = Counter((sql, key) for sql, _, key in self.queries if key is not None)
+        identical = Counter()
+        for (sql, _), count in exact.items():
+            identical[sql] += count - 1
+        return sorted(
+            ((sql, count, identical[sql]) for sql, count in shapes.items() if count > 1),
+            key=lambda row: -row[1]
+        )
+
+    @property
+    def timer_rows(self):
+        return sorted(((name, calls, ms) for name, (calls, ms) in self.timers.items()), key=lambda row: -row[2])
+
+
+def recent():
+    """Buffered profiles, newest first."""
+    with _buffer_lock:
+        return list(reversed(_buffer))
+
+
+def get(profile_id):
+    with _buffer_lock:
+        return next((profile for profile in _buffer if profile.id == profile_id), None)
+
+
+class timed:
+    """
+    Add the time spent in a block, or in every call of a decorated function,
+    to the current request's profile under `name`. Nested blocks with the
+    same name (e.g. included templates) are counted once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = _current.get()
+        self.started = None
+        if self.profile is not None and self.name not in self.profile._open:
+            self.profile._open.add(self.name)
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.started is not None:
+            calls_ms = self.profile.timers.setdefault(self.name, [0, 0.0])
+            calls_ms[0] += 1
+            calls_ms[1] += (time.perf_counter() - self.started) * 1000
+            self.profile._open.discard(self.name)
+        return False
+
+    def __call__(self, func):
+        name = self.name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        key = None if many else repr(params)
+        profile.queries.append((sql, (time.perf_counter() - started) * 1000, key))
+
+
+def _instrument(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install():
+    """Hook the framework code we can't decorate in place, once per process."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        Template.render = timed('template')(Template.render)
+        EmailMessage.send = timed('email')(EmailMessage.send)
+        # Connections are per thread; new ones are instrumented as they connect
+        connection_created.connect(_instrument)
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection=connection)
+        _installed = True
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        _install()
+
+    @staticmethod
+    def _requested(request):
+        """The opt-in value of the header, query flag or cookie, or '' (checked before the user is loaded)."""
+        return (
+            request.headers.get('X-Profile') or request.GET.get(COOKIE) or request.COOKIES.get(COOKIE) or ''
+        ).lower()
+
+    @staticmethod
+    def _mode(requested, user):
+        """None, 'sql' or 'cprofile'."""
+        if requested in ('', '0') or not user.is_authenticated:
+            return None
+        if not (user.profile_requests or is_admin(user)):
+            return None
+        return 'cprofile' if requested == 'cprofile' else 'sql'
+
+    @staticmethod
+    def _remember(request, response, allowed):
+        """Keep (or stop) profiling the session after a `?profile=` flag."""
+        flag = request.GET.get(COOKIE, '').lower()
+        if allowed and flag not in ('', '0'):
+            response.set_cookie(COOKIE, flag, httponly=True, samesite='Lax')
+        elif COOKIE in request.COOKIES and (not allowed or COOKIE in request.GET):
+            response.delete_cookie(COOKIE)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        requested = self._requested(request)
+        mode = self._mode(requested, request.user) if requested else None
+        if mode is None:
+            response = self.get_response(request)
+            if requested:
+                self._remember(request, response, allowed=False)
+            return response
+
+        profile = Profile(request, request.user)
+        profiler = cProfile.Profile() if mode == 'cprofile' else None
+        token = _current.set(profile)
+        try:
+            if profiler is not None:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish(response, profiler)
+        self._remember(request, response, allowed=True)
+        return response
+
+    async def __acall__(self, request):
+        requested = self._requested(request)
+        if not requested:
+            return await self.get_response(request)
+        # Load request.user on the sync thread: request.auser() caches separately,
+        # so the (usually sync) view would query the user a second time
+        await sync_to_async(lambda: request.user.is_authenticated)()
+        user = request.user
+        if self._mode(requested, user) is None:
+            response = await self.get_response(request)
+            self._remember(request, response, allowed=False)
+            return response
+
+        profile = Profile(request, user)
+        token = _current.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        profile.finish(response)
+        self._remember(request, response, allowed=True)
+        return response
@@ -0,0 +1,105 @@
+"""
+Booking engine.
+
+Every booking is saved and its nights claimed in one transaction. The
+unique (room, date) constraint on RoomNight decides races: whichever
+transaction loses gets RoomUnavailable instead of a double-sold room,
+without locking whole tables or serialising requests.
+
+Online guest bookings are taken as holds that lapse after
+BOOKING_HOLD_MINUTES unless paid; lapsed holds are reclaimed in bulk, by
+`run_jobs` every BOOKING_HOLD_SWEEP_INTERVAL and for a room before it is
+reserved. A
+lapsed hold is Canceled but keeps its hold_expires_at, which is how
+confirm() tells it from a booking canceled on purpose: saving a booking as
+Canceled clears hold_expires_at (see core.signals).
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, RoomNight
+
+
+class RoomUnavailable(Exception):
+    """The room is already taken for at least one night of the stay."""
+
+
+class BookingCanceled(Exception):
+    """The booking was canceled by the guest or by reception; it can't be confirmed."""
+
+
+def release_expired_holds(room=None):
+    """
+    Cancel unpaid bookings whose hold has lapsed and free their nights.
+    Returns the number of holds released.
+    """
+    expired = Booking.objects.filter(
+        status='Pending',
+        is_paid=False,
+        hold_expires_at__lt=timezone.now()
+    )
+    if room is not None:
+        expired = expired.filter(room=room)
+
+    with transaction.atomic():
+        ids = list(expired.values_list('id', flat=True))
+        if ids:
+            RoomNight.objects.filter(booking_id__in=ids).delete()
+            Booking.objects.filter(id__in=ids).update(status='Canceled')
+    return len(ids)
+
+
+def reserve(booking, save_m2m=None, hold=False):
+    """
+    Save the booking and claim all of its nights atomically.
+
+    `save_m2m` is the bound form.save_m2m for bookings built with commit=False.
+    With `hold=True` the booking lapses unless paid within BOOKING_HOLD_MINUTES.
+    Raises RoomUnavailable if any night of an active booking is already
+    taken; nothing is saved then. Other statuses (e.g. a walk-in recorded as
+    Checked Out) hold no nights.
+    """
+    release_expired_holds(booking.room)
+
+    if hold:
+        booking.hold_expires_at = timezone.now() + timedelta(minutes=settings.BOOKING_HOLD_MINUTES)
+
+    adding = booking._state.adding
+    try:
+        with transaction.atomic():
+            booking.save()  # post_save claims the nights, raising RoomUnavailable if any is taken
+            if save_m2m:
+                save_m2m()
+    except (RoomUnavailable, IntegrityError) as exc:
+        if adding:
+            booking.pk = None
+            booking._state.adding = True
+        if isinstance(exc, RoomUnavailable):
+            raise
+        raise RoomUnavailable(f"Room {booking.room.room_number} is already booked for the selected dates.") from exc
+
+    return booking
+
+
+def confirm(booking):
+    """
+    Turn a paid hold into a firm booking. A hold that lapsed before the
+    payment arrived is re-claimed if the room is still free; otherwise
+    RoomUnavailable is raised and the caller must arrange a refund.
+    A booking canceled on purpose raises BookingCanceled.
+    """
+    lapsed = booking.status == 'Canceled' and booking.hold_expires_at is not None
+    if booking.status == 'Canceled' and not lapsed:
+        raise BookingCanceled(f"Booking {booking.pk} was canceled.")
+    booking.hold_expires_at = None
+
+    if lapsed:
+        booking.status = 'Pending'
+        return reserve(booking)
+
+    with transaction.atomic():
+        booking.save()  # With its RoomNight rows (post_save), or not at all
+    return booking
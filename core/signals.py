@@ -1,62 +1,139 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.apps import apps
 from django.contrib.auth import get_user_model
-from .models import Booking, Notification
+from django.db import transaction
+from . import catalog, counters, events, images, jobs, metrics
+from .models import Amenity, Booking, ContactMessage, GuestProfile, Notification, Room, RoomImage, SpaService
+from .utils import notify_if_inventory_low, notify_roles, sync_room_nights
 
 User = get_user_model()
 
 
 @receiver(post_save, sender=apps.get_model('core', 'InventoryItem'))
 def check_inventory_threshold(sender, instance, **kwargs):
-    Notification = apps.get_model('core', 'Notification')  # ✅ lazy import
-    if instance.quantity < instance.threshold:
-        existing = Notification.objects.filter(
-            user__role='manager',
-            message__icontains=instance.name,
-            is_read=False
-        )
-        if existing.exists():
-            return
-
-        for manager in User.objects.filter(role='manager'):
-            Notification.objects.create(
-                user=manager,
-                message=f"⚠️ Inventory low: '{instance.name}' has only {instance.quantity} left."
-            )
+    notify_if_inventory_low(instance)
 
 
 @receiver(post_save, sender=apps.get_model('core', 'Booking'))
 def notify_staff_on_booking_created(sender, instance, created, **kwargs):
-    Notification = apps.get_model('core', 'Notification')  # ✅ lazy import
     if created:
-        target_roles = ['receptionist', 'housekeeping']
-        message = f"🛎️ New booking: Room {instance.room.room_number} booked by {instance.user.username}."
-
-        existing = Notification.objects.filter(
-            message=message,
-            is_read=False
+        notify_roles(
+            ['receptionist', 'housekeeping'],
+            f"🛎️ New booking: Room {instance.room.room_number} booked by {instance.user.username}."
         )
-        if existing.exists():
-            return
 
-        for staff in User.objects.filter(role__in=target_roles):
-            Notification.objects.create(
-                user=staff,
-                message=message
-            )
+@receiver(post_save, sender=Booking)
+def update_room_nights(sender, instance, **kwargs):
+    # Created, rescheduled, canceled, checked out or No-Show: keep the occupancy index current
+    sync_room_nights(instance)
+
 
 @receiver(post_save, sender=Booking)
 def notify_housekeeping_on_checkout(sender, instance, **kwargs):
     if instance.status == 'Checked Out' and instance.needs_cleaning:
-        message = f"🧹 Room {instance.room.room_number} needs cleaning after checkout."
+        # Skipped while an identical message is still unread
+        notify_roles(['housekeeping'], f"🧹 Room {instance.room.room_number} needs cleaning after checkout.")
+
+
+@receiver(pre_save, sender=Booking)
+def forget_hold_on_cancel(sender, instance, **kwargs):
+    # Lapsed holds are canceled with update() and keep hold_expires_at; any
+    # cancellation saved through the model is deliberate and mustn't look lapsed
+    if instance.status == 'Canceled':
+        instance.hold_expires_at = None
+
+
+@receiver(pre_save, sender=Booking)
+def invalidate_bill_on_reschedule(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if instance._state.adding:
+        instance._bill_inputs = instance.bill_inputs()
+        return
+    # Without the inputs it was loaded with (deferred room or dates), assume they changed
+    loaded = getattr(instance, '_bill_inputs', None)
+    if loaded is None or loaded != instance.bill_inputs():
+        instance.bill_snapshot = None
+        if update_fields is not None and 'bill_snapshot' not in update_fields:
+            Booking.objects.filter(pk=instance.pk).update(bill_snapshot=None)
+    instance._bill_inputs = instance.bill_inputs()
+
+
+@receiver(m2m_changed, sender=Booking.amenities.through)
+@receiver(m2m_changed, sender=Booking.spa_services.through)
+def invalidate_bill_on_extras_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        instance.bill_snapshot = None
+        Booking.objects.filter(pk=instance.pk).update(bill_snapshot=None)
+    elif pk_set:
+        Booking.objects.filter(pk__in=pk_set).update(bill_snapshot=None)
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        # After commit: a rolled-back notification mustn't leave the badge counting it
+        transaction.on_commit(lambda: counters.notifications_added([instance.user_id]))
 
-        # Avoid duplicate unread messages
-        if Notification.objects.filter(message=message, is_read=False).exists():
-            return
 
-        for housekeeper in User.objects.filter(role='housekeeping'):
-            Notification.objects.create(
-                user=housekeeper,
-                message=message
-            )
\ No newline at end of file
+@receiver(post_save, sender=Notification)
+def count_notification_sent(sender, instance, created, **kwargs):
+    if created:
+        metrics.NOTIFICATIONS_SENT.inc()
+
+
+@receiver(post_save, sender=Notification)
+def publish_new_notification(sender, instance, created, **kwargs):
+    if created:
+        # After commit, so the woken stream can read the row
+        transaction.on_commit(lambda: events.publish([instance.user_id]))
+
+
+@receiver(post_save, sender=ContactMessage)
+def count_new_contact_message(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        transaction.on_commit(counters.contact_message_added)
+
+
+
+@receiver([post_save, post_delete], sender=Room)
+@receiver([post_save, post_delete], sender=Amenity)
+@receiver([post_save, post_delete], sender=SpaService)
+@receiver([post_save, post_delete], sender=RoomImage)
+@receiver(m2m_changed, sender=Room.amenities.through)
+@receiver(m2m_changed, sender=Room.spa_services.through)
+def invalidate_room_catalog(sender, action=None, update_fields=None, **kwargs):
+    if action is not None and not action.startswith('post_'):
+        return
+    if update_fields and sender is Room and update_fields <= catalog.OPERATIONAL_FIELDS:
+        return  # Check-in/out bookkeeping: nothing the catalog holds changed
+    # Now, for the rest of this transaction, and again on commit: another
+    # process may have rebuilt the catalog from the rows as they were before
+    catalog.invalidate()
+    transaction.on_commit(catalog.invalidate)
+
+
+@receiver(pre_save, sender=Room)
+@receiver(pre_save, sender=RoomImage)
+@receiver(pre_save, sender=Booking)
+@receiver(pre_save, sender=GuestProfile)
+def note_new_uploads(sender, instance, **kwargs):
+    # Still uncommitted here: the field writes the upload to storage after this signal
+    instance._new_uploads = [
+        field for field in images.IMAGE_FIELDS[sender._meta.label]
+        if getattr(instance, field) and not getattr(instance, field)._committed
+    ]
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_save, sender=RoomImage)
+@receiver(post_save, sender=Booking)
+@receiver(post_save, sender=GuestProfile)
+def queue_image_renditions(sender, instance, **kwargs):
+    for field in getattr(instance, '_new_uploads', ()):
+        jobs.enqueue('make_image_renditions', model=sender._meta.label, field=field, path=getattr(instance, field).name)
+    instance._new_uploads = []
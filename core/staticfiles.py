@@ -0,0 +1,159 @@
+"""
+Static files: content-hashed names, precompressed variants, cached for good.
+
+`manage.py collectstatic` copies every asset to STATIC_ROOT through
+CompressedManifestStaticFilesStorage. Each file is also stored under a
+content-hashed name (css/base.3f2a9c1b0e4d.css) with url() references in CSS
+rewritten to hashed names, and staticfiles.json maps names to hashed names
+for `{% static %}`. Text assets then get .gz, and with the `brotli` package
+installed .br, siblings when compression saves at least 5%.
+
+StaticFilesMiddleware serves STATIC_ROOT ahead of sessions and auth. Hashed
+names, whose content can never change, are sent with a year's `immutable`
+Cache-Control, so repeat page loads don't request them at all; other names
+get STATIC_MAX_AGE and revalidate against a strong ETag. The smallest
+variant the client accepts is sent, with `Vary: Accept-Encoding`. Behind
+nginx, serve STATIC_ROOT directly with `gzip_static on` (and
+`brotli_static on`) instead.
+
+With DEBUG on, `{% static %}` links unhashed names and `runserver` serves
+them from the app directories as before.
+"""
+import gzip
+import mimetypes
+import os
+import posixpath
+from urllib.parse import unquote
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are written
+    brotli = None
+
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.otf', '.eot'}
+MIN_SAVING = 0.05
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))  # In order of preference
+
+
+def compress(data):
+    """{extension: compressed bytes} worth keeping for `data`."""
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    return {
+        extension: content for extension, content in variants.items()
+        if len(content) <= len(data) * (1 - MIN_SAVING)
+    }
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # A template naming a file that wasn't collected links it unhashed rather than failing the page
+    manifest_strict = False
+
+    def url(self, name, force=False):
+        try:
+            return super().url(name, force)
+        except ValueError:
+            return FileSystemStorage.url(self, name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE or not self.exists(name):
+                continue
+            with self.open(name) as source:
+                variants = compress(source.read())
+            for extension in ('.gz', '.br'):
+                self.delete(name + extension)  # Stale from an earlier build
+                if extension in variants:
+                    self._save(name + extension, ContentFile(variants[extension]))
+                    yield name, name + extension, True
+
+
+def _accepted(header):
+    codings = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            codings.add(coding.strip().lower())
+    return codings
+
+
+class StaticFilesMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.STATIC_ROOT or not settings.STATIC_URL.startswith('/'):
+            raise MiddlewareNotUsed  # Nothing collected, or served from another host
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.root = os.fspath(settings.STATIC_ROOT)
+        # Collected before this process started; a new build needs a restart, as for code
+        self.immutable = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return self.serve(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        # A stat() and an open(): cheaper inline than a hop to the sync thread
+        return self.serve(request) or await self.get_response(request)
+
+    def serve(self, request):
+        """The response for a collected static file, or None to pass the request on."""
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return None
+        name = posixpath.normpath(unquote(request.path[len(self.prefix):])).lstrip('/')
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        source, encoding, variants = path, None, False
+        accepted = _accepted(request.headers.get('Accept-Encoding', ''))
+        for coding, extension in ENCODINGS:
+            if os.path.isfile(path + extension):
+                variants = True
+                if encoding is None and coding in accepted:
+                    source, encoding = path + extension, coding
+        stat = os.stat(source)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'  # Per variant: each is a different representation
+        last_modified = int(stat.st_mtime)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = FileResponse(open(source, 'rb'), content_type=content_type, filename=posixpath.basename(name))
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if name in self.immutable:
+            response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response['Cache-Control'] = f'public, max-age={settings.STATIC_MAX_AGE}'
+        if variants:
+            response['Vary'] = 'Accept-Encoding'
+        return response
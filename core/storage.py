@@ -0,0 +1,180 @@
+"""
+Content-addressed storage for uploaded images: room photos and ID proofs.
+
+An upload is streamed through SHA-256 into a temporary file and kept as
+<upload_to>/<first two hex digits>/<digest><extension>. However often the
+same bytes are uploaded, and whatever they are called, they are stored
+once and every row that uploaded them names the same blob. Blobs are keyed
+by directory as well as content, so an ID proof never shares a file (or a
+URL) with a public room photo.
+
+A blob's reference count is the number of rows whose image fields name it,
+counted by the database (reference_counts()) rather than kept in a counter
+that queryset updates and deletes would skip. Blobs are therefore never
+deleted through a field: `delete()` does nothing, and `manage.py gc_media`
+removes blobs, with their renditions, once nothing references them and they
+are older than MEDIA_GC_GRACE (an upload is stored before its row commits).
+"""
+import contextlib
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import Count
+
+from . import images
+
+BLOB_NAME = re.compile(r'^(?:[\w-]+/)*[0-9a-f]{2}/[0-9a-f]{64}(?:\.\w+)?$')
+TEMP_PREFIX = '.upload-'
+
+
+def is_blob(name):
+    """Whether a stored name is a content address (and its content can never change)."""
+    return bool(BLOB_NAME.match(name))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def get_available_name(self, name, max_length=None):
+        # _save() names the file after its content: an existing blob is reused, never renamed
+        return name
+
+    def _save(self, name, content):
+        directory, extension = os.path.dirname(name), os.path.splitext(name)[1].lower()
+        os.makedirs(self.path(directory), exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(prefix=TEMP_PREFIX, dir=self.path(directory))
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            hexdigest = digest.hexdigest()
+            name = f'{directory}/{hexdigest[:2]}/{hexdigest}{extension}'
+            path = self.path(name)
+            if os.path.exists(path):
+                os.utime(path)  # A new reference: restart the GC grace period
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+                os.replace(temp_path, path)  # Atomic: a concurrent upload of the same bytes writes the same file
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_path)
+        return name
+
+    def delete(self, name):
+        """Blobs may be shared; unreferenced ones are removed by purge() from `manage.py gc_media`."""
+
+    def purge(self, name):
+        super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def image_fields():
+    """[(model, field name)] for every field stored here."""
+    return [
+        (apps.get_model(label), field)
+        for label, fields in images.IMAGE_FIELDS.items() for field in fields
+    ]
+
+
+def reference_counts():
+    """{stored name: rows referencing it} over every image field."""
+    counts = Counter()
+    for model, field in image_fields():
+        rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).order_by()
+        for name, references in rows.values_list(field).annotate(references=Count('pk')):
+            counts[name] += references
+    return counts
+
+
+def _upload_dirs():
+    return sorted({model._meta.get_field(field).upload_to.strip('/') for model, field in image_fields()})
+
+
+def _remove_renditions(name, dry_run):
+    """Bytes held by the renditions of `name`, removed unless `dry_run`."""
+    directory = blob_storage.path(f'{images.ROOT}/{name}')
+    size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()) if os.path.isdir(directory) else 0
+    if size and not dry_run:
+        shutil.rmtree(directory, ignore_errors=True)
+    return size
+
+
+def collect_garbage(grace=None, dry_run=False):
+    """
+    Delete stored images (blobs, files uploaded before content addressing,
+    and abandoned temporary uploads) that no row references and that are
+    older than `grace` seconds, with their renditions, and renditions whose
+    source is gone. Returns (files, bytes) removed, or that would be with
+    `dry_run`.
+    """
+    if grace is None:
+        grace = settings.MEDIA_GC_GRACE
+    referenced = set(reference_counts())
+    cutoff = time.time() - grace
+    removed_files = removed_bytes = 0
+
+    for directory in _upload_dirs():
+        for dirpath, _, filenames in os.walk(blob_storage.path(directory), topdown=False):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, blob_storage.location).replace(os.sep, '/')
+                if name in referenced:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime >= cutoff:
+                    continue
+                if not dry_run:
+                    blob_storage.purge(name)
+                removed_files += 1
+                removed_bytes += stat.st_size + _remove_renditions(name, dry_run)
+            if not dry_run and dirpath != blob_storage.path(directory):
+                with contextlib.suppress(OSError):
+                    os.rmdir(dirpath)  # Only succeeds once a hash directory is empty
+
+    # Renditions left behind by sources removed some other way
+    root = blob_storage.path(images.ROOT)
+    for dirpath, _, filenames in os.walk(root):
+        name = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        if filenames and name not in referenced and not blob_storage.exists(name):
+            removed_bytes += _remove_renditions(name, dry_run)
+
+    return removed_files, removed_bytes
+
+
+def adopt_legacy():
+    """
+    Move images stored before content addressing into blobs and point their
+    rows at them; the old files are left for collect_garbage(). Returns
+    (files adopted, distinct blobs they became).
+    """
+    adopted = {}  # Old name -> blob
+    for model, field in image_fields():
+        names = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+        for name in list(names.values_list(field, flat=True).distinct()):
+            if is_blob(name):
+                continue
+            if name not in adopted:
+                if not blob_storage.exists(name):
+                    continue
+                with blob_storage.open(name, 'rb') as source:
+                    adopted[name] = blob_storage.save(name, source)
+                old, new = blob_storage.path(f'{images.ROOT}/{name}'), blob_storage.path(f'{images.ROOT}/{adopted[name]}')
+                if os.path.isdir(old) and not os.path.exists(new):
+                    os.makedirs(os.path.dirname(new), exist_ok=True)
+                    shutil.copytree(old, new)
+            model.objects.filter(**{field: name}).update(**{field: adopted[name]})
+    return len(adopted), len(set(adopted.values()))
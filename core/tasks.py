@@ -0,0 +1,74 @@
+"""
+Job handlers for work deferred out of request/response (see core.jobs).
+"""
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from . import images, metrics
+from .invoices import invoice_pdf_bytes
+from .jobs import job
+from .models import Booking
+from .utils import calculate_bill, notify_roles
+
+
+@job('notify_payment_received')
+def notify_payment_received(booking_id):
+    booking = Booking.objects.select_related('room', 'user').get(id=booking_id)
+    notify_roles(
+        ['receptionist'],
+        f"💰 Payment received for Booking #{booking.id} (Room {booking.room.room_number}) by {booking.user.username}."
+    )
+
+
+@job('send_booking_confirmation')
+def send_booking_confirmation(booking_id):
+    # Claim the email first, so a second run of this job (a requeued or stalled worker) sends nothing.
+    # A worker dying mid-send loses the email rather than sending it twice.
+    claimed = Booking.objects.filter(id=booking_id, confirmation_sent_at__isnull=True).update(
+        confirmation_sent_at=timezone.now()
+    )
+    if not claimed:
+        return
+    try:
+        _send_booking_confirmation(booking_id)
+    except Exception:
+        Booking.objects.filter(id=booking_id).update(confirmation_sent_at=None)  # Let the retry send it
+        raise
+
+
+def _send_booking_confirmation(booking_id):
+    booking = Booking.objects.select_related('room', 'user').get(id=booking_id)
+    bill = calculate_bill(booking)
+
+    email_body = render_to_string("core/booking_email.html", {
+        "booking": booking,
+        "user": booking.user,
+        "total": bill['total'],
+        "breakdown": bill,
+    })
+
+    email = EmailMessage(
+        subject=f"🎉 Booking Confirmed - Room {booking.room.room_number} | Royal Crest",
+        body=email_body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[booking.user.email],
+    )
+    # A render failure raises, so the job is retried rather than mailing without the invoice
+    email.attach(f"invoice_booking_{booking.id}.pdf", invoice_pdf_bytes(booking, bill), "application/pdf")
+    email.content_subtype = "html"
+    started = time.perf_counter()
+    email.send()
+    metrics.EMAIL_SEND_SECONDS.observe(time.perf_counter() - started)
+
+
+@job('make_image_renditions')
+def make_image_renditions(model, field, path):
+    if images.has_renditions(path):
+        return  # Content-addressed: a re-upload of the same bytes already has them
+    storage = apps.get_model(model)._meta.get_field(field).storage
+    images.make_renditions(path, storage)
@@ -0,0 +1,11 @@
+from django import template
+
+from .. import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(image, sizes='100vw', alt='', **attrs):
+    """{% picture room_image.image sizes="33vw" class="card-img-top" %}; see core.images.picture."""
+    return images.picture(image, sizes, alt, **attrs)
@@ -1,3 +1,1425 @@
-from django.test import TestCase
+import asyncio
+import concurrent.futures
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+from unittest import mock
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import Image
+
+from . import catalog, counters, events, images, invoices, jobs, metrics, payments, reservations, tasks, urls
+from .forms import ReceptionistBookingForm
+from .pagination import _decode, _encode, paginate
+from .utils import calculate_bill, find_flexible_stays, notify_roles, rooms_available_between
+from .storage import blob_storage, collect_garbage, is_blob
+from .models import (
+    Amenity,
+    Booking,
+    ContactMessage,
+    Feedback,
+    InventoryItem,
+    InventoryUsageLog,
+    Job,
+    Maintenance,
+    Notification,
+    Room,
+    RoomImage,
+    RoomNight,
+    SpaService,
+    StaffAttendance,
+    StaffSalary,
+)
+
+User = get_user_model()
+
+
+# ---------------------
+# Query Budgets
+# ---------------------
+# Every page is rendered against a seeded dataset, then again after the
+# dataset has doubled. A page whose query count grows with the data has an
+# N+1 somewhere (usually a template dereferencing a relation per row).
+#
+# url name -> (role to log in as, None for anonymous; kwargs or a callable
+# taking the test case; query string)
+BUDGETED = {
+    'home': (None, {}, ''),
+    'login': (None, {}, ''),
+    'register': (None, {}, ''),
+    'about_us': (None, {}, ''),
+    'contact': (None, {}, ''),
+    'password_reset': (None, {}, ''),
+    'password_reset_done': (None, {}, ''),
+    'password_reset_complete': (None, {}, ''),
+
+    'room_list': ('manager', {}, ''),
+    'room_create': ('manager', {}, ''),
+    'room_update': ('manager', lambda t: {'pk': t.room.pk}, ''),
+    'room_delete': ('manager', lambda t: {'pk': t.room.pk}, ''),
+    'available_rooms': ('guest', {}, 'stay'),
+
+    'booking_list': ('manager', {}, ''),
+    'booking_create': ('guest', {}, ''),
+    'book_room': ('guest', lambda t: {'room_id': t.room.pk}, 'stay'),
+    'book_room_type': ('guest', {'room_type': 'Single'}, 'stay'),
+
+    'admin_dashboard': ('admin', {}, ''),
+    'request_profiles': ('admin', {}, ''),
+    'metrics': (None, {}, ''),
+    'manager_dashboard': ('manager', {}, ''),
+    'receptionist_dashboard': ('receptionist', {}, ''),
+    'housekeeping_dashboard': ('housekeeping', {}, ''),
+    'guest_dashboard': ('guest', {}, 'stay'),
+
+    'guest_booking_create': ('guest', {}, ''),
+    'guest_bookings': ('guest', {}, ''),
+    'receptionist_booking_create': ('receptionist', {}, ''),
+    'receptionist_bookings': ('receptionist', {}, ''),
+    'receptionist_booking_list': ('receptionist', {}, ''),
+    'payment_list': ('manager', {}, ''),
+    'walkin_booking': ('receptionist', {}, ''),
+
+    'cleaned_rooms_history': ('housekeeping', {}, ''),
+    'maintenance_create': ('manager', {}, ''),
+    'maintenance_list': ('manager', {}, ''),
+
+    'inventory_list': ('manager', {}, ''),
+    'inventory_create': ('manager', {}, ''),
+    'log_inventory_usage': ('manager', {}, ''),
+    'inventory_edit': ('manager', lambda t: {'pk': t.item.pk}, ''),
+
+    'booking_payment': ('guest', lambda t: {'booking_id': t.booking.pk}, ''),
+    'invoice_view': ('guest', lambda t: {'booking_id': t.booking.pk}, ''),
+
+    'submit_feedback': ('guest', lambda t: {'booking_id': t.booking.pk}, ''),
+    'feedback_list': ('manager', {}, ''),
+
+    'assign_salary': ('manager', {}, ''),
+    'mark_attendance': ('manager', {}, ''),
+    'salary_report': ('manager', {}, ''),
+    'staff_mark_attendance': ('receptionist', {}, ''),
+    'staff_mark_own_attendance': ('receptionist', {}, ''),
+    'attendance_list': ('manager', {}, ''),
+
+    'all_notifications': ('manager', {}, ''),
+    'notification_stream': ('receptionist', {}, ''),
+    'contact_messages_list': ('manager', {}, ''),
+}
+
+# url name -> why it is not rendered here
+NOT_BUDGETED = {
+    'logout': "ends the session",
+    'booking_check_in': "POST-only state change",
+    'booking_check_out': "POST-only state change",
+    'cancel_booking': "changes state on GET",
+    'booking_cancel': "changes state on GET",
+    'mark_cleaned': "POST-only state change",
+    'maintenance_mark_completed': "POST-only state change",
+    'mark_notifications_read': "POST-only state change",
+    'razorpay_payment': "creates an order on the payment gateway",
+    'payment_success': "gateway callback, POST-only",
+    'download_invoice': "served from the rendered-PDF file cache after the first hit",
+    'password_reset_confirm': "needs a live reset token",
+    'request_profile': "needs a profile in the in-memory buffer",
+}
+
+
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            role: User.objects.create_user(username=f'{role}-user', password='x', role=role)
+            for role in ['admin', 'manager', 'receptionist', 'housekeeping', 'guest']
+        }
+        cls.amenity = Amenity.objects.create(name='Breakfast', price=300)
+        cls.spa = SpaService.objects.create(name='Massage', price=1500)
+        cls.item = InventoryItem.objects.create(name='Towels', quantity=100, threshold=10)
+        cls.room = cls.seed_room('R-0')
+        cls.booking = Booking.objects.create(
+            user=cls.users['guest'], room=cls.room,
+            check_in=date.today() + timedelta(days=400), check_out=date.today() + timedelta(days=402),
+        )
+        cls.seeded = 0
+
+    @classmethod
+    def seed_room(cls, number):
+        room = Room.objects.create(room_number=number, room_type='Single', price_per_night=1000, needs_cleaning=True)
+        room.amenities.add(cls.amenity)
+        room.spa_services.add(cls.spa)
+        RoomImage.objects.create(room=room, image=f'room_images/{number}.jpg')
+        return room
+
+    def seed(self, count):
+        """Add `count` more of every kind of row the pages list."""
+        guest, manager = self.users['guest'], self.users['manager']
+        for _ in range(count):
+            self.seeded += 1
+            n = self.seeded
+            room = self.seed_room(f'R-{n}')
+            other_guest = User.objects.create_user(username=f'guest-{n}', password='x', role='guest')
+            staff = User.objects.create_user(username=f'staff-{n}', password='x', role='housekeeping')
+            start = date.today() - timedelta(days=30 + n * 4)
+
+            # A past stay cleaned by staff, one awaiting housekeeping and an upcoming one
+            stays = [
+                (guest, 'Checked Out', start, staff),
+                (other_guest, 'Checked Out', start + timedelta(days=2), None),
+                (other_guest, 'Pending', date.today() + timedelta(days=n * 3), None),
+            ]
+            for user, status, check_in, cleaned_by in stays:
+                booking = Booking.objects.create(
+                    user=user, room=room, status=status, is_paid=True,
+                    check_in=check_in, check_out=check_in + timedelta(days=1),
+                    cleaned_by=cleaned_by, cleaned_at=timezone.now() if cleaned_by else None,
+                )
+                booking.amenities.add(self.amenity)
+                Feedback.objects.create(
+                    user=user, booking=booking, rating=4, cleanliness_rating=4,
+                    service_rating=4, facilities_rating=4,
+                )
+
+            Maintenance.objects.create(room=room, issue='Leaking tap', scheduled_date=date.today() - timedelta(days=n), is_completed=True)
+            InventoryUsageLog.objects.create(item=self.item, room=room, used_by=staff, quantity_used=1)
+            StaffSalary.objects.create(user=staff, daily_rate=800, assigned_by=manager)
+            StaffAttendance.objects.create(user=staff, date=date.today() - timedelta(days=n), present=True)
+            ContactMessage.objects.create(name='Visitor', email='v@example.com', subject='Hi', message='Hello')
+            for user in self.users.values():
+                Notification.objects.create(user=user, message=f'Notice {n}')
+
+    def url_for(self, name):
+        role, kwargs, query = BUDGETED[name]
+        if callable(kwargs):
+            kwargs = kwargs(self)
+        url = reverse(name, kwargs=kwargs)
+        if query == 'stay':
+            check_in = date.today() + timedelta(days=200)
+            url += f'?check_in={check_in}&check_out={check_in + timedelta(days=2)}'
+        return role, url
+
+    def count_queries(self, name):
+        role, url = self.url_for(name)
+        self.client.logout()
+        if role:
+            self.client.force_login(self.users[role])
+
+        # Measure the second hit: caches, bill snapshots and read flags are warm
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertLess(response.status_code, 500, f"{name} ({url}) failed")
+        return len(captured), response
+
+    def test_every_url_has_a_budget(self):
+        names = {p.name for p in urls.urlpatterns if isinstance(p, URLPattern) and p.name}
+        self.assertEqual(names - set(BUDGETED) - set(NOT_BUDGETED), set())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.seed(3)
+        small = {name: self.count_queries(name)[0] for name in BUDGETED}
+        self.seed(3)
+
+        for name in BUDGETED:
+            with self.subTest(name):
+                queries, response = self.count_queries(name)
+                self.assertEqual(
+                    queries, small[name],
+                    f"{name} ran {small[name]} queries with 3 rows of each kind and {queries} with 6"
+                )
+
+
+# ---------------------
+# Index Plans
+# ---------------------
+# The hot filters and the indexes that answer them (see the Meta.indexes in
+# core.models). A query whose plan goes back to reading its whole table
+# fails here, long before the table is big enough for anyone to notice.
+#
+# name -> (table, queryset taking the test case, indexes the plan may use)
+HOT_QUERIES = {
+    'room_stay_overlap': ('core_booking', lambda t: Booking.objects.filter(
+        room=t.room, status__in=Booking.ACTIVE_STATUSES, check_in__lt=t.today + timedelta(days=3), check_out__gt=t.today,
+    ), {'booking_room_stay_idx'}),
+    'guest_booking_history': ('core_booking', lambda t: Booking.objects.filter(
+        user=t.guest,
+    ).order_by('-created_at', '-id')[:20], {'booking_user_created_idx'}),
+    'housekeeping_queue': ('core_booking', lambda t: Booking.objects.filter(
+        status='Checked Out', cleaned_by__isnull=True,
+    ).order_by('-check_out'), {'booking_cleaning_queue_idx'}),
+    'payment_callback': ('core_booking', lambda t: Booking.objects.filter(
+        payment_id='order_test',
+    ), {'booking_payment_id_idx'}),
+    'expired_holds': ('core_booking', lambda t: Booking.objects.filter(
+        status='Pending', is_paid=False, hold_expires_at__lt=timezone.now(),
+    ), {'booking_status_checkout_idx'}),
+    'expired_holds_of_room': ('core_booking', lambda t: Booking.objects.filter(
+        status='Pending', is_paid=False, hold_expires_at__lt=timezone.now(), room=t.room,
+    ), {'booking_room_stay_idx'}),
+    'unread_notifications': ('core_notification', lambda t: Notification.objects.filter(
+        user=t.guest, is_read=False,
+    ).order_by('-created_at')[:5], {'notification_unread_idx', 'notification_user_created_idx'}),
+    'unread_feedback': ('core_feedback', lambda t: Feedback.objects.filter(is_read=False), {'feedback_unread_idx'}),
+    'unread_contact_messages': ('core_contactmessage', lambda t: ContactMessage.objects.filter(
+        is_read=False,
+    ), {'contactmessage_unread_idx'}),
+    'pending_maintenance': ('core_maintenance', lambda t: Maintenance.objects.filter(
+        scheduled_date__gte=t.today, is_completed=False,
+    ).values('room_id'), {'maintenance_pending_idx'}),
+    'days_present': ('core_staffattendance', lambda t: StaffSalary.objects.annotate(
+        days_present=Count('user__staffattendance', filter=Q(user__staffattendance__present=True))
+    ), {'attendance_user_present_idx'}),
+}
+
+
+class IndexPlanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = date.today()
+        cls.guest = User.objects.create_user(username='guest-user', password='x', role='guest')
+        cls.room = Room.objects.create(room_number='R-0', room_type='Single', price_per_night=1000)
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            # Tables this small are always cheapest to read in full
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def full_scans(self, plan, table):
+        """Plan lines reading every row of `table`."""
+        if connection.vendor == 'postgresql':
+            return [line for line in plan.splitlines() if f'Seq Scan on {table}' in line]
+        # SQLite: a bare SCAN, or one walking a whole index that isn't partial
+        return [
+            line for line in plan.splitlines()
+            if f'SCAN {table}' in line and not any(
+                line.endswith(f'INDEX {index}') for index in self.partial_indexes(table)
+            )
+        ]
+
+    def partial_indexes(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND sql LIKE '%%WHERE%%'", [table])
+            return {name for (name,) in cursor.fetchall()}
+
+    def test_hot_queries_use_their_indexes(self):
+        for name, (table, queryset, indexes) in HOT_QUERIES.items():
+            with self.subTest(name):
+                plan = self.explain(queryset(self))
+                self.assertEqual(self.full_scans(plan, table), [], f"{name} scans {table}:\n{plan}")
+                self.assertTrue(
+                    any(index in plan for index in indexes),
+                    f"{name} doesn't use {' or '.join(sorted(indexes))}:\n{plan}"
+                )
+
+
+class MediaServingTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, MEDIA_OFFLOAD=''))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='proof-owner', password='x', role='guest')
+        cls.other = User.objects.create_user(username='other-guest', password='x', role='guest')
+        cls.receptionist = User.objects.create_user(username='front-desk', password='x', role='receptionist')
+        room = Room.objects.create(room_number='M-1', room_type='Single', price_per_night=1000)
+        cls.photo = blob_storage.save('room_images/photo.jpg', ContentFile(b'0123456789' * 100))
+        cls.proof = blob_storage.save('booking_id_proofs/proof.png', ContentFile(b'id proof bytes'))
+        Booking.objects.create(
+            user=cls.owner, room=room, check_in=date.today(), check_out=date.today() + timedelta(days=1),
+            id_proof=cls.proof,
+        )
+        default_storage.save(f'renditions/{cls.proof}/thumb.webp', ContentFile(b'thumb'))
+        default_storage.save('invoice_cache/1.pdf', ContentFile(b'%PDF'))
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', headers=headers)
+
+    def test_content_addressed_files_are_immutable_and_revalidate(self):
+        response = self.get(self.photo)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 100)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(self.get(self.photo, if_none_match=response['ETag']).status_code, 304)
+        self.assertEqual(self.get(self.photo, if_modified_since=response['Last-Modified']).status_code, 304)
+
+    def test_ranges(self):
+        response = self.get(self.photo, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1000')
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(b''.join(self.get(self.photo, range='bytes=-5').streaming_content), b'56789')
+        self.assertEqual(self.get(self.photo, range='bytes=1000-').status_code, 416)
+        # A stale If-Range gets the whole file
+        self.assertEqual(self.get(self.photo, range='bytes=0-1', if_range='"stale"').status_code, 200)
+
+    def test_id_proofs_are_visible_to_their_owner_and_front_desk_only(self):
+        thumb = f'renditions/{self.proof}/thumb.webp'
+        self.assertEqual(self.get(self.proof).status_code, 404)
+        for user, status in ((self.other, 404), (self.owner, 200), (self.receptionist, 200)):
+            self.client.force_login(user)
+            for name in (self.proof, thumb):
+                with self.subTest(user=user.username, name=name):
+                    response = self.get(name)
+                    self.assertEqual(response.status_code, status)
+                    if status == 200:
+                        self.assertTrue(response['Cache-Control'].startswith('private'))
+
+    def test_nothing_outside_the_image_directories(self):
+        self.client.force_login(self.receptionist)
+        for name in ('invoice_cache/1.pdf', 'room_images/../invoice_cache/1.pdf', 'room_images/missing.jpg'):
+            with self.subTest(name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+
+class StaticFilesTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.static_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(STATIC_ROOT=cls.static_root))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.static_root)
+
+    def test_hashed_names_are_immutable_and_precompressed(self):
+        url = staticfiles_storage.url('css/base.css')
+        self.assertRegex(url, r'^/static/css/base\.[0-9a-f]{12}\.css$')
+        response = self.client.get(url, headers={'accept-encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        plain = self.client.get(url, headers={'accept-encoding': 'gzip;q=0'})
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertLess(len(b''.join(response.streaming_content)), len(b''.join(plain.streaming_content)))
+        self.assertEqual(self.client.get(url, headers={'if-none-match': plain['ETag']}).status_code, 304)
+
+    def test_unhashed_names_revalidate(self):
+        response = self.client.get('/static/css/base.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=3600')
+
+
+class ReservationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user(username='holder', password='x', role='guest')
+        cls.receptionist = User.objects.create_user(username='desk', password='x', role='receptionist')
+        cls.room = Room.objects.create(room_number='H-1', room_type='Single', price_per_night=1000)
+        cls.check_in = date.today() + timedelta(days=10)
+
+    def booking(self, nights=2, offset=0, **fields):
+        check_in = self.check_in + timedelta(days=offset)
+        return Booking(user=self.guest, room=self.room, check_in=check_in, check_out=check_in + timedelta(days=nights), **fields)
+
+    def lapse(self, booking):
+        Booking.objects.filter(pk=booking.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(reservations.release_expired_holds(), 1)
+        booking.refresh_from_db()
+
+    def test_overlapping_booking_is_rejected(self):
+        reservations.reserve(self.booking(nights=3))
+        clash = self.booking(nights=2, offset=2)
+        with self.assertRaises(reservations.RoomUnavailable):
+            reservations.reserve(clash)
+        self.assertIsNone(clash.pk)
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 3)
+
+    def test_lapsed_hold_frees_its_nights(self):
+        hold = reservations.reserve(self.booking(), hold=True)
+        self.assertIsNotNone(hold.hold_expires_at)
+        self.lapse(hold)
+        self.assertEqual(hold.status, 'Canceled')
+        self.assertFalse(RoomNight.objects.filter(booking=hold).exists())
+        reservations.reserve(self.booking())  # The nights can be sold again
+
+    def test_payment_after_a_lapse_reclaims_a_free_room(self):
+        hold = reservations.reserve(self.booking(), hold=True)
+        self.lapse(hold)
+        reservations.confirm(hold)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, 'Pending')
+        self.assertIsNone(hold.hold_expires_at)
+        self.assertEqual(RoomNight.objects.filter(booking=hold).count(), 2)
+
+    def test_payment_after_a_lapse_fails_when_the_room_was_resold(self):
+        hold = reservations.reserve(self.booking(), hold=True)
+        self.lapse(hold)
+        reservations.reserve(self.booking(nights=1, offset=1))
+        with self.assertRaises(reservations.RoomUnavailable):
+            reservations.confirm(hold)
+
+    def test_canceled_bookings_are_not_confirmed(self):
+        self.client.force_login(self.guest)
+        hold = reservations.reserve(self.booking(), hold=True)
+        self.client.get(reverse('cancel_booking', args=[hold.pk]))
+        self.client.post(reverse('booking_payment', args=[hold.pk]), {'payment_method': 'Cash'})
+        hold.refresh_from_db()
+        self.assertEqual((hold.status, hold.is_paid), ('Canceled', False))
+        self.assertFalse(RoomNight.objects.filter(booking=hold).exists())
+
+        self.client.force_login(self.receptionist)
+        hold = reservations.reserve(self.booking(), hold=True)
+        self.client.get(reverse('booking_cancel', args=[hold.pk]))
+        hold.refresh_from_db()
+        with self.assertRaises(reservations.BookingCanceled):
+            reservations.confirm(hold)
+
+    def test_direct_save_of_a_clash_is_refused(self):
+        reservations.reserve(self.booking(nights=3))
+        clash = self.booking(nights=2, offset=2)
+        with self.assertRaises(reservations.RoomUnavailable), transaction.atomic():
+            clash.save()
+        self.assertEqual(Booking.objects.count(), 1)
+        self.assertEqual(RoomNight.objects.count(), 3)
+
+    def test_worker_releases_lapsed_holds_for_searches(self):
+        hold = reservations.reserve(self.booking(), hold=True)
+        Booking.objects.filter(pk=hold.pk).update(hold_expires_at=timezone.now() - timedelta(minutes=1))
+        with mock.patch.object(connection, 'close'):  # The worker closes its connection on exit
+            call_command('run_jobs', concurrency=0, once=True, stdout=io.StringIO())
+        self.assertEqual(Booking.objects.get(pk=hold.pk).status, 'Canceled')
+        self.assertIn(self.room, rooms_available_between(self.check_in, self.check_in + timedelta(days=2)))
+
+    def test_confirm_is_atomic(self):
+        hold = reservations.reserve(self.booking(), hold=True)
+        hold.check_out += timedelta(days=1)
+        reservations.reserve(self.booking(nights=1, offset=2))  # Taken meanwhile
+        with self.assertRaises(reservations.RoomUnavailable):
+            reservations.confirm(hold)
+        hold.refresh_from_db()
+        self.assertIsNotNone(hold.hold_expires_at)  # Nothing of the failed confirmation was saved
+        self.assertEqual(hold.total_nights, 2)
+
+    def test_walk_in_with_an_inactive_status_claims_no_nights(self):
+        past = self.booking(offset=-30, status='Checked Out', is_paid=True)
+        reservations.reserve(past)
+        self.assertIsNotNone(past.pk)
+        self.assertFalse(RoomNight.objects.filter(booking=past).exists())
+
+
+class BillSnapshotTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user(username='payer', password='x', role='guest')
+        cls.room = Room.objects.create(room_number='B-1', room_type='Single', price_per_night=1000)
+        cls.suite = Room.objects.create(room_number='B-2', room_type='Suite', price_per_night=3000)
+        check_in = date.today() + timedelta(days=5)
+        cls.booking = Booking.objects.create(
+            user=cls.guest, room=cls.room, check_in=check_in, check_out=check_in + timedelta(days=2)
+        )
+
+    def priced(self):
+        calculate_bill(Booking.objects.get(pk=self.booking.pk))
+        return Booking.objects.get(pk=self.booking.pk)
+
+    def test_snapshot_is_reused(self):
+        booking = self.priced()
+        self.assertIsNotNone(booking.bill_snapshot)
+        booking.status = 'Checked In'
+        booking.save()
+        booking = Booking.objects.get(pk=booking.pk)
+        with self.assertNumQueries(0):
+            bill = calculate_bill(booking)
+        self.assertEqual(bill['room_price'], 2000)
+
+    def test_reschedule_invalidates_snapshot(self):
+        booking = self.priced()
+        booking.check_out += timedelta(days=1)
+        booking.save()
+        booking.refresh_from_db()
+        self.assertIsNone(booking.bill_snapshot)
+        self.assertEqual(calculate_bill(booking)['room_price'], 3000)
+
+    def test_deferred_instance_invalidates_snapshot(self):
+        self.priced()
+        booking = Booking.objects.only('room').get(pk=self.booking.pk)
+        booking.room = self.suite
+        booking.save()
+        booking = Booking.objects.get(pk=self.booking.pk)
+        self.assertIsNone(booking.bill_snapshot)
+        self.assertEqual(calculate_bill(booking)['room_price'], 6000)
+
+    def test_update_fields_without_snapshot_invalidates_it(self):
+        booking = self.priced()
+        booking.room = self.suite
+        booking.save(update_fields=['room'])
+        self.assertIsNone(Booking.objects.get(pk=booking.pk).bill_snapshot)
+
+
+class SearchLimitTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='searcher', password='x', role='guest'))
+
+    def search(self, days, nights=''):
+        check_in = date.today() + timedelta(days=1)
+        return self.client.get(reverse('available_rooms'), {
+            'check_in': check_in.isoformat(),
+            'check_out': (check_in + timedelta(days=days)).isoformat(),
+            'nights': nights,
+        })
+
+    def errors(self, response):
+        return [str(message) for message in response.context['messages']]
+
+    def test_searches_within_limits(self):
+        self.assertEqual(self.search(settings.SEARCH_MAX_WINDOW_DAYS).status_code, 200)
+        self.assertEqual(self.search(60, settings.SEARCH_MAX_NIGHTS).status_code, 200)
+
+    @override_settings(SEARCH_MAX_NIGHTS=7, SEARCH_MAX_WINDOW_DAYS=30)
+    def test_oversized_searches_are_refused(self):
+        response = self.search(31)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('at most 30 days', self.errors(response)[0])
+        response = self.search(30, 8)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('between 1 and 7', self.errors(response)[0])
+        with self.assertRaises(ValueError):
+            find_flexible_stays(8, date.today(), date.today() + timedelta(days=30))
+
+    def test_non_numeric_nights_has_its_own_error(self):
+        response = self.search(10, 'three')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.errors(response), ["❌ Number of nights must be a whole number."])
+
+
+class MetricsAccessTests(TestCase):
+
+    def test_allowlisted_address_without_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token_is_required_when_set(self):
+        # Behind a same-host proxy every client arrives from 127.0.0.1
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'authorization': 'Bearer wrong'}).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'authorization': 'Bearer s3cret'}).status_code, 200)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class CircuitBreakerTests(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(payments, 'time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = payments.CircuitBreaker(threshold=2, reset_after=30)
+
+    def fail(self):
+        raise payments.requests.exceptions.ConnectTimeout("gateway timed out")
+
+    def test_opens_after_threshold_then_half_opens_and_closes(self):
+        for _ in range(2):
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.breaker.call(self.fail)
+        self.assertIsNotNone(self.breaker.opened_at)
+
+        # Open: fails fast without calling the gateway
+        gateway = mock.Mock(return_value='ok')
+        self.clock.now += 29
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.breaker.call(gateway)
+        gateway.assert_not_called()
+
+        # Half-open: one trial goes through and closes the circuit
+        self.clock.now += 1
+        self.assertEqual(self.breaker.call(gateway), 'ok')
+        self.assertIsNone(self.breaker.opened_at)
+        self.assertEqual(self.breaker.failures, 0)
+        self.assertEqual(self.breaker.call(gateway), 'ok')
+
+    def test_failed_trial_reopens(self):
+        for _ in range(2):
+            with self.assertRaises(payments.GatewayUnavailable):
+                self.breaker.call(self.fail)
+        self.clock.now += 30
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.breaker.call(self.fail)
+
+        gateway = mock.Mock(return_value='ok')
+        self.clock.now += 29
+        with self.assertRaises(payments.GatewayUnavailable):
+            self.breaker.call(gateway)
+        gateway.assert_not_called()
+
+    def test_other_errors_pass_through_without_tripping(self):
+        for _ in range(3):
+            with self.assertRaises(KeyError):
+                self.breaker.call(mock.Mock(side_effect=KeyError('amount')))
+        self.assertIsNone(self.breaker.opened_at)
+
+
+class OrderReuseTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        guest = User.objects.create_user(username='buyer', password='x', role='guest')
+        room = Room.objects.create(room_number='P-1', room_type='Single', price_per_night=1000)
+        check_in = date.today() + timedelta(days=3)
+        cls.booking = Booking.objects.create(user=guest, room=room, check_in=check_in, check_out=check_in + timedelta(days=1))
+
+    def setUp(self):
+        self.orders = iter(['order_1', 'order_2'])
+        self.client_stub = SimpleNamespace(order=SimpleNamespace(
+            create=mock.Mock(side_effect=lambda data: {'id': next(self.orders)})
+        ))
+        patcher = mock.patch.object(payments, 'get_client', return_value=self.client_stub)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_open_order_is_reused_until_the_amount_changes(self):
+        self.assertEqual(payments.get_or_create_order(self.booking, 118000), 'order_1')
+        booking = Booking.objects.get(pk=self.booking.pk)
+        self.assertEqual((booking.payment_id, booking.payment_amount), ('order_1', 118000))
+
+        self.assertEqual(payments.get_or_create_order(booking, 118000), 'order_1')
+        self.assertEqual(self.client_stub.order.create.call_count, 1)
+
+        self.assertEqual(payments.get_or_create_order(booking, 150000), 'order_2')
+        self.assertEqual(self.client_stub.order.create.call_count, 2)
+
+    def test_paid_booking_gets_a_new_order(self):
+        payments.get_or_create_order(self.booking, 118000)
+        self.booking.is_paid = True
+        self.assertEqual(payments.get_or_create_order(self.booking, 118000), 'order_2')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='x', role='guest')
+        Notification.objects.bulk_create([Notification(user=cls.user, message=f'n{i}') for i in range(11)])
+        # Three timestamps shared by several rows: the id alone breaks the ties
+        stamps = [timezone.now() - timedelta(hours=hours) for hours in (1, 1, 1, 1, 2, 2, 2, 3, 3, 3, 3)]
+        for notification, stamp in zip(Notification.objects.order_by('id'), stamps):
+            Notification.objects.filter(pk=notification.pk).update(created_at=stamp)
+        cls.ordered = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def page(self, query='', per_page=3):
+        return paginate(RequestFactory().get('/notifications/' + query), Notification.objects.all(), per_page=per_page)
+
+    def test_cursor_round_trip(self):
+        fields = [Notification._meta.get_field('created_at'), Notification._meta.get_field('id')]
+        stamp = timezone.now()
+        self.assertEqual(_decode(_encode([stamp, 42]), fields), [stamp, 42])
+
+    def test_walk_over_tied_sort_keys(self):
+        seen, page = [], self.page()
+        while True:
+            seen += [notification.id for notification in page]
+            if not page.has_next:
+                break
+            page = self.page(page.next_query)
+        self.assertEqual(seen, self.ordered)
+
+        # And back again from the last page
+        back = [notification.id for notification in page]
+        while page.has_previous:
+            page = self.page(page.previous_query)
+            back = [notification.id for notification in page] + back
+        self.assertEqual(back, self.ordered)
+
+    def test_filters_are_carried_into_cursor_links(self):
+        page = self.page('?status=unread')
+        self.assertIn('status=unread', page.next_query)
+        self.assertIn('after=', page.next_query)
+
+    def test_nulls_sort_last(self):
+        # Cleaned rooms recorded before cleaned_at existed have none; they still belong in the history
+        room = Room.objects.create(room_number='K-1', room_type='Single', price_per_night=1000)
+        stamps = [timezone.now() - timedelta(hours=hours) for hours in (1, 1, 2)] + [None] * 4
+        Booking.objects.bulk_create([
+            Booking(user=self.user, room=room, check_in=date(2030, 1, 1), check_out=date(2030, 1, 2),
+                    cleaned_by=self.user, cleaned_at=stamp)
+            for stamp in stamps
+        ])
+        ordering = ('-cleaned_at', '-id')
+        bookings = Booking.objects.filter(cleaned_by__isnull=False)
+        ordered = sorted(bookings, key=lambda booking: (booking.cleaned_at is not None, booking.cleaned_at or 0, booking.id), reverse=True)
+
+        def page(query=''):
+            return paginate(RequestFactory().get('/cleaned-rooms/' + query), bookings, ordering, per_page=2)
+
+        seen, current = [], page()
+        while True:
+            seen += list(current)
+            if not current.has_next:
+                break
+            current = page(current.next_query)
+        self.assertEqual(seen, ordered)
+
+        back = list(current)
+        while current.has_previous:
+            current = page(current.previous_query)
+            back = list(current) + back
+        self.assertEqual(back, ordered)
+
+    def test_tampered_cursors_fall_back_to_the_first_page(self):
+        first = [notification.id for notification in self.page()]
+        for cursor in ('!!!', _encode(['x']), _encode(['not a date', '1']), 'eyJhIjogMX0'):
+            with self.subTest(cursor=cursor):
+                page = self.page(f'?after={cursor}')
+                self.assertEqual([notification.id for notification in page], first)
+                self.assertFalse(page.has_previous)
+
+
+class RoomCatalogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.room = Room.objects.create(room_number='C-1', room_type='Single', price_per_night=1000)
+
+    def room_choices(self):
+        return dict(ReceptionistBookingForm().fields['room'].choices)
+
+    def test_saving_a_room_refreshes_the_form_choices(self):
+        self.assertIn(self.room.id, self.room_choices())
+        with self.captureOnCommitCallbacks(execute=True):
+            added = Room.objects.create(room_number='C-2', room_type='Suite', price_per_night=3000)
+        self.assertEqual(self.room_choices()[added.id], 'C-2 - Suite')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.room_number = 'C-1A'
+            self.room.save()
+        self.assertEqual(self.room_choices()[self.room.id], 'C-1A - Single')
+
+    def test_catalog_is_reused_until_invalidated(self):
+        catalog.get()
+        with self.assertNumQueries(0):
+            self.room_choices()
+
+    def test_check_in_and_out_keep_the_catalog(self):
+        catalog.get()
+        version = cache.get(catalog.VERSION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.is_available = False
+            self.room.save(update_fields=['is_available'])
+        self.assertEqual(cache.get(catalog.VERSION_KEY), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room.price_per_night = 1200
+            self.room.save(update_fields=['price_per_night'])
+        self.assertNotEqual(cache.get(catalog.VERSION_KEY), version)
+
+    @override_settings(ROOM_CATALOG_VERSION_TTL=30)
+    def test_version_expires(self):
+        # Under a per-process cache this is how other workers see an edit
+        cache.delete(catalog.VERSION_KEY)
+        with mock.patch.object(catalog, 'cache', wraps=cache) as spy:
+            catalog.get()
+        spy.add.assert_called_once_with(catalog.VERSION_KEY, mock.ANY, 30)
+
+
+class BlobStorageTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.media_root)
+            for dirpath, _, filenames in os.walk(self.media_root) for filename in filenames
+        )
+
+    def test_identical_uploads_are_stored_once(self):
+        first = blob_storage.save('room_images/lobby.jpg', ContentFile(b'same bytes'))
+        second = blob_storage.save('room_images/LOBBY copy.jpg', ContentFile(b'same bytes'))
+        self.assertEqual(first, second)
+        self.assertTrue(is_blob(first))
+        self.assertEqual(self.stored_files(), [first])
+
+        # Other bytes, or another directory, make another blob
+        self.assertNotEqual(blob_storage.save('room_images/pool.jpg', ContentFile(b'other bytes')), first)
+        self.assertNotEqual(blob_storage.save('booking_id_proofs/lobby.jpg', ContentFile(b'same bytes')), first)
+        self.assertEqual(len(self.stored_files()), 3)
+
+    def test_gc_keeps_referenced_files_and_deletes_orphans(self):
+        room = Room.objects.create(room_number='G-1', room_type='Single', price_per_night=1000)
+        kept = blob_storage.save('room_images/kept.jpg', ContentFile(b'referenced'))
+        orphan = blob_storage.save('room_images/orphan.jpg', ContentFile(b'unreferenced'))
+        RoomImage.objects.bulk_create([RoomImage(room=room, image=kept)])
+        default_storage.save(f'renditions/{orphan}/480w.webp', ContentFile(b'rendition'))
+
+        # Within the grace period even an orphan is kept: its row may not be committed yet
+        self.assertEqual(collect_garbage(grace=3600), (0, 0))
+        self.assertEqual(collect_garbage(grace=0, dry_run=True)[0], 1)
+        self.assertEqual(len(self.stored_files()), 3)
+
+        files, size = collect_garbage(grace=0)
+        self.assertEqual((files, size), (1, len(b'unreferenced') + len(b'rendition')))
+        self.assertEqual(self.stored_files(), [kept])
+
+
+class ImageRenditionTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, IMAGE_RENDER_WORKERS=0))
+        images._ready.clear()
+        self.addCleanup(images._ready.clear)
+
+    def png(self, width, height):
+        output = io.BytesIO()
+        Image.new('RGBA', (width, height), (200, 30, 30, 128)).save(output, 'PNG')
+        return output.getvalue()
+
+    def test_renditions_are_scaled_down_never_up(self):
+        renditions = images.render(self.png(1200, 600))
+        self.assertEqual(set(renditions), {(r, e) for r in images.RENDITIONS for e in images.FORMATS})
+        for (rendition, extension), content in renditions.items():
+            with self.subTest(rendition=rendition, extension=extension), Image.open(io.BytesIO(content)) as image:
+                self.assertEqual(image.format, images.FORMATS[extension][0])
+                self.assertEqual(image.size, (images.RENDITIONS[rendition], images.RENDITIONS[rendition] // 2))
+                if extension == 'jpg':
+                    self.assertEqual(image.mode, 'RGB')  # Transparency flattened
+
+        for content in images.render(self.png(100, 50)).values():
+            with Image.open(io.BytesIO(content)) as image:
+                self.assertEqual(image.size, (100, 50))
+
+    def test_undecodable_upload(self):
+        with self.assertRaises(images.RenditionError):
+            images.render(b'not an image')
+
+    def test_picture_offers_renditions_once_they_exist(self):
+        name = default_storage.save('room_images/pool.png', ContentFile(self.png(1200, 600)))
+        image = SimpleNamespace(name=name, url=default_storage.url(name))
+        self.assertHTMLEqual(images.picture(image, alt='Pool'), f'<img src="{image.url}" alt="Pool">')
+
+        images.make_renditions(name)
+        html = images.picture(image, sizes='50vw', alt='Pool')
+        webp = ', '.join(
+            f"{default_storage.url(f'renditions/{name}/{rendition}.webp')} {width}w"
+            for rendition, width in images.RENDITIONS.items()
+        )
+        self.assertEqual(images.srcset(name, 'webp'), webp)
+        self.assertIn(f'<source type="image/webp" srcset="{webp}" sizes="50vw">', html)
+        self.assertIn(f"src=\"{default_storage.url(f'renditions/{name}/medium.jpg')}\"", html)
+
+        # A process that finds the set incomplete serves the original again
+        default_storage.delete(images.rendition_name(name, 'medium', 'jpg'))
+        images._ready.clear()
+        self.assertNotIn('<picture>', images.picture(image))
+        self.assertEqual(images.picture(None), '')
+
+
+class NotifyRolesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.managers = [User.objects.create_user(username=f'manager{i}', password='x', role='manager') for i in range(3)]
+        cls.housekeepers = [User.objects.create_user(username=f'keeper{i}', password='x', role='housekeeping') for i in range(2)]
+        User.objects.create_user(username='bystander', password='x', role='guest')
+
+    def setUp(self):
+        cache.clear()  # Counters cached by earlier tests for the same user ids
+
+    def sent(self):
+        return metrics.collect().get(('hotel_notifications_sent_total', ()), 0)
+
+    def test_one_insert_for_every_recipient(self):
+        manager = self.managers[0]
+        self.assertEqual(counters.unread_notifications(manager.pk), 0)  # Cached, so it has to be bumped
+        sent = self.sent()
+
+        with mock.patch.object(events, 'publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            # Duplicate check, recipients, one bulk INSERT
+            with self.assertNumQueries(3):
+                self.assertEqual(notify_roles(['manager', 'housekeeping'], "Pool closed"), 5)
+
+        staff = {user.pk for user in self.managers + self.housekeepers}
+        self.assertEqual(set(Notification.objects.values_list('user_id', flat=True)), staff)
+        publish.assert_called_once()
+        self.assertEqual(set(publish.call_args.args[0]), staff)
+        self.assertEqual(self.sent() - sent, 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(counters.unread_notifications(manager.pk), 1)
+
+    def test_same_key_is_not_resent_while_unread(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notify_roles(['manager'], "Low on towels", dedupe_on='inventory-low:1'), 3)
+            self.assertEqual(notify_roles(['manager'], "Only 2 towels left", dedupe_on='inventory-low:1'), 0)
+            self.assertEqual(notify_roles(['manager'], "Low on soap", dedupe_on='inventory-low:2'), 3)
+            self.assertEqual(notify_roles(['manager'], "Low on towels", dedupe_on='inventory-low:1', dedupe=False), 3)
+        self.assertEqual(Notification.objects.count(), 9)
+
+        # Once read, the same event notifies again
+        Notification.objects.update(is_read=True)
+        self.assertEqual(notify_roles(['manager'], "Low on towels", dedupe_on='inventory-low:1'), 3)
+
+
+class NotificationReadTests(TestCase):
+
+    def test_mark_all_as_read(self):
+        user = User.objects.create_user(username='inbox', password='x', role='guest')
+        Notification.objects.bulk_create([Notification(user=user, message=f'n{i}') for i in range(3)])
+        self.assertEqual(counters.unread_notifications(user.pk), 3)
+
+        self.client.force_login(user)
+        response = self.client.post(reverse('mark_notifications_read'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'success'})
+        self.assertEqual(counters.unread_notifications(user.pk), 0)
+
+        # Counted from the database again, so a notification arriving meanwhile isn't lost
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=user, message='new')
+        self.assertEqual(counters.unread_notifications(user.pk), 1)
+
+
+class NotificationStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='listener', password='x', role='guest')
+        Notification.objects.create(user=cls.user, message='before the page loaded')
+
+    def setUp(self):
+        cache.clear()  # Unread counts cached by earlier tests for the same user id
+
+    async def open_stream(self):
+        self.streams_before = events.subscriber_count()  # Streams other tests left open
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('notification_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertTrue((await anext(stream)).startswith(b'retry: '))
+        self.assertIn(b'"count": 1', await anext(stream))
+        return stream
+
+    async def disconnect(self, stream):
+        # The ASGI handler cancels the response task when the client goes away
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+
+    async def test_published_notification_is_pushed(self):
+        stream = await self.open_stream()
+        self.assertEqual(events.subscriber_count(), self.streams_before + 1)
+
+        notification = await Notification.objects.acreate(user=self.user, message='Room ready')
+        events.publish([self.user.pk])  # What the post_save signal does on commit
+        message = await anext(stream)
+        self.assertIn(f'id: {notification.pk}'.encode(), message)
+        self.assertIn(b'Room ready', message)
+        self.assertTrue((await anext(stream)).startswith(b'event: unread'))
+
+        # A dropped connection drops the subscription
+        await self.disconnect(stream)
+        self.assertEqual(events.subscriber_count(), self.streams_before)
+
+    @override_settings(NOTIFICATION_STREAM_POLL=0.01)
+    async def test_poll_finds_rows_nobody_published(self):
+        stream = await self.open_stream()
+        # e.g. written by another process, whose publish never reaches this one
+        await Notification.objects.acreate(user=self.user, message='From the other worker')
+        self.assertIn(b'From the other worker', await anext(stream))
+        self.assertTrue((await anext(stream)).startswith(b'event: unread'))
+        self.assertEqual(await anext(stream), b': keep-alive\n\n')
+        await self.disconnect(stream)
+        self.assertEqual(events.subscriber_count(), self.streams_before)
+
+    def test_wsgi_answers_with_what_is_new(self):
+        self.client.force_login(self.user)
+        first = Notification.objects.get()
+        Notification.objects.create(user=self.user, message='Since last time')
+        response = self.client.get(reverse('notification_stream'), headers={'Last-Event-ID': str(first.pk)})
+        body = response.content.decode()
+        self.assertNotIn('before the page loaded', body)
+        self.assertIn('Since last time', body)
+        self.assertIn('"count": 2', body)
+
+    def test_anonymous_is_told_to_stop(self):
+        self.assertEqual(self.client.get(reverse('notification_stream')).status_code, 204)
+
+
+class PaymentCallbackTests(TestCase):
+
+    def verifications(self, outcome):
+        return metrics.collect().get(('hotel_payment_verifications_total', (('outcome', outcome),)), 0)
+
+    def callback(self, method='post', **data):
+        before = {outcome: self.verifications(outcome) for outcome in ('bad_signature', 'invalid_request')}
+        response = getattr(self.client, method)(reverse('payment_success'), data)
+        counted = {outcome: self.verifications(outcome) - before[outcome] for outcome in before}
+        return response, counted
+
+    def test_forged_signature_is_refused(self):
+        guest = User.objects.create_user(username='forger', password='x', role='guest')
+        room = Room.objects.create(room_number='S-1', room_type='Single', price_per_night=1000)
+        booking = Booking.objects.create(
+            user=guest, room=room, check_in=date.today() + timedelta(days=1),
+            check_out=date.today() + timedelta(days=2), payment_id='order_forged',
+        )
+        with self.assertLogs('core.views', 'WARNING'):
+            response, counted = self.callback(
+                razorpay_order_id='order_forged', razorpay_payment_id='pay_1', razorpay_signature='0' * 64
+            )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(counted, {'bad_signature': 1, 'invalid_request': 0})
+        booking.refresh_from_db()
+        self.assertFalse(booking.is_paid)
+
+    def test_malformed_callbacks_are_refused(self):
+        for method, data in (('get', {}), ('post', {}), ('post', {'razorpay_order_id': 'order_1'})):
+            with self.subTest(method=method, data=data):
+                response, counted = self.callback(method, **data)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(counted, {'bad_signature': 0, 'invalid_request': 1})
+
+
+@override_settings(REQUEST_PROFILING=True)
+class ProfilingMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root, MEDIA_OFFLOAD=''))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(username='profiler', password='x', role='admin')
+        cls.guest = User.objects.create_user(username='profiled', password='x', role='guest')
+        cls.photo = blob_storage.save('room_images/lobby.jpg', ContentFile(b'lobby'))
+
+    def test_requests_that_dont_opt_in_cost_no_queries(self):
+        self.client.force_login(self.admin)
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/media/{self.photo}')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response)
+
+    def test_profile_flag_profiles_the_rest_of_the_session(self):
+        self.client.force_login(self.admin)
+        self.assertIn('X-Profile-Id', self.client.get(f'/media/{self.photo}', {'profile': '1'}))
+        self.assertIn('X-Profile-Id', self.client.get(f'/media/{self.photo}'))
+        self.assertNotIn('X-Profile-Id', self.client.get(f'/media/{self.photo}', {'profile': '0'}))
+        self.assertNotIn('X-Profile-Id', self.client.get(f'/media/{self.photo}'))
+
+    def test_only_allowed_users_are_profiled(self):
+        self.client.force_login(self.guest)
+        response = self.client.get(f'/media/{self.photo}', {'profile': '1'}, headers={'x-profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertNotIn('profile', response.cookies)
+
+        User.objects.filter(pk=self.guest.pk).update(profile_requests=True)
+        self.assertIn('X-Profile-Id', self.client.get(f'/media/{self.photo}', headers={'x-profile': '1'}))
+
+
+class InvoiceCacheTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        self.render = self.enterContext(mock.patch.object(invoices, 'render_pdf_pooled', return_value=b'%PDF-1.4 fake'))
+
+        self.guest = User.objects.create_user(username='invoiced', password='x', role='guest')
+        room = Room.objects.create(room_number='I-1', room_type='Single', price_per_night=1000)
+        self.booking = Booking.objects.create(
+            user=self.guest, room=room, check_in=date.today(), check_out=date.today() + timedelta(days=2), is_paid=True
+        )
+        self.client.force_login(self.guest)
+
+    def download(self, **headers):
+        return self.client.get(reverse('download_invoice', args=[self.booking.pk]), headers=headers)
+
+    def test_rendered_once_with_stable_validators(self):
+        first = self.download()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(b''.join(first.streaming_content), b'%PDF-1.4 fake')
+
+        # A hit marks the file used without changing its Last-Modified (the render time)
+        path = next(invoices.cache_dir().iterdir())
+        os.utime(path, (1_000_000, 1_000_000))
+        second = self.download()
+        self.assertEqual(self.render.call_count, 1)
+        self.assertEqual(second['Last-Modified'], http_date(1_000_000))
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertGreater(path.stat().st_atime, 1_000_000)
+
+        self.assertEqual(self.download(if_modified_since=second['Last-Modified']).status_code, 304)
+        self.assertEqual(self.download(if_none_match=first['ETag']).status_code, 304)
+
+    def test_cache_key_follows_the_bill_and_template(self):
+        bill = calculate_bill(self.booking)
+        key = invoices.invoice_cache_key(self.booking, bill)
+        self.assertEqual(invoices.invoice_cache_key(Booking.objects.get(pk=self.booking.pk), bill), key)
+
+        self.assertNotEqual(invoices.invoice_cache_key(self.booking, {**bill, 'total': bill['total'] + 1}), key)
+        self.booking.razorpay_payment_id = 'pay_2'
+        self.assertNotEqual(invoices.invoice_cache_key(self.booking, bill), key)
+        with mock.patch.object(invoices, 'INVOICE_TEMPLATE_VERSION', invoices.INVOICE_TEMPLATE_VERSION + 1):
+            self.assertNotEqual(invoices.invoice_cache_key(Booking.objects.get(pk=self.booking.pk), bill), key)
+
+    def test_prune_by_age_then_least_recently_used(self):
+        directory = invoices.cache_dir()
+        directory.mkdir(parents=True)
+        now = time.time()
+        for name, used in (('stale', now - 7200), ('old', now - 300), ('recent', now - 60)):
+            path = directory / f'{name}.pdf'
+            path.write_bytes(b'x' * 100)
+            os.utime(path, (used, now - 7200))  # Rendered long ago; atime is the last use
+
+        self.assertEqual(invoices.prune_invoice_cache(max_bytes=1000, max_age=3600), (1, 100))
+        self.assertEqual(invoices.prune_invoice_cache(max_bytes=100, max_age=3600), (1, 100))
+        self.assertEqual([path.name for path in directory.iterdir()], ['recent.pdf'])
+
+
+class StubRenderPool:
+    """Stands in for the PDF process pool: each render's future is settled by the test, or never."""
+
+    def __init__(self, pdf=None):
+        self.pdf = pdf
+        self.submitted = 0
+        self.shut_down = False
+        self._processes = {}
+
+    def submit(self, fn, *args):
+        self.submitted += 1
+        future = concurrent.futures.Future()
+        if self.pdf is not None:
+            future.set_result(self.pdf)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+@override_settings(PDF_RENDER_WORKERS=2)
+class PdfRenderPoolTests(TestCase):
+
+    def use_pool(self, pool, depth=1):
+        in_flight = threading.BoundedSemaphore(depth)
+        self.enterContext(mock.patch.object(invoices, '_pool', pool))
+        self.enterContext(mock.patch.object(invoices, '_in_flight', in_flight))
+        return in_flight
+
+    def test_full_queue_is_refused_not_queued(self):
+        pool = StubRenderPool(pdf=b'%PDF-1.4 pooled')
+        in_flight = self.use_pool(pool)
+        in_flight.acquire()  # One render already running
+        with self.assertRaises(invoices.InvoiceRenderBusy):
+            invoices.render_pdf_pooled('<p>invoice</p>')
+        self.assertEqual(pool.submitted, 0)
+
+        in_flight.release()
+        self.assertEqual(invoices.render_pdf_pooled('<p>invoice</p>'), b'%PDF-1.4 pooled')
+        self.assertTrue(in_flight.acquire(blocking=False))  # Released again after the render
+
+    def test_busy_download_answers_503(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.use_pool(StubRenderPool(), depth=1).acquire()
+
+        guest = User.objects.create_user(username='waiting', password='x', role='guest')
+        room = Room.objects.create(room_number='P-1', room_type='Single', price_per_night=1000)
+        booking = Booking.objects.create(
+            user=guest, room=room, check_in=date.today(), check_out=date.today() + timedelta(days=1), is_paid=True
+        )
+        self.client.force_login(guest)
+        response = self.client.get(reverse('download_invoice', args=[booking.pk]))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+
+    @override_settings(PDF_RENDER_TIMEOUT=0.01)
+    def test_hung_render_times_out_and_discards_the_pool(self):
+        pool = StubRenderPool()  # Its futures never complete
+        in_flight = self.use_pool(pool)
+        with self.assertRaisesMessage(invoices.InvoiceRenderError, 'timed out'):
+            invoices.render_pdf_pooled('<p>invoice</p>')
+        self.assertTrue(pool.shut_down)
+        self.assertIsNone(invoices._pool)  # The next render starts a fresh pool
+        self.assertTrue(in_flight.acquire(blocking=False))
+
+
+@jobs.job('test_flaky')
+def flaky_job(fail):
+    if fail:
+        raise RuntimeError("SMTP went away")
+
+
+class JobQueueTests(TestCase):
+
+    def test_each_due_job_is_claimed_once(self):
+        due = jobs.enqueue('test_flaky', fail=False)
+        jobs.enqueue('test_flaky', delay=60, fail=False)
+        claimed = jobs.claim_next()
+        self.assertEqual((claimed.id, claimed.status, claimed.attempts), (due.id, 'running', 1))
+        self.assertIsNone(jobs.claim_next())  # The other isn't due yet
+
+        self.assertTrue(jobs.run(claimed))
+        self.assertEqual(Job.objects.get(pk=due.pk).status, 'done')
+
+    @override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_BACKOFF=30)
+    def test_failures_back_off_then_fail_permanently(self):
+        queued = jobs.enqueue('test_flaky', fail=True)
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(jobs.claim_next()))
+        retry = Job.objects.get(pk=queued.pk)
+        self.assertEqual((retry.status, retry.attempts), ('queued', 1))
+        self.assertIn("SMTP went away", retry.last_error)
+        self.assertAlmostEqual((retry.run_after - timezone.now()).total_seconds(), 30, delta=5)
+        self.assertIsNone(jobs.claim_next())
+
+        Job.objects.filter(pk=queued.pk).update(run_after=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertFalse(jobs.run(jobs.claim_next()))
+        failed = Job.objects.get(pk=queued.pk)
+        self.assertEqual((failed.status, failed.attempts), ('failed', 2))
+        self.assertIsNotNone(failed.finished_at)
+
+    def test_backoff_doubles_up_to_the_cap(self):
+        with self.settings(JOB_RETRY_BACKOFF=30, JOB_RETRY_BACKOFF_MAX=100):
+            self.assertEqual([jobs.backoff(attempts) for attempts in (1, 2, 3, 4)], [30, 60, 100, 100])
+
+    def test_stale_jobs_are_requeued_unless_their_worker_is_alive(self):
+        alive, lost = jobs.enqueue('test_flaky', fail=False), jobs.enqueue('test_flaky', fail=False)
+        jobs.claim_next(), jobs.claim_next()
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT + 1))
+
+        with mock.patch.object(jobs, '_running', {alive.id}):
+            self.assertEqual(jobs.heartbeat(), 1)
+        self.assertEqual(jobs.requeue_stale(), 1)
+        self.assertEqual(Job.objects.get(pk=alive.pk).status, 'running')
+        self.assertEqual(Job.objects.get(pk=lost.pk).status, 'queued')
+
+
+class BookingConfirmationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        guest = User.objects.create_user(username='mailed', password='x', role='guest', email='mailed@example.com')
+        room = Room.objects.create(room_number='E-1', room_type='Single', price_per_night=1000)
+        cls.booking = Booking.objects.create(
+            user=guest, room=room, check_in=date.today(), check_out=date.today() + timedelta(days=1), is_paid=True
+        )
+
+    def test_confirmation_is_mailed_once(self):
+        with mock.patch.object(tasks, 'invoice_pdf_bytes', return_value=b'%PDF'):
+            tasks.send_booking_confirmation(self.booking.id)
+            tasks.send_booking_confirmation(self.booking.id)  # e.g. requeued after a stalled worker
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIsNotNone(Booking.objects.get(pk=self.booking.pk).confirmation_sent_at)
+
+    def test_failed_send_is_left_for_the_retry(self):
+        with mock.patch.object(tasks, 'invoice_pdf_bytes', side_effect=invoices.InvoiceRenderError("timed out")):
+            with self.assertRaises(invoices.InvoiceRenderError):
+                tasks.send_booking_confirmation(self.booking.id)
+        self.assertIsNone(Booking.objects.get(pk=self.booking.pk).confirmation_sent_at)
+        with mock.patch.object(tasks, 'invoice_pdf_bytes', return_value=b'%PDF'):
+            tasks.send_booking_confirmation(self.booking.id)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class RoomTypeBookingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = User.objects.create_user(username='typed', password='x', role='guest')
+        cls.cheap = Room.objects.create(room_number='T-1', room_type='Double', price_per_night=2000)
+        cls.dear = Room.objects.create(room_number='T-2', room_type='Double', price_per_night=2500)
+        cls.suite = Room.objects.create(room_number='T-3', room_type='Suite', price_per_night=5000)
+        cls.check_in = date.today() + timedelta(days=7)
+        cls.stay = {'check_in': cls.check_in.isoformat(), 'check_out': (cls.check_in + timedelta(days=2)).isoformat()}
+
+    def setUp(self):
+        self.client.force_login(self.guest)
+
+    def take(self, room):
+        reservations.reserve(Booking(user=self.guest, room=room, check_in=self.check_in, check_out=self.check_in + timedelta(days=1)))
+
+    def test_search_summarises_free_rooms_per_type_without_a_query_of_its_own(self):
+        self.take(self.cheap)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('available_rooms'), self.stay)
+        self.assertEqual(
+            [(row['room_type'], row['available'], row['price_from']) for row in response.context['room_types']],
+            [('Double', 1, 2500), ('Suite', 1, 5000)],
+        )
+        self.assertEqual(sum('GROUP BY' in query['sql'] for query in queries.captured_queries), 0)
+
+    def test_booking_a_type_picks_the_cheapest_free_room(self):
+        response = self.client.get(reverse('book_room_type', args=['Double']), self.stay)
+        self.assertRedirects(
+            response, f"{reverse('book_room', args=[self.cheap.id])}?check_in={self.stay['check_in']}&check_out={self.stay['check_out']}",
+            fetch_redirect_response=False,
+        )
+        self.take(self.cheap)
+        response = self.client.get(reverse('book_room_type', args=['Double']), self.stay)
+        self.assertTrue(response['Location'].startswith(reverse('book_room', args=[self.dear.id])))
+
+    def test_no_room_of_the_type_left(self):
+        self.take(self.suite)
+        response = self.client.get(reverse('book_room_type', args=['Suite']), self.stay, follow=True)
+        self.assertRedirects(response, reverse('available_rooms'))
+        self.assertIn("No Suite rooms are free", str(list(response.context['messages'])[0]))
+
+    def test_unknown_room_type_is_refused(self):
+        response = self.client.get(reverse('book_room_type', args=['Penthouse']), self.stay, follow=True)
+        self.assertRedirects(response, reverse('available_rooms'))
+        self.assertEqual([str(message) for message in response.context['messages']], ["❌ Unknown room type."])
+
+    def test_room_picker_only_offers_free_rooms(self):
+        self.take(self.cheap)
+        response = self.client.get(reverse('book_room', args=[self.dear.id]), self.stay)
+        offered = {value for value, _ in response.context['form'].fields['room'].choices if value}
+        self.assertEqual(offered, {self.dear.id, self.suite.id})
@@ -24,10 +24,14 @@ urlpatterns = [
     path('bookings/<int:booking_id>/checkout/', views.booking_check_out, name='booking_check_out'),
     path('booking/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('bookings/add/<int:room_id>/', views.booking_create, name='book_room'),
+    path('bookings/add/type/<str:room_type>/', views.book_room_type, name='book_room_type'),
     
 
     # 📊 Dashboards for different roles
     path('dashboard/admin/', views.admin_dashboard, name='admin_dashboard'),                 # Admin dashboard
+    path('dashboard/admin/profiles/', views.request_profiles, name='request_profiles'),      # Recent request profiles
+    path('dashboard/admin/profiles/<int:profile_id>/', views.request_profile, name='request_profile'),
+    path('metrics', views.metrics_endpoint, name='metrics'),                                  # Prometheus scrape target
     path('dashboard/manager/', views.manager_dashboard, name='manager_dashboard'),           # Manager dashboard
     path('dashboard/receptionist/', views.receptionist_dashboard, name='receptionist_dashboard'), # Receptionist dashboard
     path('dashboard/housekeeping/', views.housekeeping_dashboard, name='housekeeping_dashboard'), # Housekeeping dashboard
@@ -83,6 +87,7 @@ urlpatterns = [
     path('salary/attendance/list/', views.attendance_list, name='attendance_list'),
     path('notifications/', views.all_notifications_view, name='all_notifications'),
     path('notifications/mark-read/', views.mark_notifications_read, name='mark_notifications_read'),
+    path('notifications/stream/', views.notification_stream, name='notification_stream'),
     
     
     path('about/', views.about_us, name='about_us'),
@@ -1,22 +1,186 @@
+import hashlib
+from collections import defaultdict
+from datetime import date, timedelta
 from decimal import Decimal, ROUND_HALF_UP
-from .models import Notification, Booking
+from . import counters, events, metrics
+from .reservations import RoomUnavailable
+from .models import Notification, Booking, Maintenance, Room, RoomNight
+from .profiling import timed
+from django.conf import settings
+from django.db import transaction
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
+
+
+def stay_dates(check_in, check_out):
+    """Every night of a stay, check-out day excluded."""
+    return [check_in + timedelta(days=i) for i in range((check_out - check_in).days)]
+
+
+def sync_room_nights(booking):
+    """
+    Bring the RoomNight rows of a booking in line with its room, dates and status.
+    Active bookings hold one row per night; any other status holds none.
+    Raises RoomUnavailable when another booking holds any of the nights, so
+    saves that bypass reservations.reserve() (e.g. the admin) can't double-sell
+    a room; save in a transaction to roll the booking back with it.
+    """
+    if booking.status not in Booking.ACTIVE_STATUSES:
+        RoomNight.objects.filter(booking=booking).delete()
+        return
+
+    wanted = {(booking.room_id, night) for night in stay_dates(booking.check_in, booking.check_out)}
+    held = set(RoomNight.objects.filter(booking=booking).values_list('room_id', 'date'))
+    if wanted == held:
+        return
+
+    stale = held - wanted
+    if stale:
+        RoomNight.objects.filter(booking=booking, date__in=[night for _, night in stale]).delete()
+    RoomNight.objects.bulk_create(
+        [RoomNight(room_id=room_id, booking=booking, date=night) for room_id, night in wanted - held],
+        ignore_conflicts=True
+    )
+    # ignore_conflicts skips nights held by other bookings without saying which
+    if RoomNight.objects.filter(booking=booking).count() != len(wanted):
+        raise RoomUnavailable(f"Room {booking.room.room_number} is already booked for the selected dates.")
+
+
 def is_room_available(room, check_in, check_out):
-    
-    return not Booking.objects.filter(
+    return not RoomNight.objects.filter(
         room=room,
-        check_in__lt=check_out,
-        check_out__gt=check_in
+        date__gte=check_in,
+        date__lt=check_out
     ).exists()
 
 
+def rooms_available_between(check_in, check_out, rooms=None):
+    """
+    Rooms with no occupied night in [check_in, check_out) and no pending maintenance.
+    """
+    if rooms is None:
+        rooms = Room.objects.all()
+
+    occupied = RoomNight.objects.filter(
+        date__gte=check_in,
+        date__lt=check_out
+    ).values('room_id')
+
+    maintenance = Maintenance.objects.filter(
+        scheduled_date__gte=date.today(),
+        is_completed=False
+    ).values('room_id')
+
+    return rooms.exclude(id__in=occupied).exclude(id__in=maintenance)
+
+
+def room_type_availability(rooms):
+    """
+    Free-room counts per room type, tallied from the free rooms a search has
+    already found (catalog rooms), so the summary costs no query of its own.
+
+    Returns a list of dicts: room_type, label, available, price_from.
+    """
+    labels = dict(Room.ROOM_TYPES)
+    summary = {}
+    for room in rooms:
+        row = summary.setdefault(room.room_type, {
+            'room_type': room.room_type,
+            'label': labels.get(room.room_type, room.room_type),
+            'available': 0,
+            'price_from': room.price_per_night,
+        })
+        row['available'] += 1
+        row['price_from'] = min(row['price_from'], room.price_per_night)
+    return sorted(summary.values(), key=lambda row: row['price_from'])
+
+
+def pick_room_of_type(room_type, check_in, check_out):
+    """Cheapest room of the given type that is free for the whole stay, or None."""
+    return rooms_available_between(check_in, check_out).filter(
+        room_type=room_type
+    ).order_by('price_per_night', 'room_number').first()
+
+
+def occupancy_bitmaps(window_start, window_end):
+    """
+    Occupied nights per room in [window_start, window_end) as integer bitmaps:
+    bit i set means the night of window_start + i days is taken.
+    """
+    bitmaps = defaultdict(int)
+    nights = RoomNight.objects.filter(
+        date__gte=window_start,
+        date__lt=window_end
+    ).values_list('room_id', 'date')
+
+    for room_id, night in nights.iterator():
+        bitmaps[room_id] |= 1 << (night - window_start).days
+    return bitmaps
+
+
+def find_flexible_stays(nights, window_start, window_end, rooms=None):
+    """
+    Flexible-date search: rooms offering `nights` consecutive free nights
+    somewhere between window_start and window_end (the latest check-out).
+
+    Returns a list of (room, earliest_check_in) pairs. Raises ValueError
+    above SEARCH_MAX_NIGHTS or SEARCH_MAX_WINDOW_DAYS.
+    """
+    span = (window_end - window_start).days
+    if nights > settings.SEARCH_MAX_NIGHTS or span > settings.SEARCH_MAX_WINDOW_DAYS:
+        raise ValueError("Search too large")
+    if nights < 1 or span < nights:
+        return []
+
+    if rooms is None:
+        rooms = Room.objects.all()
+    maintenance = Maintenance.objects.filter(
+        scheduled_date__gte=date.today(),
+        is_completed=False
+    ).values('room_id')
+
+    busy = occupancy_bitmaps(window_start, window_end)
+    all_nights = (1 << span) - 1
+
+    stays = []
+    for room in rooms.exclude(id__in=maintenance):
+        free = all_nights & ~busy.get(room.id, 0)
+        # Bit i survives only if nights i .. i + nights - 1 are all free
+        starts = free
+        for offset in range(1, nights):
+            starts &= free >> offset
+        if starts:
+            first = (starts & -starts).bit_length() - 1
+            stays.append((room, window_start + timedelta(days=first)))
+    return stays
+
+
 
 
 round2 = lambda x: x.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
 
+# Bump when the pricing rules change so stale snapshots get recomputed
+BILL_VERSION = 1
+BILL_FIELDS = ('room_price', 'amenity_price', 'spa_price', 'subtotal', 'tax', 'discount', 'total')
+
+
+@timed('calculate_bill')
 def calculate_bill(booking):
+    """
+    Bill breakdown for a booking.
+
+    Served from booking.bill_snapshot when present, so read paths neither
+    re-query the room/amenities/spa services nor write. The snapshot is
+    computed once and cleared (see core.signals) only when the booking's
+    room, dates, amenities or spa services change, which also freezes the
+    price the guest agreed to. QuerySet.update() sends no signals: an update
+    that moves a booking's room or dates must set bill_snapshot=None itself.
+    """
+    snapshot = booking.bill_snapshot
+    if snapshot and snapshot.get('version') == BILL_VERSION:
+        return {key: Decimal(snapshot[key]) for key in BILL_FIELDS}
+
     nights = (booking.check_out - booking.check_in).days or 1
 
     room_total = Decimal(booking.room.price_per_night) * nights
@@ -28,46 +192,71 @@ def calculate_bill(booking):
     discount = Decimal('0.00')        
     total = subtotal + tax - discount
 
-    
-    room_total = round2(room_total)
-    amenity_total = round2(amenity_total)
-    spa_total = round2(spa_total)
-    subtotal = round2(subtotal)
-    tax = round2(tax)
-    discount = round2(discount)
-    total = round2(total)
-
-   
-    booking.subtotal = subtotal
-    booking.tax = tax
-    booking.discount = discount
-    booking.total = total
-    booking.save()
-
-    return {
-        'room_price': room_total,
-        'amenity_price': amenity_total,
-        'spa_price': spa_total,
-        'subtotal': subtotal,
-        'tax': tax,
-        'discount': discount,
-        'total': total
+    bill = {
+        'room_price': round2(room_total),
+        'amenity_price': round2(amenity_total),
+        'spa_price': round2(spa_total),
+        'subtotal': round2(subtotal),
+        'tax': round2(tax),
+        'discount': round2(discount),
+        'total': round2(total)
     }
 
+    booking.subtotal = bill['subtotal']
+    booking.tax = bill['tax']
+    booking.discount = bill['discount']
+    booking.total = bill['total']
+    booking.bill_snapshot = {'version': BILL_VERSION, **{key: str(bill[key]) for key in BILL_FIELDS}}
+
+    # Plain UPDATE: no post_save fan-out for what is only a cached value
+    Booking.objects.filter(pk=booking.pk).update(
+        subtotal=booking.subtotal,
+        tax=booking.tax,
+        discount=booking.discount,
+        total=booking.total,
+        bill_snapshot=booking.bill_snapshot
+    )
+
+    return bill
+
+
+def notification_key(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def notify_roles(roles, message, dedupe_on=None, dedupe=True):
+    """
+    Send `message` to every user holding one of `roles`.
+
+    Costs one indexed duplicate check and one bulk INSERT however many staff
+    there are. With `dedupe`, nothing is sent while an unread notification
+    with the same key exists; the key is the message itself unless
+    `dedupe_on` names the underlying event (e.g. an inventory item).
+    Returns the number of notifications created.
+    """
+    key = notification_key(dedupe_on or message)
+    if dedupe and Notification.objects.filter(dedupe_key=key, is_read=False).exists():
+        return 0
+
+    recipients = list(User.objects.filter(role__in=roles).values_list('id', flat=True))
+    created = Notification.objects.bulk_create([
+        Notification(user_id=user_id, message=message, dedupe_key=key)
+        for user_id in recipients
+    ])
+    # bulk_create skips post_save, so bump the badge counters and wake live streams
+    # here, once the rows are committed
+    metrics.NOTIFICATIONS_SENT.inc(len(created))
+    metrics.NOTIFICATION_FANOUT.observe(len(created))
+    transaction.on_commit(lambda: counters.notifications_added(recipients))
+    transaction.on_commit(lambda: events.publish(recipients))
+    return len(created)
+
 
 def notify_if_inventory_low(item):
     if item.quantity < item.threshold:
-        # Check if a similar unread notification already exists
-        existing = Notification.objects.filter(
-            user__role='manager',
-            message__icontains=item.name,
-            is_read=False
+        # Skipped while managers still have an unread alert for this item
+        notify_roles(
+            ['manager'],
+            f"⚠️ Inventory low: '{item.name}' has only {item.quantity} left.",
+            dedupe_on=f"inventory-low:{item.pk}"
         )
-        if existing.exists():
-            return  # Skip duplicate
-
-        for manager in User.objects.filter(role='manager'):
-            Notification.objects.create(
-                user=manager,
-                message=f"⚠️ Inventory low: '{item.name}' has only {item.quantity} left."
-            )
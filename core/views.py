@@ -1,15 +1,21 @@
 # --- Django Built-in Imports ---
-from datetime import date, datetime
-from io import BytesIO
+import hmac
+import json
+import logging
+from datetime import date, datetime, timedelta
 
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.core.mail import EmailMessage, send_mail
-from django.db.models import Count, F, Q, Sum
-from django.http import HttpResponse, HttpResponseForbidden
+from django.db import transaction
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, F, Max, Q, Sum
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.template.loader import render_to_string
+from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.utils.timezone import now
@@ -27,6 +33,7 @@ from .forms import (
     InventoryUsageForm,
     MaintenanceForm,
     ReceptionistBookingForm,
+    RoomForm,
     StaffAttendanceForm,
     StaffSalaryForm,
     WalkInBookingForm
@@ -45,11 +52,19 @@ from .models import (
     
 )
 
+from . import catalog, counters, events, jobs, metrics, payments, profiling, reservations
+from .pagination import paginate
+from .invoices import InvoiceRenderBusy, InvoiceRenderError, invoice_pdf_response
 from .utils import (
     calculate_bill,
-    is_room_available
+    find_flexible_stays,
+    notify_roles,
+    pick_room_of_type,
+    room_type_availability,
+    rooms_available_between
 )
 User = get_user_model()
+logger = logging.getLogger(__name__)
 # ==============================
 #  User Authentication Views
 # ==============================
@@ -138,7 +153,7 @@ def redirect_by_role(request):
 @login_required(login_url='login')
 def room_list(request):
    
-    rooms = Room.objects.all()
+    rooms = catalog.get().rooms
     return render(request, 'core/room_list.html', {'rooms': rooms})
 
 
@@ -175,50 +190,74 @@ def room_delete(request, pk):
 
 
 @login_required
+@metrics.AVAILABILITY_SEARCH_SECONDS.time()
 def available_rooms(request):
     check_in = request.GET.get('check_in')
     check_out = request.GET.get('check_out')
+    nights = request.GET.get('nights')  # Flexible search: check_in/check_out become the search window
 
     search_performed = False  
-    rooms = Room.objects.all()
+    status = 200
+    rooms_catalog = catalog.get()
+    rooms = rooms_catalog.rooms
+    room_types = []
 
     if check_in and check_out:
         search_performed = True  
         try:
             check_in_date = datetime.strptime(check_in, '%Y-%m-%d').date()
             check_out_date = datetime.strptime(check_out, '%Y-%m-%d').date()
-
-            if check_in_date >= check_out_date:
-                messages.error(request, "❌ Check-out must be after check-in.")
-                rooms = Room.objects.none()
-            elif check_in_date < date.today():
-                messages.error(request, "❌ Check-in date cannot be in the past.")
-                rooms = Room.objects.none()
-            else:
-                booked_rooms = Booking.objects.filter(
-                    check_in__lt=check_out_date,
-                    check_out__gt=check_in_date,
-                    status__in=['Pending', 'Checked In']
-                ).values_list('room_id', flat=True)
-
-                maintenance_rooms = Maintenance.objects.filter(
-                    scheduled_date__gte=date.today(),
-                    is_completed=False
-                ).values_list('room_id', flat=True)
-
-                rooms = rooms.exclude(id__in=booked_rooms).exclude(id__in=maintenance_rooms)
-
         except ValueError:
             messages.error(request, "❌ Invalid date format. Please use YYYY-MM-DD.")
-            rooms = Room.objects.none()
+            check_in_date = check_out_date = None
+            rooms = []
+        try:
+            nights = int(nights) if nights else None
+        except ValueError:
+            messages.error(request, "❌ Number of nights must be a whole number.")
+            check_in_date = check_out_date = None
+            rooms = []
+
+        if check_in_date is None:
+            status = 400
+        elif check_in_date >= check_out_date:
+            messages.error(request, "❌ Check-out must be after check-in.")
+            rooms = []
+        elif check_in_date < date.today():
+            messages.error(request, "❌ Check-in date cannot be in the past.")
+            rooms = []
+        elif (check_out_date - check_in_date).days > settings.SEARCH_MAX_WINDOW_DAYS:
+            messages.error(request, f"❌ Please search at most {settings.SEARCH_MAX_WINDOW_DAYS} days at a time.")
+            rooms, status = [], 400
+        elif nights is not None and not 1 <= nights <= settings.SEARCH_MAX_NIGHTS:
+            messages.error(request, f"❌ Number of nights must be between 1 and {settings.SEARCH_MAX_NIGHTS}.")
+            rooms, status = [], 400
+        elif nights:
+            rooms = []
+            stays = find_flexible_stays(nights, check_in_date, check_out_date, Room.objects.only('id'))
+            for room, stay_start in stays:
+                # Annotate a copy: catalog rooms are shared between requests
+                room = rooms_catalog.annotated(
+                    room.id, stay_check_in=stay_start, stay_check_out=stay_start + timedelta(days=nights)
+                )
+                if room is not None:
+                    rooms.append(room)
+        else:
+            # Availability from the database, everything else from the catalog
+            rooms = rooms_catalog.rooms_in(
+                rooms_available_between(check_in_date, check_out_date).values_list('id', flat=True)
+            )
+            room_types = room_type_availability(rooms)
 
     context = {
         'rooms': rooms,
+        'room_types': room_types,
         'check_in': check_in,
         'check_out': check_out,
+        'nights': nights,
         'search_performed': search_performed  #  Pass it to template
     }
-    return render(request, 'core/available_rooms.html', context)
+    return render(request, 'core/available_rooms.html', context, status=status)
 
 
 # ===========================
@@ -246,11 +285,13 @@ def booking_list(request):
     if status:
         bookings = bookings.filter(status=status)
 
-    rooms = Room.objects.all()
+    page = paginate(request, bookings.select_related('room', 'user'))
+    rooms = catalog.get().rooms
     status_choices = ['Pending', 'Checked In', 'Checked Out', 'Canceled', 'No-Show']
 
     return render(request, 'core/booking_list.html', {
-        'bookings': bookings,
+        'bookings': page,
+        'page': page,
         'rooms': rooms,
         'selected_room': room_id,
         'selected_status': status,
@@ -264,38 +305,22 @@ def booking_create(request, room_id=None):
     if request.method == 'POST':
         form = BookingForm(request.POST, request.FILES, request=request)
         if form.is_valid():
-            room = form.cleaned_data['room']
-            check_in = form.cleaned_data['check_in']
-            check_out = form.cleaned_data['check_out']
-
-            if not is_room_available(room, check_in, check_out):
-                messages.error(request, "Room is already booked for the selected dates.")
-                return redirect('book_room', room_id=room.id)
-
-            
-            num_days = (check_out - check_in).days or 1
-            room_price = room.price_per_night * num_days
-            
-            amenities = form.cleaned_data.get('amenities', [])
-            spa_services = form.cleaned_data.get('spa_services', [])
-            amenity_price = sum(a.price for a in amenities)
-            spa_price = sum(s.price for s in spa_services)
-            total_price = room_price + amenity_price + spa_price
-
-            
             booking = form.save(commit=False)
             booking.user = request.user
-            booking.total = total_price
-            booking.subtotal = total_price
-            booking.save()
-            form.save_m2m()
+            try:
+                reservations.reserve(booking, save_m2m=form.save_m2m, hold=True)
+            except reservations.RoomUnavailable:
+                messages.error(request, "Room is already booked for the selected dates.")
+                return redirect('book_room', room_id=booking.room_id)
+            metrics.BOOKINGS_CREATED.inc(channel='guest')
 
-            
+            #  Price the stay once; later pages serve this snapshot
+            bill = calculate_bill(booking)
             request.session['payment_breakdown'] = {
-                'room_price': float(room_price),
-                'amenity_price': float(amenity_price),
-                'spa_price': float(spa_price),
-                'total_price': float(total_price),
+                'room_price': float(bill['room_price']),
+                'amenity_price': float(bill['amenity_price']),
+                'spa_price': float(bill['spa_price']),
+                'total_price': float(bill['total']),
                 'booking_id': booking.id
             }
 
@@ -312,6 +337,37 @@ def booking_create(request, room_id=None):
     return render(request, 'core/guest_booking_create.html', {'form': form})
 
 
+@login_required(login_url='login')
+def book_room_type(request, room_type):
+    """
+    Book by room type: assign the cheapest room of that type that is free
+    for the requested dates and continue with the regular booking form.
+    """
+    labels = dict(Room.ROOM_TYPES)
+    if room_type not in labels:
+        messages.error(request, "❌ Unknown room type.")
+        return redirect('available_rooms')
+
+    try:
+        check_in = parse_date(request.GET.get('check_in') or '')
+        check_out = parse_date(request.GET.get('check_out') or '')
+    except ValueError:
+        check_in = check_out = None
+
+    if not check_in or not check_out or check_out <= check_in:
+        messages.error(request, "❌ Please choose valid check-in and check-out dates.")
+        return redirect('available_rooms')
+
+    room = pick_room_of_type(room_type, check_in, check_out)
+    if room is None:
+        messages.error(request, f"❌ No {labels[room_type]} rooms are free for the selected dates.")
+        return redirect('available_rooms')
+
+    return redirect(
+        f"{reverse('book_room', args=[room.id])}?check_in={check_in.isoformat()}&check_out={check_out.isoformat()}"
+    )
+
+
 @login_required
 @require_POST
 def booking_check_in(request, booking_id):
@@ -337,6 +393,7 @@ def booking_check_in(request, booking_id):
         booking.status = 'Checked In'
         booking.room.is_available = False
         booking.save()
+        booking.room.save(update_fields=['is_available'])
         messages.success(request, f"Checked in successfully for Room {booking.room.room_number}.")
 
     
@@ -359,7 +416,7 @@ def booking_check_out(request, booking_id):
         booking.needs_cleaning = True
         booking.room.is_available = True
         booking.save()
-        booking.room.save()
+        booking.room.save(update_fields=['is_available'])
 
         messages.success(request, f"✅ Booking for Room {booking.room.room_number} has been checked out.")
     else:
@@ -392,7 +449,38 @@ def cancel_booking(request, booking_id):
 
 @login_required
 def admin_dashboard(request):
-    return render(request, 'core/dashboard_admin.html')
+    return render(request, 'core/dashboard_admin.html', {'catalog_stats': catalog.stats()})
+
+
+@login_required
+@user_passes_test(profiling.is_admin)
+def request_profiles(request):
+    """Recent request profiles held in this process (see core.profiling)."""
+    return render(request, 'core/request_profiles.html', {
+        'profiles': profiling.recent(),
+        'enabled': settings.REQUEST_PROFILING,
+    })
+
+
+@login_required
+@user_passes_test(profiling.is_admin)
+def request_profile(request, profile_id):
+    profile = profiling.get(profile_id)
+    if profile is None:
+        messages.error(request, "That profile has left the buffer (or was recorded by another process).")
+        return redirect('request_profiles')
+    return render(request, 'core/request_profile.html', {'profile': profile})
+
+
+def metrics_endpoint(request):
+    """Prometheus scrape target; see core.metrics."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+    ):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 def is_manager(user):
@@ -452,7 +540,7 @@ def housekeeping_dashboard(request):
     tasks = Booking.objects.filter(
         status='Checked Out',
         cleaned_by__isnull=True,
-    ).order_by('-check_out')
+    ).select_related('room', 'user').order_by('-check_out')
 
     return render(request, 'core/dashboard_housekeeping.html', {
         'tasks': tasks,
@@ -463,7 +551,9 @@ def housekeeping_dashboard(request):
 def guest_dashboard(request):
     check_in = request.GET.get('check_in')
     check_out = request.GET.get('check_out')
-    rooms = Room.objects.all()  
+    rooms_catalog = catalog.get()
+    rooms = rooms_catalog.rooms
+    room_types = []
     search_performed = False
 
     if check_in and check_out:
@@ -480,18 +570,10 @@ def guest_dashboard(request):
                 rooms = []
             else:
                 # Exclude already booked or maintenance rooms
-                booked = Booking.objects.filter(
-                    check_in__lt=check_out_date,
-                    check_out__gt=check_in_date,
-                    status__in=['Pending', 'Checked In']
-                ).values_list('room_id', flat=True)
-
-                maintenance = Maintenance.objects.filter(
-                    scheduled_date__gte=date.today(),
-                    is_completed=False
-                ).values_list('room_id', flat=True)
-
-                rooms = rooms.exclude(id__in=booked).exclude(id__in=maintenance)
+                rooms = rooms_catalog.rooms_in(
+                    rooms_available_between(check_in_date, check_out_date).values_list('id', flat=True)
+                )
+                room_types = room_type_availability(rooms)
 
         except ValueError:
             messages.error(request, "❌ Invalid date format. Please use YYYY-MM-DD.")
@@ -499,6 +581,7 @@ def guest_dashboard(request):
 
     context = {
         'rooms': rooms,
+        'room_types': room_types,
         'check_in': check_in,
         'check_out': check_out,
         'search_performed': search_performed
@@ -519,19 +602,17 @@ def guest_booking_create(request):
     if request.method == 'POST':
         form = BookingForm(request.POST, request.FILES)
         if form.is_valid():
-            room = form.cleaned_data['room']
-            check_in = form.cleaned_data['check_in']
-            check_out = form.cleaned_data['check_out']
+            booking = form.save(commit=False)
+            booking.user = request.user
 
-            # Check for date conflict
-            if not is_room_available(room, check_in, check_out):
+            # Claim the room, or report the date conflict
+            try:
+                reservations.reserve(booking, save_m2m=form.save_m2m, hold=True)
+            except reservations.RoomUnavailable:
                 messages.error(request, "Room is already booked for the selected dates.")
                 return redirect('guest_booking_create')
-
-            booking = form.save(commit=False)
-            booking.user = request.user
-            booking.save()
-            form.save_m2m()
+            metrics.BOOKINGS_CREATED.inc(channel='guest')
+            calculate_bill(booking)
 
             #  Create Notification for Guest
             Notification.objects.create(
@@ -539,11 +620,11 @@ def guest_booking_create(request):
                 message=f"✅ Your booking for Room {booking.room.room_number} is confirmed from {booking.check_in}."
             )
 
-            for staff in User.objects.filter(role='receptionist'):
-                Notification.objects.create(
-                    user=staff,
-                    message=f"📅 New booking for Room {booking.room.room_number} by {booking.user.username}."
-                )
+            notify_roles(
+                ['receptionist'],
+                f"📅 New booking for Room {booking.room.room_number} by {booking.user.username}.",
+                dedupe=False
+            )
 
             messages.success(request, "Booking successful.")
             return redirect('razorpay_payment', booking_id=booking.id)
@@ -557,7 +638,12 @@ def guest_booking_list(request):
     if request.user.role != 'guest':
         return redirect('login')
 
-    bookings = Booking.objects.filter(user=request.user).prefetch_related('feedback_set').order_by('-created_at')
+    bookings = (
+        Booking.objects.filter(user=request.user)
+        .select_related('room')
+        .prefetch_related('feedback_set', 'room__images', 'room__amenities')
+        .order_by('-created_at')
+    )
     return render(request, 'core/guest_booking_list.html', {'bookings': bookings})
 
 
@@ -583,22 +669,28 @@ def walkin_booking(request):
         booking_form = WalkInBookingForm(request.POST)
 
         if user_form.is_valid() and profile_form.is_valid() and booking_form.is_valid():
-            user = user_form.save(commit=False)
-            password = User.objects.make_random_password()
-            user.set_password(password)
-            user.save()
-
-            profile = profile_form.save(commit=False)
-            profile.user = user
-            profile.save()
-
-            booking = booking_form.save(commit=False)
-            booking.user = user
-            booking.is_paid = True  
-            booking.save()
-
-            messages.success(request, f"✅ Booking created for {user.username}.")
-            return redirect('booking_list')
+            try:
+                # Guest account and booking succeed or fail together
+                with transaction.atomic():
+                    user = user_form.save(commit=False)
+                    password = User.objects.make_random_password()
+                    user.set_password(password)
+                    user.save()
+
+                    profile = profile_form.save(commit=False)
+                    profile.user = user
+                    profile.save()
+
+                    booking = booking_form.save(commit=False)
+                    booking.user = user
+                    booking.is_paid = True  
+                    reservations.reserve(booking)
+            except reservations.RoomUnavailable:
+                messages.error(request, "❌ Room is already booked for the selected dates.")
+            else:
+                metrics.BOOKINGS_CREATED.inc(channel='walkin')
+                messages.success(request, f"✅ Booking created for {user.username}.")
+                return redirect('booking_list')
     else:
         user_form = GuestUserForm()
         profile_form = GuestProfileForm()
@@ -618,20 +710,15 @@ def receptionist_booking_create(request):
     if request.method == 'POST':
         form = ReceptionistBookingForm(request.POST)
         if form.is_valid():
-            room = form.cleaned_data['room']
-            check_in = form.cleaned_data['check_in']
-            check_out = form.cleaned_data['check_out']
-
-            #  Check room availability
-            if not is_room_available(room, check_in, check_out):
-                messages.error(request, "❌ Room is already booked for the selected dates.")
-                return redirect('receptionist_booking_create')
-
-            #  Save booking
+            #  Save booking and claim the room
             booking = form.save(commit=False)
             booking.created_at = now()
-            booking.save()
-            form.save_m2m()
+            try:
+                reservations.reserve(booking, save_m2m=form.save_m2m)
+            except reservations.RoomUnavailable:
+                messages.error(request, "❌ Room is already booked for the selected dates.")
+                return redirect('receptionist_booking_create')
+            metrics.BOOKINGS_CREATED.inc(channel='receptionist')
 
             messages.success(request, "✅ Walk-in booking created successfully.")
             return redirect('receptionist_bookings')
@@ -644,9 +731,10 @@ def receptionist_booking_create(request):
 @login_required
 @user_passes_test(is_receptionist)
 def receptionist_booking_list(request):
-    bookings = Booking.objects.all().order_by('-created_at')
+    page = paginate(request, Booking.objects.select_related('room', 'user'))
     return render(request, 'core/receptionist_booking_list.html', {
-        'bookings': bookings,
+        'bookings': page,
+        'page': page,
         'today': date.today(),  
     })
 
@@ -666,13 +754,15 @@ def payment_list(request):
         messages.error(request, "You don't have permission to view this page.")
         return redirect('dashboard')
 
-    bookings = Booking.objects.select_related('user', 'room').all().order_by('-created_at')
+    bookings = Booking.objects.select_related('user', 'room')
 
-    total_paid = bookings.filter(is_paid=True).aggregate(total=Sum('total'))['total'] or 0
-    total_unpaid = bookings.filter(is_paid=False).aggregate(total=Sum('total'))['total'] or 0
+    total_paid = Booking.objects.filter(is_paid=True).aggregate(total=Sum('total'))['total'] or 0
+    total_unpaid = Booking.objects.filter(is_paid=False).aggregate(total=Sum('total'))['total'] or 0
 
+    page = paginate(request, bookings)
     return render(request, 'core/payment_list.html', {
-        'bookings': bookings,
+        'bookings': page,
+        'page': page,
         'total_paid': total_paid,
         'total_unpaid': total_unpaid,
     })
@@ -702,17 +792,17 @@ def cleaned_rooms_history(request):
 
     if request.user.role == 'housekeeping':
         # Housekeeper sees rooms that are Checked Out and not yet cleaned OR already cleaned by them
-        cleaned_tasks = Booking.objects.filter(
-            status='Checked Out'
-        ).order_by('-check_out')
+        cleaned_tasks = Booking.objects.filter(status='Checked Out')
+        ordering = ('-check_out', '-id')
     else:
         # Admin sees all cleaned rooms (with cleaned_by not null)
-        cleaned_tasks = Booking.objects.filter(
-            cleaned_by__isnull=False
-        ).order_by('-cleaned_at')
+        cleaned_tasks = Booking.objects.filter(cleaned_by__isnull=False)
+        ordering = ('-cleaned_at', '-id')
 
+    page = paginate(request, cleaned_tasks.select_related('room', 'user', 'cleaned_by'), ordering)
     return render(request, 'core/cleaned_rooms_history.html', {
-        'cleaned_tasks': cleaned_tasks
+        'cleaned_tasks': page,
+        'page': page,
     })
     
     
@@ -741,12 +831,11 @@ def maintenance_create(request):
             maintenance = form.save()
 
             
-            housekeepers = User.objects.filter(role='housekeeping')
-            for staff in housekeepers:
-                Notification.objects.create(
-                    user=staff,
-                    message=f"🛠 New maintenance task assigned: Room {maintenance.room.room_number}."
-                )
+            notify_roles(
+                ['housekeeping'],
+                f"🛠 New maintenance task assigned: Room {maintenance.room.room_number}.",
+                dedupe=False
+            )
 
             messages.success(request, "Maintenance request added and housekeeping notified.")
             return redirect('maintenance_list')
@@ -761,10 +850,11 @@ def maintenance_list(request):
         messages.error(request, "Access denied.")
         return redirect('dashboard')
 
-    tasks = Maintenance.objects.all().order_by('-scheduled_date')
+    page = paginate(request, Maintenance.objects.select_related('room'), ('-scheduled_date', '-id'))
     can_complete = request.user.role in ['admin', 'manager', 'housekeeping']
     return render(request, 'core/maintenance_list.html', {
-        'tasks': tasks,
+        'tasks': page,
+        'page': page,
         'can_complete': can_complete
     })
 
@@ -857,7 +947,16 @@ def booking_payment_view(request, booking_id):
         payment_method = request.POST.get('payment_method')
         booking.payment_method = payment_method
         booking.is_paid = True  # Set only if cash
-        booking.save()
+        try:
+            reservations.confirm(booking)
+        except reservations.BookingCanceled:
+            messages.error(request, "❌ This booking was canceled and can't be paid. Please book again.")
+            return redirect('guest_bookings')
+        except reservations.RoomUnavailable:
+            booking.status = 'Canceled'
+            booking.save()
+            messages.error(request, "❌ Your hold expired and the room has been taken. Please contact reception for a refund.")
+            return redirect('guest_bookings')
         messages.success(request, "Payment recorded successfully.")
         return redirect('guest_booking_list')
 
@@ -870,58 +969,55 @@ def booking_payment_view(request, booking_id):
 import razorpay
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
 
 @login_required
 def initiate_razorpay_payment(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
 
+    if booking.status == 'Canceled':
+        messages.error(request, "❌ This booking is no longer held. Please book again.")
+        return redirect('guest_bookings')
+
     #  Calculate the full bill
     bill = calculate_bill(booking)
 
     #  Convert total to paisa (round to avoid float issues)
     amount_in_paisa = int(round(float(bill['total']) * 100))
 
-    #  Create Razorpay Order
-    payment = client.order.create({
-        "amount": amount_in_paisa,  # paisa (₹ x 100)
-        "currency": "INR",
-        "receipt": f"booking_rcpt_{booking.id}",
-        "payment_capture": 1
-    })
-    print(" Created Razorpay Order:", payment)
-
-    #  Save Razorpay order ID
-    booking.payment_id = payment['id']
-    booking.save()
+    #  Reuse the open Razorpay order, or create one if the amount changed
+    try:
+        order_id = payments.get_or_create_order(booking, amount_in_paisa)
+    except payments.GatewayUnavailable:
+        messages.error(request, "❌ The payment gateway is not responding. Please try again in a minute.")
+        return redirect('guest_bookings')
 
     return render(request, 'core/razorpay_payment.html', {
         'booking': booking,
         'razorpay_key': settings.RAZORPAY_KEY_ID,
-        'razorpay_order_id': payment['id'],
+        'razorpay_order_id': order_id,
         'amount': amount_in_paisa,  #  Int only, no float/decimal
         'user': request.user,
         'breakdown': bill,
+        'hold_expires_at': booking.hold_expires_at,
     })
   
 key_id = settings.RAZORPAY_KEY_ID
 key_secret = settings.RAZORPAY_KEY_SECRET
 
 @csrf_exempt
+@metrics.PAYMENT_VERIFICATION_SECONDS.time()
 def payment_success(request):
     if request.method == "POST":
         payment_id = request.POST.get('razorpay_payment_id')
         order_id = request.POST.get('razorpay_order_id')
         signature = request.POST.get('razorpay_signature')
+        if not (payment_id and order_id and signature):
+            metrics.PAYMENT_VERIFICATIONS.inc(outcome='invalid_request')
+            return HttpResponseBadRequest("Invalid request")
 
         try:
             #  Step 1: Verify signature
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-            client.utility.verify_payment_signature({
-                'razorpay_order_id': order_id,
-                'razorpay_payment_id': payment_id,
-                'razorpay_signature': signature
-            })
+            payments.verify_payment_signature(order_id, payment_id, signature)
 
             #  Step 2: Update booking
             booking = Booking.objects.get(payment_id=order_id)
@@ -929,62 +1025,39 @@ def payment_success(request):
             booking.paid_at = timezone.now()
             booking.razorpay_payment_id = payment_id
             booking.payment_time = timezone.now()
-            booking.save()
-            # ✅ Notify Receptionist(s)
-            User = get_user_model()
-            message = f"💰 Payment received for Booking #{booking.id} (Room {booking.room.room_number}) by {booking.user.username}."
-
-            if not Notification.objects.filter(message=message, is_read=False).exists():
-                for receptionist in User.objects.filter(role='receptionist'):
-                    Notification.objects.create(
-                        user=receptionist,
-                        message=message
-                    )
-
-            #  Step 3: Generate bill breakdown
-            bill = calculate_bill(booking)
-
-            #  Step 4: Render PDF invoice
-            html = render_to_string("core/invoice_pdf.html", {
-                "booking": booking,
-                "breakdown": bill,
-            })
-
-            pdf_file = BytesIO()
-            pisa.CreatePDF(BytesIO(html.encode("UTF-8")), dest=pdf_file)
-
-            #  Step 5: Send confirmation email with PDF
-            subject = f"🎉 Booking Confirmed - Room {booking.room.room_number} | Royal Crest"
-            to_email = booking.user.email
-
-            email_body = render_to_string("core/booking_email.html", {
-                "booking": booking,
-                "user": booking.user,
-                "total": bill['total'],
-                "breakdown": bill,
-            })
-
-            email = EmailMessage(
-                subject=subject,
-                body=email_body,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                to=[to_email],
-            )
-            email.attach(f"invoice_booking_{booking.id}.pdf", pdf_file.getvalue(), "application/pdf")
-            email.content_subtype = "html"
-            email.send()
-
-            messages.success(request, "✅ Payment successful and invoice sent to your email.")
+            try:
+                reservations.confirm(booking)
+            except reservations.BookingCanceled:
+                # Keep only the payment reference, for the refund; the booking stays canceled and unpaid
+                Booking.objects.filter(pk=booking.pk).update(razorpay_payment_id=payment_id)
+                metrics.PAYMENT_VERIFICATIONS.inc(outcome='booking_canceled')
+                messages.error(request, "❌ Payment received for a canceled booking. Reception will arrange a refund.")
+                return redirect('guest_bookings')
+            except reservations.RoomUnavailable:
+                booking.status = 'Canceled'
+                booking.save()
+                metrics.PAYMENT_VERIFICATIONS.inc(outcome='hold_expired')
+                messages.error(request, "❌ Payment received after your hold expired and the room has been taken. Reception will arrange a refund.")
+                return redirect('guest_bookings')
+            #  Step 3: Notify reception and email the invoice in the background
+            jobs.enqueue('notify_payment_received', booking_id=booking.id)
+            jobs.enqueue('send_booking_confirmation', booking_id=booking.id)
+            metrics.PAYMENT_VERIFICATIONS.inc(outcome='success')
+
+            messages.success(request, "✅ Payment successful. Your invoice will arrive by email shortly.")
             return redirect('invoice_view', booking_id=booking.id)
 
         except Booking.DoesNotExist:
+            metrics.PAYMENT_VERIFICATIONS.inc(outcome='unknown_order')
             messages.error(request, "❌ Booking not found.")
             return redirect('booking_list')
 
         except razorpay.errors.SignatureVerificationError as e:
-            print("❌ Razorpay Signature Verification Failed:", e)
+            metrics.PAYMENT_VERIFICATIONS.inc(outcome='bad_signature')
+            logger.warning("Razorpay signature verification failed for order %s: %s", order_id, e)
             return HttpResponseBadRequest("Payment verification failed")
 
+    metrics.PAYMENT_VERIFICATIONS.inc(outcome='invalid_request')
     return HttpResponseBadRequest("Invalid request")
 
 
@@ -998,27 +1071,19 @@ def invoice_view(request, booking_id):
         'breakdown': breakdown
     })
 
-from xhtml2pdf import pisa
-from django.template.loader import get_template
 @login_required
 def download_invoice_pdf(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id, user=request.user)
     breakdown = calculate_bill(booking)
 
-    template_path = 'core/invoice_pdf.html'
-    context = {'booking': booking, 'breakdown': breakdown}
-
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Invoice_{booking.id}.pdf"'
-
-    template = get_template(template_path)
-    html = template.render(context)
-
-    pisa_status = pisa.CreatePDF(html, dest=response)
-
-    if pisa_status.err:
+    try:
+        return invoice_pdf_response(request, booking, breakdown)
+    except InvoiceRenderBusy:
+        response = HttpResponse('Invoice rendering is busy, please retry shortly.', status=503)
+        response['Retry-After'] = '5'
+        return response
+    except InvoiceRenderError:
         return HttpResponse('PDF generation error', status=500)
-    return response
 
 #---------------------------------------------
 #----feedback------
@@ -1029,9 +1094,10 @@ def feedback_list(request):
     if request.user.role not in ['admin', 'manager']:
         return redirect('login')
 
-    feedbacks = Feedback.objects.select_related('user', 'booking__room').order_by('-submitted_at')
+    feedbacks = Feedback.objects.select_related('user', 'booking__room')
+    page = paginate(request, feedbacks, ('-submitted_at', '-id'))
     Feedback.objects.filter(is_read=False).update(is_read=True)
-    return render(request, 'core/feedback_list.html', {'feedbacks': feedbacks})
+    return render(request, 'core/feedback_list.html', {'feedbacks': page, 'page': page})
 
 @login_required
 def submit_feedback(request, booking_id):
@@ -1094,16 +1160,18 @@ def mark_attendance(request):
 
 @manager_required
 def salary_report(request):
-    salaries = StaffSalary.objects.all()
+    # Days present counted in the same query, not once per staff member
+    salaries = StaffSalary.objects.select_related('user').annotate(
+        days_present=Count('user__staffattendance', filter=Q(user__staffattendance__present=True))
+    )
     staff_data = []
 
     for salary in salaries:
-        days_present = StaffAttendance.objects.filter(user=salary.user, present=True).count()
-        total_salary = days_present * salary.daily_rate
+        total_salary = salary.days_present * salary.daily_rate
         staff_data.append({
             'user': salary.user,
             'daily_rate': salary.daily_rate,
-            'days_present': days_present,
+            'days_present': salary.days_present,
             'total_salary': total_salary
         })
 
@@ -1131,26 +1199,111 @@ def staff_mark_own_attendance(request):
 
 @manager_required
 def attendance_list(request):
-    attendance_records = StaffAttendance.objects.select_related('user').order_by('-date')
-    return render(request, 'core/salary/attendance_list.html', {'attendance_records': attendance_records})
+    page = paginate(request, StaffAttendance.objects.select_related('user'), ('-date', '-id'))
+    return render(request, 'core/salary/attendance_list.html', {'attendance_records': page, 'page': page})
 
 
 @login_required
 def all_notifications_view(request):
-    #  Fetch all notifications, newest first
-    notifications = request.user.notification_set.order_by('-created_at')
+    #  Fetch notifications newest first, one page at a time
+    page = paginate(request, request.user.notification_set.all())
     Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    counters.notifications_read(request.user.pk)
 
     return render(request, 'notifications/all.html', {
-        'notifications': notifications
+        'notifications': page,
+        'page': page,
     })
 
 @login_required
 @require_POST
 def mark_notifications_read(request):
     Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    counters.notifications_read(request.user.pk)
     return JsonResponse({'status': 'success'})
 
+
+# --- 🔔 Live Notifications (Server-Sent Events) ---
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def _unread_event(user_id):
+    count = await sync_to_async(counters.unread_notifications)(user_id)
+    return _sse('unread', {'count': count})
+
+
+async def _new_notifications(user_id, after_id):
+    """SSE messages for the user's notifications newer than `after_id`, plus the new high-water mark."""
+    chunks = []
+    async for notification in Notification.objects.filter(user_id=user_id, pk__gt=after_id).order_by('pk')[:50]:
+        chunks.append(_sse('notification', {
+            'id': notification.pk,
+            'message': notification.message,
+            'created_at': notification.created_at.isoformat(),
+        }, event_id=notification.pk))
+        after_id = notification.pk
+    return chunks, after_id
+
+
+async def notification_stream(request):
+    """
+    Push new notifications and the unread count to the navbar.
+
+    Under ASGI the response stays open: the coroutine sleeps on a core.events
+    subscription (no thread per connection) and checks the database when
+    woken or every NOTIFICATION_STREAM_POLL seconds. Under WSGI it answers
+    with whatever is new and lets EventSource reconnect later, so a worker
+    thread is never parked on an idle browser tab.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=204)  # 204 tells EventSource to stop reconnecting
+
+    last_id = request.headers.get('Last-Event-ID', '')
+    if last_id.isdigit():
+        last_id = int(last_id)
+    else:
+        # Fresh page load: the count in the badge already covers older rows
+        latest = await Notification.objects.filter(user_id=user.pk).aaggregate(latest=Max('pk'))
+        last_id = latest['latest'] or 0
+
+    retry = f"retry: {settings.NOTIFICATION_STREAM_RETRY * 1000}\n\n"
+
+    if not isinstance(request, ASGIRequest):
+        new, last_id = await _new_notifications(user.pk, last_id)
+        body = retry + "".join(new) + await _unread_event(user.pk)
+        response = HttpResponse(body, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+    async def stream(subscription, last_id):
+        try:
+            yield retry
+            yield await _unread_event(user.pk)
+            while True:
+                woken = await subscription.wait(settings.NOTIFICATION_STREAM_POLL)
+                new, last_id = await _new_notifications(user.pk, last_id)
+                if new:
+                    for message in new:
+                        yield message
+                    yield await _unread_event(user.pk)
+                elif not woken:
+                    yield ": keep-alive\n\n"  # Also how a vanished client gets noticed
+        finally:
+            events.unsubscribe(subscription)
+
+    # Subscribe before the first read so nothing published in between is lost
+    response = StreamingHttpResponse(stream(events.subscribe(user.pk), last_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+
 def about_us(request):
     return render(request, 'core/about_us.html')
 
@@ -1171,9 +1324,10 @@ def contact_us_view(request):
 @login_required
 def contact_messages_list(request):
     if request.user.role in ['receptionist', 'manager']:
-        messages = ContactMessage.objects.order_by('-submitted_at')
+        page = paginate(request, ContactMessage.objects.all(), ('-submitted_at', '-id'))
         ContactMessage.objects.filter(is_read=False).update(is_read=True)
-        return render(request, 'core/contact_messages_list.html', {'messages': messages})
+        counters.contact_messages_read()
+        return render(request, 'core/contact_messages_list.html', {'messages': page, 'page': page})
     else:
         return redirect('guest_dashboard') 
      
@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hotel_mgmt.settings')
+# Persistent connections don't suit ASGI's thread handling; pool with PgBouncer instead
+os.environ.setdefault('DB_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+# Notification streams idle for hours; keep them from holding a thread each
+from django.urls import reverse  # noqa: E402
+from core.events import share_stream_thread  # noqa: E402
+
+application = share_stream_thread(application, reverse('notification_stream'))